@@ -0,0 +1,112 @@
+# OrderMaster/analytics_queries.py
+"""
+Item-level aggregations over the order_lines table (normalized from
+`orders.items` when each order is written; see order_lines.py), done in
+Postgres instead of json.loads loops in Python.
+
+Every function takes a DB-API cursor, so the Django views pass
+`django.db.connection.cursor()` and scripts/analytics_views.py passes a cursor
+from its own psycopg connection. Filters are built with orders_where() and
+shared by all queries.
+"""
+from collections import namedtuple
+
+OrderWhere = namedtuple('OrderWhere', ['sql', 'params'])
+
+# The (order_id, position) unique index drives the join from the orders matched by WHERE
+_LINES_FROM = """
+    FROM orders o
+    JOIN order_lines l ON l.order_id = o.id
+"""
+
+
+def _quantity(missing):
+    # Missing or non-integer quantities (stored as NULL) count as `missing`
+    return f"COALESCE(l.quantity, {int(missing)})"
+
+
+def orders_where(start=None, end=None, order_status=None, completed_sales=False, payment_method=None):
+    """
+    Builds the WHERE clause for an orders query: created_at in [start, end),
+    an exact order_status, the analytics definition of a completed sale
+    (see sales_rollup.COMPLETED_SALE_Q) and a case-insensitive payment method.
+    """
+    clauses, params = ['TRUE'], []
+    if start is not None:
+        clauses.append('o.created_at >= %s')
+        params.append(start)
+    if end is not None:
+        clauses.append('o.created_at < %s')
+        params.append(end)
+    if order_status is not None:
+        clauses.append('o.order_status = %s')
+        params.append(order_status)
+    if completed_sales:
+        clauses.append("(o.order_placed_by = 'counter' OR (o.order_placed_by = 'customer' AND o.order_status = 'pickedup'))")
+    if payment_method is not None:
+        clauses.append('lower(o.payment_method) = lower(%s)')
+        params.append(payment_method)
+    return OrderWhere(' AND '.join(clauses), params)
+
+
+def item_totals(cursor, where, limit=None, measure='quantity', missing_quantity=0):
+    """
+    Returns [(item_name, total)] largest first. measure='quantity' sums
+    quantities; measure='lines' counts how many order lines name the item.
+    """
+    total = 'COUNT(*)' if measure == 'lines' else f'SUM({_quantity(missing_quantity)})'
+    sql = f"""
+        SELECT l.name, {total}::int AS total
+        {_LINES_FROM}
+        WHERE {where.sql}
+        GROUP BY 1
+        ORDER BY 2 DESC, 1
+    """
+    params = list(where.params)
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    cursor.execute(sql, params)
+    return [(name, total) for name, total in cursor.fetchall()]
+
+
+def daily_item_totals(cursor, where, missing_quantity=0):
+    """Returns [(day, item_name, quantity)] ordered by day, then quantity."""
+    cursor.execute(f"""
+        SELECT o.created_at::date AS day, l.name, SUM({_quantity(missing_quantity)})::int AS qty
+        {_LINES_FROM}
+        WHERE {where.sql}
+        GROUP BY 1, 2
+        ORDER BY 1, 3 DESC, 2
+    """, where.params)
+    return [(day, name, qty) for day, name, qty in cursor.fetchall()]
+
+
+def hourly_order_counts(cursor, where):
+    """Returns [(hour_of_day, orders)] for the hours that have orders."""
+    cursor.execute(f"""
+        SELECT EXTRACT(HOUR FROM o.created_at)::int AS hr, COUNT(*)::int AS c
+        FROM orders o
+        WHERE {where.sql}
+        GROUP BY 1
+        ORDER BY 1
+    """, where.params)
+    return [(hour, count) for hour, count in cursor.fetchall()]
+
+
+def daily_item_sales(cursor, where):
+    """
+    Returns [(day, item_name, payment_method, order_placed_by, quantity,
+    revenue)] in the shape of the daily_item_sales rollup. Lines without an
+    integer quantity or with a malformed price are skipped, as in
+    sales_rollup.apply_order.
+    """
+    cursor.execute(f"""
+        SELECT o.created_at::date, l.name, lower(o.payment_method), o.order_placed_by,
+               SUM(l.quantity)::int, SUM(l.quantity * l.unit_price)
+        {_LINES_FROM}
+        WHERE COALESCE(l.quantity, 0) <> 0 AND l.unit_price IS NOT NULL
+          AND {where.sql}
+        GROUP BY 1, 2, 3, 4
+    """, where.params)
+    return cursor.fetchall()
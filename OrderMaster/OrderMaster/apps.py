@@ -4,3 +4,7 @@ class OrdermasterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     # Correct the name to just the app's name
     name = 'OrderMaster'
+
+    def ready(self):
+        # Registers the MenuItem signal handlers that version the menu snapshot
+        from . import menu_cache  # noqa: F401
@@ -0,0 +1,22 @@
+# OrderMaster/cache_versions.py
+"""
+Change counters for cached data. Readers key their caches by the current
+version, writers bump it, so no worker ever has to delete another worker's
+cache entries.
+"""
+from django.db.models import F
+
+from .models import CacheVersion
+
+
+def get_version(key):
+    """Returns the current version for `key` (0 if it was never bumped)."""
+    return CacheVersion.objects.filter(key=key).values_list('version', flat=True).first() or 0
+
+
+def bump_version(key):
+    """Increments the version for `key` and returns it."""
+    if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(key=key)
+        CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
+    return get_version(key)
@@ -0,0 +1,154 @@
+# OrderMaster/chart_cache.py
+"""
+Rendered chart PNGs for scripts/analytics_views.py.
+
+Entries are keyed by (chart_type, range, start, end, data_version), where the
+data version is a fingerprint of the orders in the range (count, newest
+updated_at, highest id). Any order placed or changed in the range - from
+Django or the Flask app - yields a new version, so stale charts are never
+served; the entry they replace is dropped when the new one is stored.
+
+The in-memory cache is an LRU capped by total bytes. Setting CHART_CACHE_DIR
+adds a second, on-disk tier shared by the workers on one machine.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CHART_CACHE_MAX_BYTES = int(os.environ.get('CHART_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR') or None
+CHART_CACHE_DISK_MAX_BYTES = int(os.environ.get('CHART_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024))
+
+DATA_VERSION_SQL = """
+    SELECT COUNT(*)::int, MAX(updated_at), MAX(id)
+    FROM public.orders WHERE created_at >= %s AND created_at < %s
+"""
+
+
+def data_version(cursor, start, end):
+    """Fingerprint of the orders created in [start, end)."""
+    cursor.execute(DATA_VERSION_SQL, (start, end))
+    count, last_updated, last_id = cursor.fetchone()
+    return f"{count}-{last_updated.isoformat() if last_updated else ''}-{last_id or 0}"
+
+
+def cache_key(chart_type, range_name, start, end, version):
+    return (chart_type, range_name, start.isoformat(), end.isoformat(), version)
+
+
+def etag_for(key):
+    return '"%s"' % hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32]
+
+
+class ChartCache:
+    def __init__(self, max_bytes=CHART_CACHE_MAX_BYTES, directory=CHART_CACHE_DIR,
+                 disk_max_bytes=CHART_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> png bytes, least recently used first
+        self._latest = {}  # key without version -> key, to drop superseded versions
+        self._size = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.png')
+
+    def _remove(self, key):
+        png = self._entries.pop(key, None)
+        if png is not None:
+            self._size -= len(png)
+
+    def _store(self, key, png):
+        if len(png) > self.max_bytes:
+            return
+        previous = self._latest.get(key[:-1])
+        if previous is not None and previous != key:
+            self._remove(previous)
+        self._latest[key[:-1]] = key
+        self._remove(key)
+        self._entries[key] = png
+        self._size += len(png)
+        while self._size > self.max_bytes:
+            old_key, old_png = self._entries.popitem(last=False)
+            self._size -= len(old_png)
+            if self._latest.get(old_key[:-1]) == old_key:
+                del self._latest[old_key[:-1]]
+            self._stats['evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return png
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    png = f.read()
+            except OSError:
+                png = None
+            if png:
+                with self._lock:
+                    self._store(key, png)
+                    self._stats['disk_hits'] += 1
+                return png
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key, png):
+        with self._lock:
+            self._store(key, png)
+        if self.directory:
+            try:
+                self._write_file(key, png)
+            except OSError as e:
+                logger.warning(f"⚠️ Could not write chart cache file: {e}")
+
+    def _write_file(self, key, png):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        self._trim_directory()
+
+    def _trim_directory(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._size
+        stats['max_bytes'] = self.max_bytes
+        stats['disk'] = bool(self.directory)
+        return stats
@@ -0,0 +1,140 @@
+# OrderMaster/db_pool.py
+"""
+A small bounded connection pool for code that talks to Postgres outside the
+Django ORM (scripts/analytics_views.py).
+
+Connections are reused LIFO, checked with SELECT 1 when they have been idle
+for a while, and replaced once they pass max_lifetime so the Supabase pooler
+can rebalance. Callers wait up to `timeout` seconds for a free connection;
+wait times are recorded and reported by stats().
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size=5, max_lifetime=1800, health_check_after=30, timeout=10):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle = []  # (connection, created_at, returned_at), most recent last
+        self._created_at = {}
+        self._stats = {
+            'checkouts': 0, 'timeouts': 0, 'connects': 0, 'discarded': 0,
+            'wait_total_seconds': 0.0, 'wait_max_seconds': 0.0,
+        }
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats['connects'] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created_at.pop(id(conn), None)
+            self._stats['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - returned_at < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute('SELECT 1')
+                cur.fetchall()
+            finally:
+                cur.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Dropping pooled connection that failed its health check: {e}")
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, created_at, returned_at = self._idle.pop()
+            if self._is_healthy(conn, created_at, returned_at):
+                return conn
+            self._discard(conn)
+        return self._open()
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of the block. The transaction is
+        committed on success and rolled back on error, as with `with conn:`.
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f'No database connection free after {self.timeout}s (pool size {self.max_size})')
+        waited = time.monotonic() - started
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['wait_total_seconds'] += waited
+            self._stats['wait_max_seconds'] = max(self._stats['wait_max_seconds'], waited)
+        if waited > 1:
+            logger.warning(f"⚠️ Waited {waited:.2f}s for a pooled database connection")
+
+        conn = None
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        except Exception:
+            if conn is not None and conn.closed:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                with self._lock:
+                    created_at = self._created_at.get(id(conn), time.monotonic())
+                    self._idle.append((conn, created_at, time.monotonic()))
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """Pool size and checkout wait figures for monitoring."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['open'] = len(self._created_at)
+        stats['max_size'] = self.max_size
+        stats['wait_avg_seconds'] = stats['wait_total_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
@@ -0,0 +1,283 @@
+# OrderMaster/events.py
+"""
+In-process pub/sub for live order board updates.
+
+Views publish an event after an order is created or changes status; the
+order_events_stream view relays them to connected screens as Server-Sent
+Events. With the 'postgres' broker events travel through LISTEN/NOTIFY, so
+every web worker sees orders written by any other worker (or by the Flask
+app, which NOTIFYs on the same channel). The 'memory' broker only fans out
+within one process and is what the tests use.
+"""
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from django.conf import settings
+from django.db import connection, transaction
+
+from .order_service import ACTIVE_ORDER_STATUSES, serialize_active_order
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_CHANNEL = 'order_events'
+# NOTIFY payloads must stay under 8000 bytes; bigger events drop the order body
+# and clients fall back to get_pending_orders?since=<cursor>.
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Stream limits. Under ASGI a connection stays open for up to
+# MAX_STREAM_SECONDS with a heartbeat comment every HEARTBEAT_SECONDS; under
+# WSGI each request is a long poll that ends after the first batch of events or
+# LONG_POLL_SECONDS, and EventSource reconnects with Last-Event-ID.
+HEARTBEAT_SECONDS = 15
+MAX_STREAM_SECONDS = 300
+LONG_POLL_SECONDS = 25
+RECONNECT_MS = 1000
+
+
+def order_event(event_type, order):
+    """Builds the event published for `order` ('order_created' or 'order_updated')."""
+    return {
+        'type': event_type,
+        'id': order.id,
+        'order_id': order.order_id,
+        'customer_name': order.customer_name,
+        'order_placed_by': order.order_placed_by,
+        'status': order.status,
+        'order_status': order.order_status,
+        'updated_at': order.updated_at.isoformat(),
+        'order': serialize_active_order(order) if order.order_status in ACTIVE_ORDER_STATUSES else None,
+    }
+
+
+class Subscription:
+    """A subscriber's queue, readable from a thread or from an event loop."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def put(self, event):
+        self.queue.put(event)
+        with self._lock:
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def get(self, timeout):
+        """Blocking read for sync (WSGI) callers; returns None on timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        """Awaitable read for ASGI callers; returns None on timeout."""
+        if self._loop is None:
+            # Both are published together so put() never sees a loop without its event
+            with self._lock:
+                self._wakeup = asyncio.Event()
+                self._loop = asyncio.get_running_loop()
+        self._wakeup.clear()
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class InMemoryBroker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put(event)
+            except Exception as e:
+                # e.g. the subscriber's event loop has closed; the others still get the event
+                logger.warning(f"⚠️ Could not deliver order event to a subscriber: {e}")
+
+    def publish(self, event):
+        self.deliver(event)
+
+
+class PostgresBroker(InMemoryBroker):
+    """
+    Publishes with pg_notify and runs one LISTEN connection per process that
+    fans notifications out to local subscribers. LISTEN needs a session-mode
+    connection; set ORDER_EVENTS_LISTEN_URL when DATABASE_URL points at a
+    transaction-mode pooler.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, event):
+        payload = json.dumps(event)
+        if len(payload.encode('utf-8')) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps(dict(event, order=None))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [ORDER_EVENTS_CHANNEL, payload])
+
+    def subscribe(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='order-events-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe()
+
+    def _connect(self):
+        if settings.ORDER_EVENTS_LISTEN_URL:
+            return psycopg2.connect(settings.ORDER_EVENTS_LISTEN_URL)
+        return psycopg2.connect(**connection.get_connection_params())
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {ORDER_EVENTS_CHANNEL}')
+                logger.info("✅ Listening for order events")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.deliver(json.loads(notify.payload))
+                        except json.JSONDecodeError:
+                            logger.warning(f"⚠️ Ignoring malformed order event: {notify.payload[:200]}")
+            except Exception as e:
+                logger.error(f"❌ Order event listener failed, reconnecting: {e}")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_brokers = {}
+
+
+def get_broker():
+    """Returns the process-wide broker selected by ORDER_EVENTS_BROKER."""
+    name = settings.ORDER_EVENTS_BROKER
+    if name not in _brokers:
+        _brokers[name] = PostgresBroker() if name == 'postgres' else InMemoryBroker()
+    return _brokers[name]
+
+
+def publish_order_event(event_type, order):
+    """Publishes an order event once the current transaction commits."""
+    event = order_event(event_type, order)
+
+    def publish():
+        try:
+            get_broker().publish(event)
+        except Exception as e:
+            # Screens still catch up through get_pending_orders?since=
+            logger.error(f"❌ Failed to publish {event_type} for order {order.pk}: {e}")
+
+    transaction.on_commit(publish)
+
+
+def format_sse(event=None, event_id=None, retry=None, comment=None):
+    """Encodes one Server-Sent Events frame."""
+    lines = []
+    if comment is not None:
+        lines.append(f': {comment}')
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event["type"]}')
+        lines.append(f'data: {json.dumps(event)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def _opening_frames(backlog, cursor, retry):
+    # The bare id moves EventSource's Last-Event-ID to the cursor even when
+    # there is no backlog, so the next reconnect resumes from here.
+    yield format_sse(retry=retry, event_id=cursor)
+    for event in backlog:
+        yield format_sse(event, event_id=event['updated_at'])
+
+
+def _drain(subscription):
+    frames = []
+    while True:
+        event = subscription.get(timeout=0)
+        if event is None:
+            return frames
+        frames.append(format_sse(event, event_id=event['updated_at']))
+
+
+async def stream_events(broker, subscription, backlog, cursor):
+    """Async SSE body for ASGI: the backlog, then live events until MAX_STREAM_SECONDS."""
+    try:
+        for frame in _opening_frames(backlog, cursor, retry=RECONNECT_MS):
+            yield frame
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            event = await subscription.aget(timeout=HEARTBEAT_SECONDS)
+            if event is None:
+                yield format_sse(comment='keepalive')
+                continue
+            yield format_sse(event, event_id=event['updated_at'])
+            for frame in _drain(subscription):
+                yield frame
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def long_poll_events(broker, subscription, backlog, cursor):
+    """Bounded SSE body for WSGI: ends after the first events or LONG_POLL_SECONDS."""
+    try:
+        for frame in _opening_frames(backlog, cursor, retry=RECONNECT_MS):
+            yield frame
+        if backlog:
+            return
+        event = subscription.get(timeout=LONG_POLL_SECONDS)
+        if event is not None:
+            yield format_sse(event, event_id=event['updated_at'])
+            for frame in _drain(subscription):
+                yield frame
+    finally:
+        broker.unsubscribe(subscription)
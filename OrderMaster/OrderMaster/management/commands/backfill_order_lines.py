@@ -0,0 +1,19 @@
+# OrderMaster/OrderMaster/management/commands/backfill_order_lines.py
+
+from django.core.management.base import BaseCommand, CommandError
+from OrderMaster.order_lines import BACKFILL_CHUNK_SIZE, backfill_order_lines
+
+
+class Command(BaseCommand):
+    help = 'Write order_lines rows for existing orders from their items JSON (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE,
+                            help=f'Orders per transaction (default {BACKFILL_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        orders, lines = backfill_order_lines(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Scanned {orders} orders, wrote {lines} order lines'))
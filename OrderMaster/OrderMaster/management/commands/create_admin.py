@@ -3,7 +3,6 @@
 # OrderMaster/OrderMaster/management/commands/__init__.py  
 # OrderMaster/OrderMaster/management/commands/create_admin.py
 
-import bcrypt
 from django.core.management.base import BaseCommand
 from OrderMaster.models import VlhAdmin
 
@@ -33,14 +32,10 @@ class Command(BaseCommand):
             )
             return
         
-        # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        # Create admin
-        VlhAdmin.objects.create(
-            mobile=mobile,
-            password_hash=password_hash
-        )
+        # Create admin (hashed with BCRYPT_ROUNDS)
+        admin = VlhAdmin(mobile=mobile)
+        admin.set_password(password)
+        admin.save()
         
         self.stdout.write(
             self.style.SUCCESS(f'Successfully created admin user with mobile: {mobile}')
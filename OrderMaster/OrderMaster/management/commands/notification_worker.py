@@ -0,0 +1,53 @@
+# OrderMaster/OrderMaster/management/commands/notification_worker.py
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from OrderMaster.notifications import drain_outbox, outbox_stats, prune_outbox, MAX_BATCH_SIZE, PRUNE_INTERVAL_SECONDS
+
+
+class Command(BaseCommand):
+    help = 'Send queued FCM notifications from the notification outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help=f'Messages per send_each call (max {MAX_BATCH_SIZE})')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Delete sent notifications older than this (default NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth/latency stats and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(outbox_stats()))
+            return
+
+        batch_size = options['batch_size']
+        if options['once']:
+            total = 0
+            while True:
+                handled = drain_outbox(batch_size=batch_size)
+                total += handled
+                if handled < batch_size:
+                    break
+            pruned = prune_outbox(options['retention_days'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {total} notifications, pruned {pruned} sent ones'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Notification worker started'))
+        last_pruned = None
+        try:
+            while True:
+                # Long-running process: recycle connections the way a request would
+                close_old_connections()
+                if last_pruned is None or time.monotonic() - last_pruned >= PRUNE_INTERVAL_SECONDS:
+                    prune_outbox(options['retention_days'])
+                    last_pruned = time.monotonic()
+                if drain_outbox(batch_size=batch_size) < batch_size:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Notification worker stopped')
@@ -0,0 +1,24 @@
+# OrderMaster/OrderMaster/management/commands/rebuild_sales_rollup.py
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from OrderMaster.sales_rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    help = 'Backfill (or repair) the daily_revenue and daily_item_sales rollups from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First day to rebuild (YYYY-MM-DD); defaults to the first order')
+        parser.add_argument('--end-date', help='Last day to rebuild (YYYY-MM-DD); defaults to today')
+
+    def handle(self, *args, **options):
+        try:
+            start_day = datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date'] else None
+            end_day = datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date'] else None
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+
+        count = rebuild_rollup(start_day, end_day)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollup from {count} orders'))
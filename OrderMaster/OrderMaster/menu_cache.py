@@ -0,0 +1,70 @@
+# OrderMaster/menu_cache.py
+"""
+Pre-encoded snapshot of the menu served by api_menu_items.
+
+The snapshot is cached per menu version, and every MenuItem save or delete
+bumps that version, whichever view (or the Django admin) made the change.
+The Flask customer app reads the same counter (shared/menu_version.py).
+"""
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from shared.menu_version import MENU_VERSION_KEY
+
+from .cache_versions import bump_version, get_version
+from .models import MenuItem
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = 60 * 60 * 24
+
+
+def serialize_menu_item(item):
+    return {
+        'id': item.id,
+        'item_name': item.item_name,
+        'description': item.description or '',
+        'price': float(item.price),
+        'category': item.category,
+        'veg_nonveg': item.veg_nonveg,
+        'meal_type': item.meal_type,
+        'availability_time': item.availability_time or '',
+        'image_url': item.image_url or ''
+    }
+
+
+def build_menu_snapshot():
+    """Encodes the full menu once and returns (etag, body_bytes)."""
+    menu_items = MenuItem.objects.all().order_by('category', 'item_name')
+    body = json.dumps(
+        {'menu_items': [serialize_menu_item(item) for item in menu_items]},
+        cls=DjangoJSONEncoder,
+    ).encode('utf-8')
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return etag, body
+
+
+def get_menu_snapshot():
+    """
+    Returns (etag, body_bytes) for the current menu version. A cache hit costs
+    a single primary-key lookup of the version counter.
+    """
+    version = get_version(MENU_VERSION_KEY)
+    cache_key = f'menu_snapshot:{version}'
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        snapshot = build_menu_snapshot()
+        cache.set(cache_key, snapshot, SNAPSHOT_TTL)
+        logger.info(f"✅ Built menu snapshot for version {version} ({len(snapshot[1])} bytes)")
+    return snapshot
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_menu_snapshot(sender, **kwargs):
+    bump_version(MENU_VERSION_KEY)
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:45
+
+import OrderMaster.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrderMaster', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='order_placed_by',
+            field=models.CharField(choices=[('customer', 'Customer'), ('counter', 'Counter')], default='customer', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='menuitem',
+            name='created_at',
+            field=models.DateTimeField(default=OrderMaster.models.get_ist_now),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(default=OrderMaster.models.get_ist_now),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_status',
+            field=models.CharField(choices=[('open', 'Open'), ('closed', 'Closed')], default='open', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(default=OrderMaster.models.get_ist_now),
+        ),
+        migrations.AlterField(
+            model_name='vlhadmin',
+            name='created_at',
+            field=models.DateTimeField(default=OrderMaster.models.get_ist_now),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrderMaster', '0002_sync_order_model'),
+    ]
+
+    operations = [
+        # Feeds order_service.allocate_order_id; one value per public order ID
+        migrations.RunSQL(
+            sql='CREATE SEQUENCE IF NOT EXISTS order_public_id_seq MINVALUE 1 MAXVALUE 90000000 NO CYCLE;',
+            reverse_sql='DROP SEQUENCE IF EXISTS order_public_id_seq;',
+        ),
+    ]
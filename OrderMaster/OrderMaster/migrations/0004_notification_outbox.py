@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:47
+
+import OrderMaster.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrderMaster', '0003_order_public_id_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(default='new_orders', max_length=100)),
+                ('title', models.CharField(blank=True, max_length=200, null=True)),
+                ('body', models.TextField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=OrderMaster.models.get_ist_now)),
+                ('next_attempt_at', models.DateTimeField(default=OrderMaster.models.get_ist_now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrderMaster', '0005_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='orders_updated_at_idx'),
+        ),
+    ]
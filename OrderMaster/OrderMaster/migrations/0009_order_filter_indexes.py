@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('OrderMaster', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status__in', ['open', 'ready'])), fields=['-created_at'], name='orders_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_placed_by', '-created_at'], name='orders_source_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_mobile', '-created_at'], name='orders_mobile_created_idx'),
+        ),
+    ]
@@ -2,9 +2,9 @@
 from django.db import models
 from django.utils import timezone
 from datetime import datetime
-import bcrypt
 import random
 import pytz
+from shared.passwords import get_hasher
 
 def get_ist_now():
     """Returns current time in IST (Asia/Kolkata) as timezone-naive datetime"""
@@ -69,6 +69,42 @@ class Order(models.Model):
     class Meta:
         db_table = 'orders'
         ordering = ['-created_at']
+        indexes = [
+            # Delta sync: get_pending_orders?since=<cursor>
+            models.Index(fields=['updated_at'], name='orders_updated_at_idx'),
+            # Keyset pagination: getAllOrders?cursor=<next_cursor>
+            models.Index(fields=['-created_at', '-id'], name='orders_created_id_idx'),
+            # Order board and Flutter polling read the few open/ready orders
+            models.Index(fields=['-created_at'], name='orders_active_idx',
+                         condition=models.Q(order_status__in=['open', 'ready'])),
+            # order_management_view / analytics split customer and counter orders by date
+            models.Index(fields=['order_placed_by', '-created_at'], name='orders_source_created_idx'),
+            # Flask get_customer_orders: a customer's latest orders
+            models.Index(fields=['customer_mobile', '-created_at'], name='orders_mobile_created_idx'),
+        ]
+
+
+class OrderLine(models.Model):
+    """
+    One line of Order.items, written with the order (see shared/order_lines.py)
+    so item-level analytics can join rows instead of parsing JSON.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', db_index=False)
+    position = models.PositiveSmallIntegerField()  # 1-based index in Order.items
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    name = models.CharField(max_length=200)  # Snapshot at order time
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # NULL if malformed
+    quantity = models.IntegerField(null=True)  # NULL if missing or not an integer
+
+    class Meta:
+        db_table = 'order_lines'
+        constraints = [
+            # Also serves as the order_id index for joins from orders
+            models.UniqueConstraint(fields=['order', 'position'], name='order_lines_order_position_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} x{self.quantity} (order {self.order_id})"
 
 
 class VlhAdmin(models.Model):
@@ -80,12 +116,90 @@ class VlhAdmin(models.Model):
         db_table = 'vlh_admin'
 
     def set_password(self, raw_password):
-        self.password_hash = bcrypt.hashpw(raw_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = get_hasher().hash(raw_password)
 
     def check_password(self, raw_password):
-        if self.password_hash:
-             return bcrypt.checkpw(raw_password.encode('utf-8'), self.password_hash.encode('utf-8'))
-        return False
+        """Verifies the password, storing a new hash if BCRYPT_ROUNDS changed since it was set."""
+        valid, new_hash = get_hasher().verify_and_update(raw_password, self.password_hash)
+        if new_hash and self.pk:
+            self.password_hash = new_hash
+            self.save(update_fields=['password_hash'])
+        return valid
 
     def __str__(self):
         return self.mobile
+
+
+class NotificationOutbox(models.Model):
+    """FCM messages waiting to be sent by the notification_worker command."""
+    STATUS_CHOICES = [('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')]
+
+    topic = models.CharField(max_length=100, default='new_orders')
+    title = models.CharField(max_length=200, blank=True, null=True)
+    body = models.TextField(blank=True, null=True)
+    data = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(default=get_ist_now)
+    next_attempt_at = models.DateTimeField(default=get_ist_now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'notification_outbox'
+        indexes = [models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx')]
+
+    def __str__(self):
+        return f"Notification {self.pk} ({self.status})"
+
+
+class CacheVersion(models.Model):
+    """Change counters shared by all workers, used to key cached snapshots."""
+    key = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'cache_versions'
+
+    def __str__(self):
+        return f"{self.key}={self.version}"
+
+
+class DailyRevenue(models.Model):
+    """Completed-order totals per hour of a day, maintained by sales_rollup."""
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    payment_method = models.CharField(max_length=50)  # Lower-cased
+    order_placed_by = models.CharField(max_length=10)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'daily_revenue'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'hour', 'payment_method', 'order_placed_by'],
+                                    name='daily_revenue_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.hour:02d}h {self.payment_method}/{self.order_placed_by}: {self.revenue}"
+
+
+class DailyItemSales(models.Model):
+    """Completed-order item quantities per day, maintained by sales_rollup."""
+    day = models.DateField()
+    item_name = models.CharField(max_length=200)
+    payment_method = models.CharField(max_length=50)  # Lower-cased
+    order_placed_by = models.CharField(max_length=10)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'daily_item_sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'item_name', 'payment_method', 'order_placed_by'],
+                                    name='daily_item_sales_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.item_name} x{self.quantity}"
@@ -0,0 +1,205 @@
+# OrderMaster/notifications.py
+"""
+Transactional outbox for Firebase Cloud Messaging.
+
+Views call enqueue_notification() inside the same transaction that writes the
+order, and the `notification_worker` management command delivers the queued
+rows with messaging.send_each(). Unless NOTIFICATION_DRAIN_ON_COMMIT is off,
+each web process also drains the outbox in a background thread after such a
+transaction commits, so notifications still go out without a worker.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Avg, F, Min, Q, Count
+from django.utils.module_loading import import_string
+from shared.firebase_client import configure, get_client, messaging_module
+
+from .models import NotificationOutbox, get_ist_now
+
+logger = logging.getLogger(__name__)
+
+# The Admin SDK is initialized on the first send, not at import
+configure(credentials_env='FIREBASE_CREDENTIALS',
+          default_credentials=getattr(settings, 'FIREBASE_DEFAULT_CREDENTIALS', False))
+
+# FCM accepts at most 500 messages per send_each call
+MAX_BATCH_SIZE = 500
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
+# A claimed row is hidden from other drains for this long, well past any
+# send_each call; rows of a drain that died mid-send come due again after it.
+CLAIM_LEASE_SECONDS = 600
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+def enqueue_notification(data, title=None, body=None, topic='new_orders'):
+    """
+    Queues an FCM message. Call it inside the transaction that changes the
+    order so the message is only sent if that change commits.
+    """
+    entry = NotificationOutbox.objects.create(
+        topic=topic,
+        title=title,
+        body=body,
+        data={key: str(value) for key, value in data.items()},
+    )
+    if getattr(settings, 'NOTIFICATION_DRAIN_ON_COMMIT', True):
+        transaction.on_commit(request_drain)
+    return entry
+
+
+def get_messaging_backend():
+    """Returns the object used to send messages (the shared Firebase client by default)."""
+    backend_path = getattr(settings, 'NOTIFICATION_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return get_client()
+
+
+def build_message(entry):
+    messaging = messaging_module()
+    notification = None
+    if entry.title or entry.body:
+        notification = messaging.Notification(title=entry.title, body=entry.body)
+    return messaging.Message(notification=notification, data=entry.data, topic=entry.topic)
+
+
+def retry_delay(attempts):
+    """Exponential backoff for the given number of failed attempts."""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def drain_outbox(batch_size=100, backend=None):
+    """
+    Sends one batch of due notifications and returns the number of rows handled.
+
+    Rows are claimed in a short transaction with SELECT ... FOR UPDATE SKIP
+    LOCKED, which moves their next_attempt_at past a lease so that other
+    drains skip them. The batch is sent outside any transaction, and the
+    results are written afterwards, so a slow FCM call holds no locks.
+    """
+    backend = backend or get_messaging_backend()
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    now = get_ist_now()
+
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not entries:
+            return 0
+        NotificationOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+        )
+
+    try:
+        responses = backend.send_each([build_message(entry) for entry in entries]).responses
+        errors = [None if resp.success else resp.exception for resp in responses]
+    except Exception as e:
+        logger.error(f"❌ FCM batch send failed: {e}", exc_info=True)
+        errors = [e] * len(entries)
+
+    sent_at = get_ist_now()
+    for entry, error in zip(entries, errors):
+        entry.attempts += 1
+        if error is None:
+            entry.status = 'sent'
+            entry.sent_at = sent_at
+            entry.last_error = None
+        else:
+            entry.last_error = str(error)
+            if entry.attempts >= MAX_ATTEMPTS:
+                entry.status = 'failed'
+                logger.error(f"❌ Giving up on notification {entry.pk} after {entry.attempts} attempts: {error}")
+            else:
+                entry.next_attempt_at = sent_at + retry_delay(entry.attempts)
+
+    NotificationOutbox.objects.bulk_update(
+        entries, ['status', 'attempts', 'last_error', 'sent_at', 'next_attempt_at']
+    )
+
+    failed = sum(1 for error in errors if error is not None)
+    logger.info(f"✅ Notification batch done: {len(entries) - failed} sent, {failed} failed")
+    return len(entries)
+
+
+def prune_outbox(retention_days=None):
+    """Deletes sent rows older than NOTIFICATION_RETENTION_DAYS and returns how many were removed."""
+    if retention_days is None:
+        retention_days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 7)
+    cutoff = get_ist_now() - timedelta(days=retention_days)
+    deleted, _ = NotificationOutbox.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    if deleted:
+        logger.info(f"🧹 Pruned {deleted} sent notifications older than {retention_days} days")
+    return deleted
+
+
+_drain_wanted = threading.Event()
+_drainer = None
+_drainer_lock = threading.Lock()
+
+
+def _run_drainer():
+    last_pruned = None
+    while True:
+        _drain_wanted.wait()
+        _drain_wanted.clear()
+        try:
+            while drain_outbox(batch_size=MAX_BATCH_SIZE) == MAX_BATCH_SIZE:
+                pass
+            now = get_ist_now()
+            if last_pruned is None or (now - last_pruned).total_seconds() >= PRUNE_INTERVAL_SECONDS:
+                prune_outbox()
+                last_pruned = now
+        except Exception as e:
+            logger.error(f"❌ Background notification drain failed: {e}", exc_info=True)
+        finally:
+            connections.close_all()
+
+
+def request_drain():
+    """
+    Wakes this process's drain thread (started on first use). Retries that
+    are not due yet wait for the next wake-up or for notification_worker.
+    """
+    global _drainer
+    if _drainer is None:
+        with _drainer_lock:
+            if _drainer is None:
+                _drainer = threading.Thread(target=_run_drainer, name='notification-drain', daemon=True)
+                _drainer.start()
+    _drain_wanted.set()
+
+
+def outbox_stats(window=timedelta(hours=1)):
+    """Queue depth and delivery latency figures for monitoring."""
+    now = get_ist_now()
+    counts = NotificationOutbox.objects.aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        failed=Count('id', filter=Q(status='failed')),
+        oldest_pending=Min('created_at', filter=Q(status='pending')),
+    )
+    latency = NotificationOutbox.objects.filter(
+        status='sent', sent_at__gte=now - window
+    ).aggregate(
+        sent=Count('id'),
+        avg_latency=Avg(F('sent_at') - F('created_at')),
+    )
+    oldest_pending = counts['oldest_pending']
+    avg_latency = latency['avg_latency']
+    return {
+        'pending': counts['pending'],
+        'failed': counts['failed'],
+        'oldest_pending_age_seconds': (now - oldest_pending).total_seconds() if oldest_pending else 0.0,
+        'sent_last_window': latency['sent'],
+        'avg_latency_seconds': avg_latency.total_seconds() if avg_latency else 0.0,
+        'window_seconds': window.total_seconds(),
+    }
@@ -0,0 +1,181 @@
+# OrderMaster/order_export.py
+"""
+Streaming order export used by export_orders_view.
+
+Orders are read through a server-side cursor (QuerySet.iterator) and encoded
+a chunk at a time, so memory use does not depend on the size of the range.
+NDJSON writes one order per line with its items; CSV writes one row per
+order line, repeating the order columns.
+"""
+import csv
+import io
+import json
+import logging
+import queue
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+# Encoded output is flushed to the client in blocks of roughly this size
+EXPORT_FLUSH_BYTES = 64 * 1024
+# Blocks buffered between the export thread and an ASGI response
+EXPORT_QUEUE_BLOCKS = 16
+
+EXPORT_ORDER_COLUMNS = [
+    'id', 'order_id', 'created_at', 'customer_name', 'customer_mobile', 'order_placed_by',
+    'status', 'order_status', 'payment_method', 'subtotal', 'discount', 'total_price',
+    'ready_time', 'pickup_time',
+]
+EXPORT_LINE_COLUMNS = ['item_id', 'item_name', 'item_price', 'quantity', 'line_total']
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _order_record(row):
+    record = {}
+    for column in EXPORT_ORDER_COLUMNS:
+        value = row[column]
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif column in ('subtotal', 'discount', 'total_price'):
+            value = float(value)
+        record[column] = value
+    return record
+
+
+def _order_items(row):
+    items = row['items']
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except json.JSONDecodeError:
+            logger.warning(f"⚠️ Export: malformed items JSON for order {row['id']}")
+            return []
+    return items if isinstance(items, list) else []
+
+
+def _line_record(item):
+    price = item.get('price')
+    quantity = item.get('quantity')
+    try:
+        line_total = round(float(price) * int(quantity), 2)
+    except (TypeError, ValueError):
+        line_total = None
+    return {
+        'item_id': item.get('id'),
+        'item_name': item.get('name'),
+        'item_price': price,
+        'quantity': quantity,
+        'line_total': line_total,
+    }
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        record = _order_record(row)
+        record['items'] = [_line_record(item) for item in _order_items(row) if isinstance(item, dict)]
+        yield json.dumps(record) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORT_ORDER_COLUMNS + EXPORT_LINE_COLUMNS)
+    yield take()
+    for row in rows:
+        order_values = list(_order_record(row).values())
+        lines = [_line_record(item) for item in _order_items(row) if isinstance(item, dict)]
+        if not lines:
+            # Keep orders without readable items in the export
+            writer.writerow(order_values + [None] * len(EXPORT_LINE_COLUMNS))
+        for line in lines:
+            writer.writerow(order_values + list(line.values()))
+        yield take()
+
+
+def iter_export(queryset, export_format):
+    """Yields the encoded export of `queryset` in blocks of about EXPORT_FLUSH_BYTES."""
+    encode = _csv_lines if export_format == 'csv' else _ndjson_lines
+    # Server-side cursors must live inside a transaction behind a transaction pooler
+    with transaction.atomic(using=queryset.db):
+        rows = queryset.values(*EXPORT_ORDER_COLUMNS, 'items').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        block, size = [], 0
+        for line in encode(rows):
+            block.append(line)
+            size += len(line)
+            if size >= EXPORT_FLUSH_BYTES:
+                yield ''.join(block).encode('utf-8')
+                block, size = [], 0
+        if block:
+            yield ''.join(block).encode('utf-8')
+
+
+async def aiter_export(queryset, export_format):
+    """
+    ASGI variant of iter_export. Django 4.2 buffers synchronous iterators
+    under ASGI, so the export runs in its own thread (with its own database
+    connection) and hands blocks over through a bounded queue.
+
+    If the export fails part way, the error is re-raised here so the response
+    is aborted rather than ending as if the file were complete.
+    """
+    blocks = queue.Queue(maxsize=EXPORT_QUEUE_BLOCKS)
+    cancelled = threading.Event()
+    done = object()
+    failure = []
+
+    def hand_over(item):
+        # Give up if the client went away instead of blocking on a full queue
+        while not cancelled.is_set():
+            try:
+                blocks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for block in iter_export(queryset, export_format):
+                if not hand_over(block):
+                    return
+        except Exception as e:
+            logger.error(f"❌ Order export failed: {e}", exc_info=True)
+            failure.append(e)
+        finally:
+            connections.close_all()
+            hand_over(done)
+
+    def take():
+        # Poll, so the executor thread is released once the client went away
+        while not cancelled.is_set():
+            try:
+                return blocks.get(timeout=1)
+            except queue.Empty:
+                continue
+        return done
+
+    threading.Thread(target=produce, name='order-export', daemon=True).start()
+    try:
+        while True:
+            block = await sync_to_async(take, thread_sensitive=False)()
+            if block is done:
+                if failure:
+                    raise failure[0]
+                break
+            yield block
+    finally:
+        cancelled.set()
@@ -0,0 +1,46 @@
+# OrderMaster/order_lines.py
+"""
+Keeps the order_lines table in step with Order.items.
+
+create_order() calls write_order_lines() in the transaction that inserts the
+order, and the backfill_order_lines command calls backfill_order_lines() for
+orders placed before the table existed. Both run the shared SQL in
+shared/order_lines.py, which the Flask app uses too.
+"""
+import logging
+
+from django.db import connection, transaction
+from shared.order_lines import INSERT_LINES_FOR_ID_RANGE_SQL, INSERT_LINES_FOR_ORDERS_SQL
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def write_order_lines(order_ids):
+    """Inserts the lines of the given orders; returns the number of rows written."""
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_LINES_FOR_ORDERS_SQL, [list(order_ids)])
+        return cursor.rowcount
+
+
+def backfill_order_lines(chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Writes missing lines for every order, walking the table by id in chunks
+    of `chunk_size` orders with one transaction each. Orders that already
+    have their lines are left alone. Returns (orders_scanned, lines_written).
+    """
+    last_id, orders, lines = 0, 0, 0
+    while True:
+        ids = list(Order.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(INSERT_LINES_FOR_ID_RANGE_SQL, [last_id, ids[-1]])
+            lines += cursor.rowcount
+        orders += len(ids)
+        last_id = ids[-1]
+        logger.info(f"✅ Order lines backfilled up to order {last_id} ({orders} orders, {lines} lines)")
+    return orders, lines
@@ -0,0 +1,285 @@
+# OrderMaster/order_service.py
+"""
+Shared order pipeline used by the customer (api_place_order) and counter
+(create_manual_order) endpoints.
+"""
+import base64
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from .models import MenuItem, Order
+from .order_lines import write_order_lines
+
+logger = logging.getLogger(__name__)
+
+# Public order IDs are 8-digit strings. They are derived from a Postgres
+# sequence through a keyed permutation of the ID space, so consecutive orders
+# do not get guessable consecutive IDs and no existence check is needed.
+ORDER_ID_SEQUENCE = 'order_public_id_seq'
+ORDER_ID_MIN = 10000000
+ORDER_ID_SPACE = 90000000
+MAX_ORDER_ID_ATTEMPTS = 5
+
+_FEISTEL_HALF = 10000
+_FEISTEL_ROUNDS = 4
+
+# Orders shown on the live board (get_pending_orders, order events)
+ACTIVE_ORDER_STATUSES = ['open', 'ready']
+# Change feeds re-read this much history before a cursor, so rows whose
+# transaction committed after a poll with an earlier updated_at are not missed.
+DELTA_SYNC_OVERLAP = timedelta(seconds=5)
+
+# getAllOrders pages through orders newest first on (created_at, id)
+ORDER_PAGE_SIZE = 100
+MAX_ORDER_PAGE_SIZE = 500
+# Response field -> columns it is built from
+ORDER_LIST_FIELDS = {
+    'id': ['id'],
+    'order_id': ['order_id', 'id'],
+    'customer_name': ['customer_name'],
+    'customer_mobile': ['customer_mobile'],
+    'items': ['items'],
+    'total_price': ['total_price'],
+    'status': ['status'],
+    'order_status': ['order_status'],
+    'order_placed_by': ['order_placed_by'],
+    'payment_method': ['payment_method'],
+    'created_at': ['created_at'],
+    'ready_time': ['ready_time'],
+    'pickup_time': ['pickup_time'],
+}
+
+
+class OrderValidationError(ValueError):
+    """Raised when a cart cannot be turned into order items."""
+
+
+def validate_cart(items_data):
+    """
+    Validates a cart and prices it against the menu.
+
+    Every line is resolved with a single ``id__in`` query, so the cost does not
+    grow with the number of lines. Lines with a zero or negative quantity are
+    dropped. Returns ``(validated_items, subtotal)``.
+    """
+    if not isinstance(items_data, list) or len(items_data) == 0:
+        raise OrderValidationError('Items must be a non-empty list.')
+
+    # First pass: parse every line without touching the database
+    parsed_lines = []
+    for item_data in items_data:
+        if not isinstance(item_data, dict) or not all(k in item_data for k in ['id', 'quantity']):
+            raise OrderValidationError('Each item must have id and quantity.')
+        try:
+            parsed_lines.append((int(item_data['id']), int(item_data['quantity'])))
+        except (ValueError, TypeError):
+            raise OrderValidationError(f'Invalid quantity for item ID {item_data.get("id", "unknown")}.')
+
+    menu_items = MenuItem.objects.in_bulk({item_id for item_id, _ in parsed_lines})
+
+    # Second pass: price each line from the snapshot
+    subtotal = Decimal('0.00')
+    validated_items = []
+    for item_id, quantity in parsed_lines:
+        menu_item = menu_items.get(item_id)
+        if menu_item is None:
+            raise OrderValidationError(f'Menu item with ID {item_id} not found.')
+        if quantity <= 0:
+            continue
+
+        subtotal += menu_item.price * quantity
+        validated_items.append({
+            'id': menu_item.id,
+            'name': menu_item.item_name,
+            'price': float(menu_item.price),
+            'quantity': quantity,
+        })
+
+    if not validated_items:
+        raise OrderValidationError('No valid items found in the order.')
+
+    return validated_items, subtotal
+
+
+def _round_value(round_no, value):
+    key = settings.ORDER_ID_PERMUTATION_KEY.encode('utf-8')
+    digest = hashlib.blake2b(f'{round_no}:{value}'.encode('ascii'), digest_size=8, key=key[:64]).digest()
+    return int.from_bytes(digest, 'big') % _FEISTEL_HALF
+
+
+def _feistel(value, reverse=False):
+    left, right = divmod(value, _FEISTEL_HALF)
+    if not reverse:
+        for round_no in range(_FEISTEL_ROUNDS):
+            left, right = right, (left + _round_value(round_no, right)) % _FEISTEL_HALF
+    else:
+        for round_no in reversed(range(_FEISTEL_ROUNDS)):
+            left, right = (right - _round_value(round_no, left)) % _FEISTEL_HALF, left
+    return left * _FEISTEL_HALF + right
+
+
+def _permute(value, reverse=False):
+    # Cycle-walk the 10^8 Feistel domain until we land back inside the ID space
+    value = _feistel(value, reverse)
+    while value >= ORDER_ID_SPACE:
+        value = _feistel(value, reverse)
+    return value
+
+
+def format_order_id(sequence_value):
+    """Maps a sequence value (1..90,000,000) to its public 8-digit order ID."""
+    if not 1 <= sequence_value <= ORDER_ID_SPACE:
+        raise ValueError(f'Order sequence value {sequence_value} is out of range.')
+    return str(ORDER_ID_MIN + _permute(sequence_value - 1))
+
+
+def parse_order_id(order_id):
+    """Inverse of format_order_id: returns the sequence value behind an order ID."""
+    return _permute(int(order_id) - ORDER_ID_MIN, reverse=True) + 1
+
+
+def allocate_order_id():
+    """Reserves the next public order ID without writing to the orders table."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s)', [ORDER_ID_SEQUENCE])
+        sequence_value = cursor.fetchone()[0]
+    return format_order_id(sequence_value)
+
+
+def create_order(**fields):
+    """
+    Inserts an order with its public order_id already set, together with its
+    order_lines rows.
+
+    Allocated IDs never collide with each other; the retry only covers older
+    randomly generated IDs that happen to sit on an allocated value.
+    """
+    for _ in range(MAX_ORDER_ID_ATTEMPTS):
+        order_id = allocate_order_id()
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(order_id=order_id, **fields)
+                write_order_lines([order.pk])
+                return order
+        except IntegrityError:
+            if not Order.objects.filter(order_id=order_id).exists():
+                raise
+            logger.warning(f"⚠️ Allocated order ID {order_id} is already taken by a legacy order, retrying.")
+    raise IntegrityError(f'Could not allocate a free order ID after {MAX_ORDER_ID_ATTEMPTS} attempts.')
+
+
+def serialize_active_order(order):
+    """JSON shape of an open/ready order used by get_pending_orders and order events."""
+    try:
+        items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
+    except json.JSONDecodeError:
+        items_list = [] # Handle malformed JSON
+
+    return {
+        'id': order.id,
+        'order_id': order.order_id,
+        'customer_name': order.customer_name,
+        'customer_mobile': order.customer_mobile,
+        'items': items_list,
+        'total_price': float(order.total_price), # Sent as a number for the Flutter app
+        'order_status': order.order_status,
+        'status': order.status,
+        'order_placed_by': order.order_placed_by,
+        'created_at': order.created_at.isoformat(),
+        'ready_time': order.ready_time.isoformat() if order.ready_time else None,
+        'pickup_time': order.pickup_time.isoformat() if order.pickup_time else None,
+    }
+
+
+# order_management_view lanes: customer orders by status, plus every counter order
+ORDER_BOARD_LANES = ('preparing', 'ready', 'pickedup', 'counter')
+_CUSTOMER_STATUS_LANES = {'open': 'preparing', 'ready': 'ready', 'pickedup': 'pickedup'}
+# Lifetime of a rendered lane; its key changes with the orders, so this only bounds memory
+ORDER_BOARD_CACHE_SECONDS = 600
+# Columns the board template reads
+ORDER_BOARD_FIELDS = (
+    'id', 'order_id', 'customer_name', 'customer_mobile', 'items', 'total_price', 'payment_method',
+    'order_status', 'order_placed_by', 'created_at', 'updated_at', 'ready_time', 'pickup_time',
+)
+
+
+def build_order_board(orders):
+    """
+    Splits one date range of orders (newest first) into the board lanes,
+    decoding each order's items once, and returns (lanes, lane_keys).
+
+    A lane key is a digest of the (id, updated_at) pairs in the lane, so it
+    changes whenever an order enters, leaves or is updated in that lane. The
+    template uses it to key the lane's fragment cache.
+    """
+    lanes = {lane: [] for lane in ORDER_BOARD_LANES}
+    for order in orders:
+        if order.order_placed_by == 'counter':
+            lane = 'counter'
+        elif order.order_placed_by == 'customer':
+            lane = _CUSTOMER_STATUS_LANES.get(order.order_status)
+        else:
+            lane = None
+        if lane is None:
+            continue
+        try:
+            order.items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
+        except json.JSONDecodeError:
+            order.items_list = []
+        lanes[lane].append(order)
+
+    lane_keys = {}
+    for lane, lane_orders in lanes.items():
+        digest = hashlib.sha1()
+        for order in lane_orders:
+            digest.update(f'{order.id}:{order.updated_at.isoformat()};'.encode('ascii'))
+        lane_keys[lane] = digest.hexdigest()
+    return lanes, lane_keys
+
+
+def encode_order_cursor(created_at, pk):
+    """Opaque keyset cursor pointing just past the order (created_at, pk)."""
+    raw = f'{created_at.isoformat()}|{pk}'.encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_order_cursor(cursor):
+    """Inverse of encode_order_cursor; raises ValueError for malformed cursors."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def serialize_order_row(row, fields):
+    """Builds the getAllOrders JSON for a ``.values()`` row, limited to `fields`."""
+    data = {}
+    for field in fields:
+        if field == 'order_id':
+            data['order_id'] = row['order_id'] if row['order_id'] else str(row['id'])
+        elif field == 'items':
+            items = row['items']
+            if isinstance(items, str):
+                try:
+                    items = json.loads(items)
+                except json.JSONDecodeError:
+                    logger.error(f"[v0] JSON decode error for order {row['id']}")
+                    items = []
+            elif not isinstance(items, list):
+                logger.warning(f"[v0] Unexpected items type for order {row['id']}")
+                items = []
+            data['items'] = items
+        elif field == 'total_price':
+            data['total_price'] = float(row['total_price'])  # Ensure float
+        elif field in ('created_at', 'ready_time', 'pickup_time'):
+            data[field] = row[field].isoformat() if row[field] else None
+        else:
+            data[field] = row[field]
+    return data
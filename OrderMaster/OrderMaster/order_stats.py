@@ -0,0 +1,63 @@
+# OrderMaster/order_stats.py
+"""
+Order KPIs for dashboard_view and analytics_view.
+
+All of the counters come from one conditional-aggregate query over orders.
+The result is cached per data version: a fingerprint made of the highest
+order id, the newest updated_at and the menu version. Reading the fingerprint
+is a few index lookups however large the table gets. Any order placed or
+changed - from Django or the Flask app - and any menu edit yields a new
+version, so the counters are recomputed on the next page load. The short TTL
+only covers writes the fingerprint cannot see (deleted orders).
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Sum
+
+from .menu_cache import MENU_VERSION_KEY
+from .models import MenuItem, Order
+from .order_service import ACTIVE_ORDER_STATUSES
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATS_TTL = 30
+
+STATS_VERSION_SQL = """
+    SELECT (SELECT MAX(id) FROM public.orders),
+           (SELECT MAX(updated_at) FROM public.orders),
+           (SELECT version FROM public.cache_versions WHERE key = %s)
+"""
+
+
+def stats_version():
+    with connection.cursor() as cursor:
+        cursor.execute(STATS_VERSION_SQL, [MENU_VERSION_KEY])
+        last_id, last_updated, menu_version = cursor.fetchone()
+    return f"{last_id or 0}-{last_updated.isoformat() if last_updated else ''}-{menu_version or 0}"
+
+
+def compute_order_stats():
+    stats = Order.objects.order_by().aggregate(
+        total_orders=Count('id'),
+        preparing_orders=Count('id', filter=Q(order_status='open')),
+        ready_orders=Count('id', filter=Q(order_status='ready')),
+        pending_orders=Count('id', filter=Q(order_status__in=ACTIVE_ORDER_STATUSES)),
+        completed_orders=Count('id', filter=Q(order_status='pickedup')),
+        total_revenue=Sum('total_price', filter=Q(order_status='pickedup')),
+    )
+    stats['total_revenue'] = stats['total_revenue'] or 0
+    stats['menu_items'] = MenuItem.objects.count()
+    return stats
+
+
+def get_order_stats():
+    """Returns the KPI dict, recomputing it only when the data version changed."""
+    cache_key = f'order_stats:{stats_version()}'
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = compute_order_stats()
+        cache.set(cache_key, stats, ORDER_STATS_TTL)
+        logger.info(f"✅ Computed order stats ({stats['total_orders']} orders)")
+    return stats
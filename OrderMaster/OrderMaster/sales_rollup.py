@@ -0,0 +1,157 @@
+# OrderMaster/sales_rollup.py
+"""
+Daily sales rollups behind analytics_api_view.
+
+An order counts as a sale once it is complete: counter orders as soon as they
+are placed, customer orders when they are picked up. Views call
+record_sale_change() in the transaction that changes an order, which adds (or
+removes) its totals from daily_revenue and daily_item_sales with upserts, and
+the rebuild_sales_rollup command recomputes any range from the orders table
+with the SQL aggregations in analytics_queries.
+"""
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractHour, Lower, TruncDate
+
+from .analytics_queries import daily_item_sales, orders_where
+from .models import DailyItemSales, DailyRevenue, Order
+
+logger = logging.getLogger(__name__)
+
+# Same definition analytics_api_view has always used for completed sales
+COMPLETED_SALE_Q = Q(order_placed_by='counter') | Q(order_placed_by='customer', order_status='pickedup')
+
+_UPSERT_REVENUE_SQL = """
+    INSERT INTO daily_revenue (day, hour, payment_method, order_placed_by, orders, revenue)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (day, hour, payment_method, order_placed_by) DO UPDATE
+    SET orders = daily_revenue.orders + EXCLUDED.orders,
+        revenue = daily_revenue.revenue + EXCLUDED.revenue
+"""
+_UPSERT_ITEM_SQL = """
+    INSERT INTO daily_item_sales (day, item_name, payment_method, order_placed_by, quantity, revenue)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (day, item_name, payment_method, order_placed_by) DO UPDATE
+    SET quantity = daily_item_sales.quantity + EXCLUDED.quantity,
+        revenue = daily_item_sales.revenue + EXCLUDED.revenue
+"""
+
+
+def counts_as_sale(order):
+    """Python mirror of COMPLETED_SALE_Q."""
+    return order.order_placed_by == 'counter' or (
+        order.order_placed_by == 'customer' and order.order_status == 'pickedup'
+    )
+
+
+def _item_lines(items):
+    """Yields (name, quantity, line revenue) for each readable line of an order."""
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except json.JSONDecodeError:
+            return
+    if not isinstance(items, list):
+        return
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            quantity = int(item.get('quantity', 0))
+            price = Decimal(str(item.get('price', 0)))
+        except (TypeError, ValueError, InvalidOperation):
+            continue
+        if quantity:
+            yield str(item.get('name') or 'Unknown')[:200], quantity, price * quantity
+
+
+def _contributions(order):
+    """The rollup keys an order adds to, with its totals for each."""
+    day = order.created_at.date()
+    payment_method = (order.payment_method or '').lower()
+    revenue_key = (day, order.created_at.hour, payment_method, order.order_placed_by)
+    items = defaultdict(lambda: [0, Decimal('0.00')])
+    for name, quantity, revenue in _item_lines(order.items):
+        key = (day, name, payment_method, order.order_placed_by)
+        items[key][0] += quantity
+        items[key][1] += revenue
+    return revenue_key, order.total_price, items
+
+
+def apply_order(order, sign=1):
+    """Adds (sign=1) or removes (sign=-1) one order's totals from the rollups."""
+    revenue_key, total_price, items = _contributions(order)
+    with connection.cursor() as cursor:
+        cursor.execute(_UPSERT_REVENUE_SQL, [*revenue_key, sign, sign * total_price])
+        if items:
+            cursor.executemany(_UPSERT_ITEM_SQL, [
+                [*key, sign * quantity, sign * revenue] for key, (quantity, revenue) in items.items()
+            ])
+
+
+def record_sale_change(order, was_counted):
+    """
+    Updates the rollups after `order` was saved. `was_counted` is
+    counts_as_sale() from before the change (False for new orders). Call it in
+    the same transaction as the save.
+    """
+    now_counted = counts_as_sale(order)
+    if now_counted != was_counted:
+        apply_order(order, 1 if now_counted else -1)
+
+
+def rebuild_rollup(start_day=None, end_day=None):
+    """
+    Recomputes the rollups for [start_day, end_day] (inclusive, open-ended when
+    None) from the orders table, aggregating in SQL. Returns the number of
+    orders counted.
+    """
+    day_filter = {}
+    start = end = None
+    if start_day:
+        day_filter['day__gte'] = start_day
+        start = datetime.combine(start_day, time.min)
+    if end_day:
+        day_filter['day__lte'] = end_day
+        end = datetime.combine(end_day + timedelta(days=1), time.min)
+
+    orders = Order.objects.filter(COMPLETED_SALE_Q)
+    if start:
+        orders = orders.filter(created_at__gte=start)
+    if end:
+        orders = orders.filter(created_at__lt=end)
+    revenue_rows = orders.annotate(
+        day=TruncDate('created_at'), hour=ExtractHour('created_at'), payment_method_lower=Lower('payment_method'),
+    ).values('day', 'hour', 'payment_method_lower', 'order_placed_by').annotate(
+        orders_count=Count('id'), revenue=Sum('total_price'),
+    ).order_by()
+
+    with transaction.atomic():
+        # Hold off incremental upserts until the range is rebuilt
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE daily_revenue, daily_item_sales IN EXCLUSIVE MODE')
+            item_rows = daily_item_sales(cursor, orders_where(start, end, completed_sales=True))
+        DailyRevenue.objects.filter(**day_filter).delete()
+        DailyItemSales.objects.filter(**day_filter).delete()
+
+        revenue_objects = [
+            DailyRevenue(day=row['day'], hour=row['hour'], payment_method=row['payment_method_lower'],
+                         order_placed_by=row['order_placed_by'], orders=row['orders_count'], revenue=row['revenue'])
+            for row in revenue_rows
+        ]
+        DailyRevenue.objects.bulk_create(revenue_objects, batch_size=1000)
+        DailyItemSales.objects.bulk_create([
+            DailyItemSales(day=day, item_name=name, payment_method=payment_method, order_placed_by=source,
+                           quantity=quantity, revenue=revenue)
+            for day, name, payment_method, source, quantity, revenue in item_rows
+        ], batch_size=1000)
+
+    count = sum(row.orders for row in revenue_objects)
+    logger.info(f"✅ Rebuilt sales rollup from {count} orders ({start_day or 'start'} to {end_day or 'today'})")
+    return count
@@ -10,6 +10,7 @@ from typing import Tuple, Dict, Any, List, Optional
 
 from django.http import JsonResponse, HttpResponse
 from django.urls import path
+from django.utils.cache import get_conditional_response
 from django.utils.timezone import utc
 
 try:
@@ -21,11 +22,10 @@ except Exception:
     from psycopg.rows import dict_row
     def _connect(dsn): return psycopg.connect(dsn, row_factory=dict_row)
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import numpy as np
+from OrderMaster.chart_cache import ChartCache, cache_key, data_version, etag_for
+from OrderMaster.db_pool import ConnectionPool
+from OrderMaster.analytics_queries import item_totals, daily_item_totals, hourly_order_counts, orders_where
+from OrderMaster.decorators import admin_required
 
 POSTGRES_URL = os.environ.get("POSTGRES_URL") or os.environ.get("DATABASE_URL")
 
@@ -34,6 +34,25 @@ def _get_conn():
         raise RuntimeError("POSTGRES_URL (or DATABASE_URL) is not set")
     return _connect(POSTGRES_URL)
 
+# One bounded pool per process instead of a new connection per query
+_pool = ConnectionPool(
+    _get_conn,
+    max_size=int(os.environ.get("ANALYTICS_DB_POOL_SIZE", "5")),
+    max_lifetime=int(os.environ.get("ANALYTICS_DB_MAX_LIFETIME", "1800")),
+    timeout=float(os.environ.get("ANALYTICS_DB_POOL_TIMEOUT", "10")),
+)
+
+# Rendered PNGs, keyed by the orders they were drawn from
+_chart_cache = ChartCache()
+
+CHART_TITLES = {
+    "order-status": "Order Status",
+    "top-menu": "Top Menu Items",
+    "menu-by-hour": "Orders by Hour",
+    "day-wise-menu": "Day-wise Menu",
+    "day-wise-orders-revenue": "Day-wise Orders & Revenue",
+}
+
 def _date_range(params) -> Tuple[dt.datetime, dt.datetime]:
     today = dt.datetime.utcnow().date()
     rng = (params.get("range") or "today").lower()
@@ -69,7 +88,7 @@ def _date_range(params) -> Tuple[dt.datetime, dt.datetime]:
     return start, end
 
 def _fetchall(sql: str, args: Tuple[Any, ...]) -> List[Dict[str, Any]]:
-    with _get_conn() as conn:
+    with _pool.connection() as conn:
         try:
             cur = conn.cursor(cursor_factory=DictCursor)
         except Exception:
@@ -88,10 +107,20 @@ def _fetchall(sql: str, args: Tuple[Any, ...]) -> List[Dict[str, Any]]:
         finally:
             cur.close()
 
+def _run(query, *args, **kwargs):
+    """Runs one of the OrderMaster.analytics_queries functions on a fresh cursor."""
+    with _pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            return query(cur, *args, **kwargs)
+        finally:
+            cur.close()
+
 def _fetchone(sql: str, args: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
     rows = _fetchall(sql, args)
     return rows[0] if rows else None
 
+@admin_required
 def analytics_data_view(request):
     try:
         start, end = _date_range(request.GET)
@@ -145,12 +174,32 @@ def analytics_data_view(request):
         "table": table_rows
     })
 
-def _png_html(fig, title="Chart"):
+# matplotlib and numpy cost ~0.4 s and tens of MB per worker, so they are
+# loaded on the first chart render rather than when the URLconf is imported
+_charting = None
+
+def _charting_modules():
+    """Returns (pyplot, matplotlib.dates, numpy), importing them on first use."""
+    global _charting
+    if _charting is None:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates
+        import numpy as np
+        _charting = (plt, mdates, np)
+    return _charting
+
+def _png_bytes(fig) -> bytes:
+    plt, _, _ = _charting_modules()
     buf = io.BytesIO()
     fig.tight_layout(pad=0.5)
     fig.savefig(buf, format="png", dpi=140, bbox_inches="tight", pad_inches=0.1)
     plt.close(fig)
-    b64 = base64.b64encode(buf.getvalue()).decode("ascii")
+    return buf.getvalue()
+
+def _png_html(png: bytes, title="Chart"):
+    b64 = base64.b64encode(png).decode("ascii")
     html = f"""
 <!doctype html><html><head><meta charset="utf-8">
 <meta name="viewport" content="width=device-width,initial-scale=1">
@@ -165,21 +214,126 @@ def _png_html(fig, title="Chart"):
 """
     return HttpResponse(html, content_type="text/html; charset=utf-8")
 
+@admin_required
 def chart_view(request, chart_type: str):
+    """
+    Serves a chart as PNG-in-HTML (default), as image/png with format=png, or
+    as its aggregated series with format=json for clients that draw natively.
+    Rendered PNGs are cached per data version, and responses carry an ETag
+    so clients revalidate with a single fingerprint query.
+    """
     try:
         start, end = _date_range(request.GET)
     except Exception as e:
         return HttpResponse(f"<p>Error: {str(e)}</p>", status=400)
 
     ct = chart_type.lower()
+    title = CHART_TITLES.get(ct)
+    if title is None:
+        return HttpResponse(f"<p>Unknown chart type: {chart_type}</p>", status=400)
+
+    fmt = (request.GET.get("format") or "html").lower()
+    rng = (request.GET.get("range") or "today").lower()
+    key = cache_key(ct, rng, start, end, _run(data_version, start, end))
+    # JSON and image bodies differ, so they get different validators
+    etag = etag_for(key + ("json",)) if fmt == "json" else etag_for(key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        response = not_modified
+    elif fmt == "json":
+        data = _chart_data(ct, start, end)
+        response = JsonResponse({
+            "chart": ct, "title": title, "start": start.date().isoformat(),
+            "end": (end - dt.timedelta(days=1)).date().isoformat(), **data,
+        })
+    else:
+        png = _chart_cache.get(key)
+        if png is None:
+            png = _png_bytes(_draw_chart(ct, _chart_data(ct, start, end)))
+            _chart_cache.set(key, png)
+        response = HttpResponse(png, content_type="image/png") if fmt == "png" else _png_html(png, title)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
 
+def _chart_data(ct: str, start: dt.datetime, end: dt.datetime) -> Dict[str, Any]:
+    """
+    Queries the aggregated series for chart `ct` as
+    {"labels": [...], "series": [{"name": ..., "values": [...]}, ...]}.
+    """
     if ct == "order-status":
         rows = _fetchall("""
             SELECT COALESCE(NULLIF(TRIM(lower(order_status)),'') , lower(status)) AS s, COUNT(*)::int AS c
             FROM public.orders WHERE created_at >= %s AND created_at < %s GROUP BY 1 ORDER BY 2 DESC
         """, (start, end))
-        labels = [ (r["s"] or "unknown") for r in rows ]
-        sizes = [ r["c"] for r in rows ]
+        return {
+            "labels": [ (r["s"] or "unknown") for r in rows ],
+            "series": [{ "name": "Orders", "values": [ r["c"] for r in rows ] }],
+        }
+
+    elif ct == "top-menu":
+        rows = _run(item_totals, orders_where(start, end), limit=10, missing_quantity=1)
+        return {
+            "labels": [ name for name, _ in rows ],
+            "series": [{ "name": "Qty", "values": [ qty for _, qty in rows ] }],
+        }
+
+    elif ct == "menu-by-hour":
+        counts = dict(_run(hourly_order_counts, orders_where(start, end)))
+        hours = list(range(0,24))
+        return {
+            "labels": hours,
+            "series": [{ "name": "Orders", "values": [ counts.get(h,0) for h in hours ] }],
+        }
+
+    elif ct == "day-wise-menu":
+        day_rows = [
+            { "day": day, "name": name, "qty": qty }
+            for day, name, qty in _run(daily_item_totals, orders_where(start, end), missing_quantity=1)
+        ]
+        totals = {}
+        for r in day_rows: totals[r["name"]] = totals.get(r["name"],0) + int(r["qty"])
+        top = [nm for nm,_ in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:5]]
+        days = sorted({ r["day"] for r in day_rows })
+        series = { nm:[0]*len(days) for nm in top }
+        day_idx = { d:i for i,d in enumerate(days) }
+        for r in day_rows:
+            if r["name"] in series:
+                series[r["name"]][day_idx[r["day"]]] += int(r["qty"])
+        return {
+            "labels": [ d.isoformat() for d in days ],
+            "series": [ { "name": nm, "values": vals } for nm, vals in series.items() ],
+        }
+
+    elif ct == "day-wise-orders-revenue":
+        rows = _fetchall("""
+            SELECT date_trunc('day', created_at)::date AS day,
+                   COUNT(*)::int AS orders, COALESCE(SUM(total_price),0)::float AS revenue
+            FROM public.orders WHERE created_at >= %s AND created_at < %s GROUP BY 1 ORDER BY 1
+        """, (start, end))
+        return {
+            "labels": [ r["day"].isoformat() for r in rows ],
+            "series": [
+                { "name": "Orders", "values": [ r["orders"] for r in rows ] },
+                { "name": "Revenue", "values": [ round(r["revenue"], 2) for r in rows ] },
+            ],
+        }
+
+    raise ValueError(f"Unknown chart type: {ct}")
+
+def _no_data_figure(figsize):
+    plt, _, _ = _charting_modules()
+    fig, ax = plt.subplots(figsize=figsize); ax.text(0.5,0.5,"No data", ha="center", va="center"); ax.axis("off")
+    return fig
+
+def _draw_chart(ct: str, data: Dict[str, Any]):
+    """Draws the series from _chart_data() and returns the matplotlib figure."""
+    plt, mdates, np = _charting_modules()
+    labels = data["labels"]
+    series = data["series"]
+
+    if ct == "order-status":
+        sizes = series[0]["values"]
         if not labels: labels, sizes = ["no data"], [1]
         fig, ax = plt.subplots(figsize=(8,3.5))
         
@@ -193,16 +347,11 @@ def chart_view(request, chart_type: str):
         wedges, texts, autotexts = ax.pie(sizes, labels=labels, autopct=make_autopct(sizes), startangle=140, textprops={'fontsize': 8})
         plt.setp(autotexts, size=7, weight="bold", color="white")
         # ax.set_title("Order Status")
-        return _png_html(fig, "Order Status")
+        return fig
 
     elif ct == "top-menu":
-        rows = _fetchall("""
-            SELECT it->>'name' AS name, SUM(COALESCE((it->>'quantity')::int,1))::int AS qty
-            FROM public.orders o CROSS JOIN LATERAL jsonb_array_elements(o.items::jsonb) it
-            WHERE o.created_at >= %s AND o.created_at < %s GROUP BY 1 ORDER BY qty DESC LIMIT 10
-        """, (start, end))
-        names = [ r["name"] for r in rows ]
-        qtys = [ r["qty"] for r in rows ]
+        names = labels
+        qtys = series[0]["values"]
         if not names: names, qtys = ["no data"], [0]
         fig, ax = plt.subplots(figsize=(8,6))
         bars = ax.barh(names[::-1], qtys[::-1], color="#1e40af")
@@ -211,16 +360,11 @@ def chart_view(request, chart_type: str):
             ax.set_xlim(right=max(qtys) * 1.15)
         ax.set_xlabel("Qty")
         # ax.set_title("Top Menu Items")
-        return _png_html(fig, "Top Menu Items")
+        return fig
 
     elif ct == "menu-by-hour":
-        rows = _fetchall("""
-            SELECT EXTRACT(HOUR FROM created_at)::int AS hr, COUNT(*)::int AS c
-            FROM public.orders WHERE created_at >= %s AND created_at < %s GROUP BY 1 ORDER BY 1
-        """, (start, end))
-        counts = { r["hr"]: r["c"] for r in rows }
-        xs = list(range(0,24))
-        ys = [ counts.get(h,0) for h in xs ]
+        xs = labels
+        ys = series[0]["values"]
         fig, ax = plt.subplots(figsize=(8,3.5))
         ax.plot(xs, ys, marker="o", color="#1e40af")
         for i, (x, y) in enumerate(zip(xs, ys)):
@@ -235,55 +379,35 @@ def chart_view(request, chart_type: str):
         ax.set_xlabel("Hour of Day")
         ax.set_ylabel("Orders")
         # ax.set_title("Orders by Hour (All Menu)")
-        return _png_html(fig, "Orders by Hour")
+        return fig
 
     elif ct == "day-wise-menu":
-        day_rows = _fetchall("""
-            SELECT date_trunc('day', o.created_at)::date AS day, it->>'name' AS name,
-                   SUM(COALESCE((it->>'quantity')::int,1))::int AS qty
-            FROM public.orders o CROSS JOIN LATERAL jsonb_array_elements(o.items::jsonb) it
-            WHERE o.created_at >= %s AND o.created_at < %s GROUP BY 1,2 ORDER BY 1,3 DESC
-        """, (start, end))
-        totals = {}
-        for r in day_rows: totals[r["name"]] = totals.get(r["name"],0) + int(r["qty"])
-        top = [nm for nm,_ in sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:5]]
-        days = sorted({ r["day"] for r in day_rows })
-        series = { nm:[0]*len(days) for nm in top }
-        day_idx = { d:i for i,d in enumerate(days) }
-        for r in day_rows:
-            if r["name"] in series:
-                series[r["name"]][day_idx[r["day"]]] += int(r["qty"])
-        if not days:
-            fig, ax = plt.subplots(figsize=(8,6)); ax.text(0.5,0.5,"No data", ha="center", va="center"); ax.axis("off")
-            return _png_html(fig, "Day-wise Menu")
+        if not labels:
+            return _no_data_figure((8,6))
+        days = [ dt.date.fromisoformat(d) for d in labels ]
         fig, ax = plt.subplots(figsize=(8,6))
         x = np.arange(len(days))
         bottom = np.zeros(len(days))
         colors = ["#1e40af","#059669","#374151","#93c5fd","#a7f3d0"]
-        for idx, (nm, vals) in enumerate(series.items()):
+        for idx, s in enumerate(series):
+            nm, vals = s["name"], s["values"]
             bars = ax.bar(x, vals, bottom=bottom, label=nm, color=colors[idx % len(colors)])
-            labels = [f'{v}' if v > (sum(bottom) + max(vals))*0.05 else '' for v in vals]
-            ax.bar_label(bars, labels=labels, label_type='center', fmt='%d', fontsize=7, color='white', weight='bold')
+            bar_labels = [f'{v}' if v > (sum(bottom) + max(vals))*0.05 else '' for v in vals]
+            ax.bar_label(bars, labels=bar_labels, label_type='center', fmt='%d', fontsize=7, color='white', weight='bold')
             bottom += np.array(vals)
         ax.set_xticks(x)
         ax.set_xticklabels([d.strftime("%m-%d") for d in days], rotation=45, ha="right")
         ax.set_ylabel("Qty")
         # ax.set_title("Day-wise Menu (Top 5)")
         ax.legend(fontsize=8, ncols=2)
-        return _png_html(fig, "Day-wise Menu")
+        return fig
 
     elif ct == "day-wise-orders-revenue":
-        rows = _fetchall("""
-            SELECT date_trunc('day', created_at)::date AS day,
-                   COUNT(*)::int AS orders, COALESCE(SUM(total_price),0)::float AS revenue
-            FROM public.orders WHERE created_at >= %s AND created_at < %s GROUP BY 1 ORDER BY 1
-        """, (start, end))
-        if not rows:
-            fig, ax = plt.subplots(figsize=(8,3.5)); ax.text(0.5,0.5,"No data", ha="center", va="center"); ax.axis("off")
-            return _png_html(fig, "Day-wise Orders & Revenue")
-        days = [ r["day"] for r in rows ]
-        orders = [ r["orders"] for r in rows ]
-        revenue = [ r["revenue"] for r in rows ]
+        if not labels:
+            return _no_data_figure((8,3.5))
+        days = [ dt.date.fromisoformat(d) for d in labels ]
+        orders = series[0]["values"]
+        revenue = series[1]["values"]
         fig, ax1 = plt.subplots(figsize=(8,3.5))
         ax1.plot(days, orders, color="#1e40af", marker="o", label="Orders")
         for day, order_count in zip(days, orders):
@@ -300,12 +424,16 @@ def chart_view(request, chart_type: str):
         # Format the x-axis to show month-day
         ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
         fig.autofmt_xdate(rotation=45)
-        return _png_html(fig, "Day-wise Orders & Revenue")
+        return fig
 
-    else:
-        return HttpResponse(f"<p>Unknown chart type: {chart_type}</p>", status=400)
+    raise ValueError(f"Unknown chart type: {ct}")
+
+@admin_required
+def pool_stats_view(request):
+    return JsonResponse({**_pool.stats(), "chart_cache": _chart_cache.stats()})
 
 urlpatterns = [
     path("data", analytics_data_view, name="analytics-data"),
+    path("pool-stats", pool_stats_view, name="analytics-pool-stats"),
     path("chart/<str:chart_type>", chart_view, name="analytics-chart"),
 ]
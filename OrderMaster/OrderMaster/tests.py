@@ -1,3 +1,1383 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import bcrypt
+import psycopg2
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import firebase_admin
+from firebase_admin import messaging
+from shared.firebase_client import FakeFirebaseClient, FirebaseClient, set_client
+from shared.passwords import PasswordHasher, PasswordHasherBusy, hash_rounds, set_hasher
+
+from .models import MenuItem, Order, OrderLine, NotificationOutbox, VlhAdmin, DailyRevenue, DailyItemSales, get_ist_now
+from .events import get_broker, order_event, stream_events
+from .db_pool import ConnectionPool, PoolTimeout
+from .chart_cache import ChartCache
+from .scripts import analytics_views
+from .analytics_queries import daily_item_totals, hourly_order_counts, item_totals, orders_where
+from .order_export import aiter_export
+from .order_lines import backfill_order_lines
+from .order_stats import get_order_stats
+from .sales_rollup import COMPLETED_SALE_Q, apply_order, rebuild_rollup
+from .notifications import drain_outbox, outbox_stats, prune_outbox, request_drain, MAX_ATTEMPTS
+from .order_service import (
+    ACTIVE_ORDER_STATUSES, validate_cart, create_order, allocate_order_id, format_order_id, parse_order_id,
+    OrderValidationError,
+)
+
+
+def make_menu(count):
+    return [
+        MenuItem.objects.create(
+            item_name=f'Item {i}', price=Decimal('10.00') + i, category='Main Course',
+            veg_nonveg='Veg', meal_type='Lunch',
+        )
+        for i in range(count)
+    ]
+
+
+class AdminSessionMixin:
+    def login_admin(self):
+        session = self.client.session
+        session['is_authenticated'] = True
+        session['admin_mobile'] = '9876543210'
+        session.save()
+
+
+class ValidateCartTests(TestCase):
+    def setUp(self):
+        self.menu = make_menu(12)
+
+    def test_prices_lines_from_menu(self):
+        items, subtotal = validate_cart([
+            {'id': self.menu[0].id, 'quantity': 2, 'price': 1},
+            {'id': str(self.menu[1].id), 'quantity': '1'},
+        ])
+        self.assertEqual(subtotal, Decimal('31.00'))
+        self.assertEqual(items[0], {'id': self.menu[0].id, 'name': 'Item 0', 'price': 10.0, 'quantity': 2})
+        self.assertEqual(items[1]['quantity'], 1)
+
+    def test_skips_non_positive_quantities(self):
+        items, subtotal = validate_cart([
+            {'id': self.menu[0].id, 'quantity': 0},
+            {'id': self.menu[1].id, 'quantity': 1},
+        ])
+        self.assertEqual([i['id'] for i in items], [self.menu[1].id])
+        self.assertEqual(subtotal, Decimal('11.00'))
+
+    def test_rejects_bad_carts(self):
+        bad_carts = [
+            [],
+            'not-a-list',
+            [{'id': self.menu[0].id}],
+            [{'id': self.menu[0].id, 'quantity': 'two'}],
+            [{'id': 999999, 'quantity': 1}],
+            [{'id': self.menu[0].id, 'quantity': 0}],
+        ]
+        for cart in bad_carts:
+            with self.subTest(cart=cart):
+                with self.assertRaises(OrderValidationError):
+                    validate_cart(cart)
+
+    def test_single_query_regardless_of_cart_size(self):
+        for size in (1, 5, 12):
+            cart = [{'id': item.id, 'quantity': 1} for item in self.menu[:size]]
+            with self.assertNumQueries(1):
+                validate_cart(cart)
+
+
+class FakeMessaging:
+    """Offline stand-in for firebase_admin.messaging.send_each."""
+    batches = []
+    fail_topics = set()
+
+    def send_each(self, messages):
+        FakeMessaging.batches.append(messages)
+        return messaging.BatchResponse([
+            messaging.SendResponse(None, Exception('unavailable')) if message.topic in self.fail_topics
+            else messaging.SendResponse({'name': f'projects/test/messages/{i}'}, None)
+            for i, message in enumerate(messages)
+        ])
+
+    @classmethod
+    def reset(cls):
+        cls.batches = []
+        cls.fail_topics = set()
+
+
+class PlaceOrderQueryCountTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.menu = make_menu(12)
+
+    def cart(self, size):
+        return [{'id': item.id, 'quantity': 1} for item in self.menu[:size]]
+
+    def test_customer_order_query_count_is_flat(self):
+        for size in (1, 12):
+            payload = {
+                'customer_name': 'Asha', 'customer_mobile': '9876543210',
+                'items': self.cart(size), 'total_price': 0, 'payment_method': 'cash',
+            }
+            # Cart lookup, nextval, order INSERT, order_lines INSERT, outbox
+            # INSERT and the SAVEPOINT/RELEASE pairs of the test transaction
+            with self.assertNumQueries(9):
+                response = self.client.post(reverse('api_place_order'), json.dumps(payload),
+                                            content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_counter_order_query_count_is_flat(self):
+        self.login_admin()
+        for size in (1, 12):
+            payload = {
+                'customer_name': 'Walk-in', 'customer_mobile': '9876543210',
+                'items': self.cart(size), 'payment_method': 'upi',
+            }
+            # One extra query loads the admin session, and two upsert the
+            # sales rollups (the item upsert is a single executemany)
+            with self.assertNumQueries(12):
+                response = self.client.post(reverse('api_create_manual_order'), json.dumps(payload),
+                                            content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        order = Order.objects.order_by('-id').first()
+        self.assertEqual(len(order.items), 12)
+        self.assertEqual(order.payment_method, 'Online')
+
+
+class OrderIdAllocationTests(TestCase):
+    def test_ids_are_unique_eight_digit_and_reversible(self):
+        seen = set()
+        for value in range(1, 20001):
+            order_id = format_order_id(value)
+            self.assertEqual(len(order_id), 8)
+            self.assertEqual(parse_order_id(order_id), value)
+            seen.add(order_id)
+        self.assertEqual(len(seen), 20000)
+
+    def test_extremes_of_sequence(self):
+        for value in (1, 90000000):
+            self.assertEqual(parse_order_id(format_order_id(value)), value)
+        with self.assertRaises(ValueError):
+            format_order_id(90000001)
+
+    def test_allocation_comes_from_sequence(self):
+        first = allocate_order_id()
+        second = allocate_order_id()
+        self.assertEqual(parse_order_id(second), parse_order_id(first) + 1)
+
+    def order_fields(self):
+        return dict(
+            customer_name='Asha', customer_mobile='9876543210', items=[],
+            subtotal=Decimal('10.00'), total_price=Decimal('10.00'), payment_method='Cash',
+        )
+
+    def test_create_order_is_a_single_insert(self):
+        with self.assertNumQueries(5):  # nextval, SAVEPOINT, INSERT, order_lines INSERT, RELEASE
+            order = create_order(**self.order_fields())
+        order.refresh_from_db()
+        self.assertEqual(len(order.order_id), 8)
+
+    def test_skips_ids_taken_by_legacy_orders(self):
+        upcoming = format_order_id(parse_order_id(allocate_order_id()) + 1)
+        Order.objects.create(order_id=upcoming, **self.order_fields())
+
+        order = create_order(**self.order_fields())
+        self.assertNotEqual(order.order_id, upcoming)
+        self.assertEqual(Order.objects.filter(order_id=upcoming).count(), 1)
+
+
+class NotificationOutboxTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        FakeMessaging.reset()
+        self.menu = make_menu(2)
+
+    def place_order(self):
+        payload = {
+            'customer_name': 'Asha', 'customer_mobile': '9876543210',
+            'items': [{'id': self.menu[0].id, 'quantity': 2}], 'total_price': 0, 'payment_method': 'cash',
+        }
+        return self.client.post(reverse('api_place_order'), json.dumps(payload), content_type='application/json')
+
+    def test_order_enqueues_instead_of_sending(self):
+        response = self.place_order()
+        order_id = response.json()['order_id']
+
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.status, 'pending')
+        self.assertEqual(entry.topic, 'new_orders')
+        self.assertEqual(entry.data['order_id'], order_id)
+        self.assertEqual(entry.data['status'], 'pending')
+        self.assertTrue(all(isinstance(value, str) for value in entry.data.values()))
+        self.assertEqual(FakeMessaging.batches, [])
+
+    def test_order_action_enqueues_update(self):
+        self.place_order()
+        order = Order.objects.get()
+        self.login_admin()
+        self.client.post(reverse('handle_order_action'), json.dumps({'order_id': order.pk, 'action': 'accept'}),
+                         content_type='application/json')
+        update = NotificationOutbox.objects.order_by('-id').first()
+        self.assertEqual(update.data, {
+            'type': 'order_update', 'order_pk': str(order.pk),
+            'order_id': order.order_id, 'new_status': 'open',
+        })
+        self.assertIsNone(update.title)
+
+    def test_drain_sends_one_batch(self):
+        for _ in range(3):
+            self.place_order()
+        self.assertEqual(drain_outbox(batch_size=10, backend=FakeMessaging()), 3)
+
+        self.assertEqual(len(FakeMessaging.batches), 1)
+        message = FakeMessaging.batches[0][0]
+        self.assertEqual(message.topic, 'new_orders')
+        self.assertTrue(message.notification.title.startswith('🔔'))
+        self.assertEqual(NotificationOutbox.objects.filter(status='sent').count(), 3)
+        self.assertEqual(drain_outbox(backend=FakeMessaging()), 0)
+
+    def test_failures_back_off_then_give_up(self):
+        entry = NotificationOutbox.objects.create(topic='broken', data={'k': 'v'})
+        FakeMessaging.fail_topics = {'broken'}
+
+        drain_outbox(backend=FakeMessaging())
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+        self.assertGreater(entry.next_attempt_at, get_ist_now())
+        self.assertEqual(drain_outbox(backend=FakeMessaging()), 0)  # not due yet
+
+        NotificationOutbox.objects.filter(pk=entry.pk).update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=get_ist_now())
+        drain_outbox(backend=FakeMessaging())
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'failed')
+        self.assertEqual(entry.last_error, 'unavailable')
+
+    def test_batch_is_sent_outside_the_claiming_transaction(self):
+        NotificationOutbox.objects.create(topic='new_orders', data={'k': 'v'})
+        depth = len(connection.savepoint_ids)
+        seen = {}
+
+        class InspectingMessaging(FakeMessaging):
+            def send_each(self, messages):
+                seen['savepoints'] = len(connection.savepoint_ids)
+                seen['second_drain'] = drain_outbox(backend=FakeMessaging())  # The claimed row is leased
+                return super().send_each(messages)
+
+        self.assertEqual(drain_outbox(backend=InspectingMessaging()), 1)
+        self.assertEqual(seen, {'savepoints': depth, 'second_drain': 0})
+        self.assertEqual(NotificationOutbox.objects.get().status, 'sent')
+
+    def test_prune_deletes_only_old_sent_rows(self):
+        old = get_ist_now() - timedelta(days=8)
+        NotificationOutbox.objects.create(topic='a', status='sent', sent_at=old)
+        recent = NotificationOutbox.objects.create(topic='b', status='sent', sent_at=get_ist_now())
+        failed = NotificationOutbox.objects.create(topic='c', status='failed', created_at=old)
+        self.assertEqual(prune_outbox(retention_days=7), 1)
+        self.assertEqual(set(NotificationOutbox.objects.values_list('pk', flat=True)), {recent.pk, failed.pk})
+
+    def test_commit_wakes_the_background_drain_unless_disabled(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.place_order()
+        self.assertIn(request_drain, callbacks)
+        with override_settings(NOTIFICATION_DRAIN_ON_COMMIT=False), self.captureOnCommitCallbacks() as callbacks:
+            self.place_order()
+        self.assertNotIn(request_drain, callbacks)
+
+    @override_settings(NOTIFICATION_BACKEND='OrderMaster.tests.FakeMessaging')
+    def test_worker_command_and_stats(self):
+        for _ in range(3):
+            self.place_order()
+        NotificationOutbox.objects.update(created_at=get_ist_now() - timedelta(seconds=30))
+
+        stats = outbox_stats()
+        self.assertEqual(stats['pending'], 3)
+        self.assertGreaterEqual(stats['oldest_pending_age_seconds'], 30)
+
+        out = StringIO()
+        call_command('notification_worker', '--once', '--batch-size', '2', stdout=out)
+        self.assertIn('Processed 3 notifications', out.getvalue())
+        self.assertEqual([len(batch) for batch in FakeMessaging.batches], [2, 1])
+
+        stats = outbox_stats()
+        self.assertEqual((stats['pending'], stats['sent_last_window']), (0, 3))
+        self.assertGreaterEqual(stats['avg_latency_seconds'], 30)
+
+        self.login_admin()
+        self.assertEqual(self.client.get(reverse('notification_stats_api')).json()['pending'], 0)
+
+
+class MenuSnapshotTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.menu = make_menu(3)
+
+    def get_menu(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('api_menu_items'), **headers)
+
+    def test_payload_and_revalidation(self):
+        response = self.get_menu()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        items = response.json()['menu_items']
+        self.assertEqual([item['item_name'] for item in items], ['Item 0', 'Item 1', 'Item 2'])
+        self.assertEqual(items[0]['price'], 10.0)
+        self.assertEqual(items[0]['description'], '')
+
+        etag = response['ETag']
+        with self.assertNumQueries(1):  # version lookup only
+            not_modified = self.get_menu(etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_every_write_path_changes_the_etag(self):
+        self.login_admin()
+        item = self.menu[0]
+        writes = [
+            lambda: self.client.post(reverse('api_menu_items'), json.dumps(
+                {'item_name': 'Tea', 'price': '15', 'category': 'Beverages'}), content_type='application/json'),
+            lambda: self.client.put(reverse('api_menu_item_detail', args=[item.id]), json.dumps(
+                {'price': '99'}), content_type='application/json'),
+            lambda: self.client.post(reverse('edit_menu_item', args=[item.id]), {
+                'item_name': 'Renamed', 'price': '99', 'category': 'Main Course', 'veg_nonveg': 'Veg',
+                'meal_type': 'Lunch'}),
+            lambda: self.client.post(reverse('delete_menu_item', args=[self.menu[1].id])),
+            lambda: self.client.delete(reverse('api_menu_item_detail', args=[self.menu[2].id])),
+        ]
+        etag = self.get_menu()['ETag']
+        for write in writes:
+            self.assertLess(write().status_code, 400)
+            response = self.get_menu(etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+        names = [item['item_name'] for item in self.get_menu().json()['menu_items']]
+        self.assertEqual(names, ['Tea', 'Renamed'])  # Beverages sort first
+
+
+class PendingOrdersDeltaTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        self.long_ago = get_ist_now() - timedelta(hours=1)
+        fields = dict(customer_mobile='9876543210', items=[], subtotal=Decimal('10.00'),
+                      total_price=Decimal('10.00'), payment_method='Cash',
+                      created_at=self.long_ago, updated_at=self.long_ago)
+        self.online = Order.objects.create(order_id='10000001', customer_name='A', order_status='open', **fields)
+        self.counter = Order.objects.create(order_id='10000002', customer_name='B', order_status='ready',
+                                            order_placed_by='counter', **fields)
+        Order.objects.create(order_id='10000003', customer_name='C', order_status='pickedup', **fields)
+
+    def poll(self, since=None):
+        params = {'since': since} if since else {}
+        return self.client.get(reverse('get_pending_orders'), params).json()
+
+    def test_full_poll_returns_active_orders_and_cursor(self):
+        data = self.poll()
+        self.assertEqual([o['id'] for o in data['online_orders']], [self.online.id])
+        self.assertEqual([o['id'] for o in data['counter_orders']], [self.counter.id])
+        self.assertIn('cursor', data)
+        self.assertNotIn('removed', data)
+
+    def test_quiet_delta_poll_is_empty(self):
+        data = self.poll(self.poll()['cursor'])
+        self.assertEqual((data['online_orders'], data['counter_orders'], data['removed']), ([], [], []))
+
+    def test_status_changes_show_up_as_updates_and_tombstones(self):
+        cursor = self.poll()['cursor']
+        self.client.post(reverse('update_order_status'), json.dumps({'id': self.online.id, 'status': 'ready'}),
+                         content_type='application/json')
+        self.client.post(reverse('update_order_status'), json.dumps({'id': self.counter.id, 'status': 'pickedup'}),
+                         content_type='application/json')
+
+        data = self.poll(cursor)
+        self.assertEqual([(o['id'], o['order_status']) for o in data['online_orders']], [(self.online.id, 'ready')])
+        self.assertEqual(data['counter_orders'], [])
+        self.assertEqual(data['removed'], [self.counter.id])
+
+    def test_rejecting_an_order_tombstones_it(self):
+        cursor = self.poll()['cursor']
+        self.client.post(reverse('handle_order_action'), json.dumps({'order_id': self.online.id, 'action': 'reject'}),
+                         content_type='application/json')
+        self.assertEqual(self.poll(cursor)['removed'], [self.online.id])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('get_pending_orders'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ORDER_EVENTS_BROKER='memory')
+class OrderEventsStreamTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        self.broker = get_broker()
+        long_ago = get_ist_now() - timedelta(hours=1)
+        self.order = Order.objects.create(
+            order_id='10000001', customer_name='A', customer_mobile='9876543210', items=[],
+            subtotal=Decimal('10.00'), total_price=Decimal('10.00'), payment_method='Cash',
+            order_status='open', created_at=long_ago, updated_at=long_ago,
+        )
+
+    def read_events(self, response):
+        events = []
+        for frame in b''.join(response.streaming_content).decode().split('\n\n'):
+            for line in frame.splitlines():
+                if line.startswith('data: '):
+                    events.append(json.loads(line[len('data: '):]))
+        return events
+
+    def test_status_change_is_published_after_commit(self):
+        subscription = self.broker.subscribe()
+        self.addCleanup(self.broker.unsubscribe, subscription)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('update_order_status'), json.dumps({'id': self.order.id, 'status': 'ready'}),
+                             content_type='application/json')
+
+        event = subscription.get(timeout=0)
+        self.assertEqual((event['type'], event['id'], event['order_status']), ('order_updated', self.order.id, 'ready'))
+        self.assertEqual(event['order']['order_status'], 'ready')
+
+    def test_reconnect_replays_changes_since_last_event_id(self):
+        cursor = get_ist_now() - timedelta(minutes=1)
+        self.client.post(reverse('update_order_status'), json.dumps({'id': self.order.id, 'status': 'pickedup'}),
+                         content_type='application/json')
+
+        response = self.client.get(reverse('order_events_stream'), HTTP_LAST_EVENT_ID=cursor.isoformat())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.read_events(response)
+        self.assertEqual([(e['id'], e['order_status'], e['order']) for e in events], [(self.order.id, 'pickedup', None)])
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_long_poll_returns_live_event(self):
+        response = self.client.get(reverse('order_events_stream'))
+        self.broker.publish(order_event('order_created', self.order))
+        self.assertEqual([e['type'] for e in self.read_events(response)], ['order_created'])
+
+    @mock.patch('OrderMaster.events.LONG_POLL_SECONDS', 0.05)
+    def test_long_poll_times_out_with_a_resume_cursor(self):
+        body = b''.join(self.client.get(reverse('order_events_stream')).streaming_content).decode()
+        self.assertIn('retry: ', body)
+        self.assertIn('id: ', body)
+        self.assertNotIn('data: ', body)
+
+    def test_async_stream_delivers_events_published_from_other_threads(self):
+        subscription = self.broker.subscribe()
+        event = order_event('order_created', self.order)
+
+        async def read():
+            body = stream_events(self.broker, subscription, [], 'cursor')
+            frames = [await body.__anext__()]
+            threading.Timer(0.05, self.broker.publish, [event]).start()
+            frames.append(await body.__anext__())
+            await body.aclose()
+            return frames
+
+        frames = asyncio.run(read())
+        self.assertTrue(frames[0].startswith(b'retry: '))
+        self.assertIn(b'event: order_created', frames[1])
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_a_subscriber_with_a_closed_loop_does_not_stop_delivery(self):
+        stale, live = self.broker.subscribe(), self.broker.subscribe()
+        self.addCleanup(self.broker.unsubscribe, stale)
+        self.addCleanup(self.broker.unsubscribe, live)
+        asyncio.run(stale.aget(0))  # binds the subscription to a loop that is then closed
+
+        event = order_event('order_created', self.order)
+        self.broker.deliver(event)
+        self.assertEqual(live.get(timeout=0), event)
+        self.assertEqual(stale.get(timeout=0), event)
+
+    def test_requires_login(self):
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('order_events_stream')).status_code, 302)
+
+
+class AllOrdersPaginationTests(TestCase):
+    def setUp(self):
+        created_at = get_ist_now() - timedelta(days=1)
+        fields = dict(customer_name='A', customer_mobile='9876543210', items=[{'id': 1, 'quantity': 1}],
+                      subtotal=Decimal('10.00'), total_price=Decimal('10.00'), payment_method='Cash')
+        # Pairs of orders share a timestamp so the id tiebreak is exercised
+        self.orders = [
+            Order.objects.create(order_id=f'1000000{i}', created_at=created_at + timedelta(minutes=i // 2), **fields)
+            for i in range(7)
+        ]
+
+    def get_page(self, **params):
+        params = {'date_filter': 'custom', 'start_date': '2000-01-01', 'end_date': '2100-01-01', **params}
+        return self.client.get(reverse('api_all_orders'), params)
+
+    def test_pages_cover_every_order_once_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            data = self.get_page(limit=3, **({'cursor': cursor} if cursor else {})).json()
+            seen.extend(o['id'] for o in data['orders'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        expected = [o.id for o in sorted(self.orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    @mock.patch('OrderMaster.views.ORDER_PAGE_SIZE', 3)
+    def test_without_limit_or_cursor_returns_every_order(self):
+        data = self.get_page().json()
+        self.assertEqual(data['count'], len(self.orders))
+        self.assertEqual({o['id'] for o in data['orders']}, {o.id for o in self.orders})
+        self.assertIsNone(data['next_cursor'])
+
+    def test_fields_projection_skips_unrequested_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_page(fields='order_id,total_price').json()
+        self.assertEqual(data['orders'][0].keys(), {'order_id', 'total_price'})
+        self.assertEqual(len(ctx.captured_queries), 1)  # No separate COUNT
+        self.assertNotIn('"items"', ctx.captured_queries[0]['sql'])
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'cursor': 'garbage'}, {'limit': '0'}, {'fields': 'order_id,password'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get_page(**params).status_code, 400)
+
+
+class OrderExportTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        fields = dict(customer_mobile='9876543210', subtotal=Decimal('30.00'), total_price=Decimal('30.00'),
+                      payment_method='Cash')
+        self.first = Order.objects.create(
+            order_id='10000001', customer_name='A', created_at=datetime(2026, 1, 1, 9, 0),
+            items=[{'id': 1, 'name': 'Thali', 'price': 10.0, 'quantity': 2}, {'id': 2, 'name': 'Tea', 'price': 10.0, 'quantity': 1}],
+            **fields,
+        )
+        self.second = Order.objects.create(
+            order_id='10000002', customer_name='B', created_at=datetime(2026, 1, 31, 23, 0), items='not json', **fields,
+        )
+        Order.objects.create(order_id='10000003', customer_name='C', created_at=datetime(2026, 2, 1, 0, 0),
+                             items=[], **fields)
+
+    def export(self, **params):
+        params = {'start_date': '2026-01-01', 'end_date': '2026-01-31', **params}
+        return self.client.get(reverse('export_orders'), params)
+
+    def test_csv_has_one_row_per_order_line(self):
+        response = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(r['order_id'], r['item_name'], r['line_total']) for r in rows],
+                         [('10000001', 'Thali', '20.0'), ('10000001', 'Tea', '10.0'), ('10000002', '', '')])
+
+    def test_ndjson_has_one_order_per_line(self):
+        with mock.patch('OrderMaster.order_export.EXPORT_CHUNK_SIZE', 1):
+            response = self.export()
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        self.assertEqual([o['id'] for o in orders], [self.first.id, self.second.id])
+        self.assertEqual([i['quantity'] for i in orders[0]['items']], [2, 1])
+
+    def test_async_export_aborts_when_the_export_fails(self):
+        def failing_export(queryset, export_format):
+            yield b'first\n'
+            raise RuntimeError('connection lost')
+
+        async def read(received):
+            async for block in aiter_export(Order.objects.none(), 'csv'):
+                received.append(block)
+
+        received = []
+        with mock.patch('OrderMaster.order_export.iter_export', failing_export):
+            with self.assertRaisesMessage(RuntimeError, 'connection lost'):
+                asyncio.run(read(received))
+        self.assertEqual(received, [b'first\n'])
+
+    def test_async_export_stops_when_the_client_goes_away(self):
+        release = threading.Event()
+        producer_finished = threading.Event()
+
+        def slow_export(queryset, export_format):
+            try:
+                yield b'first\n'
+                release.wait(5)
+                yield b'second\n'
+            finally:
+                producer_finished.set()
+
+        async def disconnect_while_waiting():
+            stream = aiter_export(Order.objects.none(), 'csv')
+            self.assertEqual(await stream.__anext__(), b'first\n')
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(stream.__anext__(), 0.2)
+            await stream.aclose()
+
+        with mock.patch('OrderMaster.order_export.iter_export', slow_export):
+            # asyncio.run waits for the executor, so this returns only once the queue reader gave up
+            asyncio.run(asyncio.wait_for(disconnect_while_waiting(), 5))
+            release.set()
+            self.assertTrue(producer_finished.wait(5))
+
+    def test_rejects_bad_parameters(self):
+        for params in ({'format': 'xlsx'}, {'start_date': 'jan'}, {'start_date': '2026-02-01'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.export(**params).status_code, 400)
+
+
+class SalesRollupTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        self.menu = make_menu(3)
+
+    def place(self, url, items, payment_method='cash'):
+        payload = {'customer_name': 'Asha', 'customer_mobile': '9876543210', 'items': items,
+                   'total_price': 0, 'payment_method': payment_method}
+        response = self.client.post(reverse(url), json.dumps(payload), content_type='application/json')
+        return Order.objects.get(order_id=response.json()['order_id'])
+
+    def set_status(self, order, status):
+        self.client.post(reverse('update_order_status'), json.dumps({'id': order.id, 'status': status}),
+                         content_type='application/json')
+
+    def rollup_rows(self):
+        return (
+            sorted(DailyRevenue.objects.filter(orders__gt=0).values_list(
+                'day', 'hour', 'payment_method', 'order_placed_by', 'orders', 'revenue')),
+            sorted(DailyItemSales.objects.filter(quantity__gt=0).values_list(
+                'day', 'item_name', 'payment_method', 'order_placed_by', 'quantity', 'revenue')),
+        )
+
+    def test_incremental_updates_match_a_rebuild(self):
+        a, b, c = self.menu
+        self.place('api_create_manual_order', [{'id': a.id, 'quantity': 2}, {'id': b.id, 'quantity': 1}], 'upi')
+        self.place('api_create_manual_order', [{'id': a.id, 'quantity': 1}])
+        picked_up = self.place('api_place_order', [{'id': c.id, 'quantity': 3}])
+        self.set_status(picked_up, 'pickedup')
+        self.place('api_place_order', [{'id': b.id, 'quantity': 5}])  # Still open, so not a sale yet
+        reverted = self.place('api_place_order', [{'id': b.id, 'quantity': 1}])
+        self.set_status(reverted, 'pickedup')
+        self.set_status(reverted, 'ready')
+
+        incremental = self.rollup_rows()
+        self.assertEqual(rebuild_rollup(), 3)
+        self.assertEqual(self.rollup_rows(), incremental)
+        self.assertEqual(sum(row[4] for row in incremental[1] if row[1] == 'Item 1'), 1)
+
+    def test_status_changes_lock_the_order_row(self):
+        order = self.place('api_place_order', [{'id': self.menu[0].id, 'quantity': 1}])
+        with CaptureQueriesContext(connection) as ctx:
+            self.set_status(order, 'pickedup')
+        self.assertTrue(any('FOR UPDATE' in q['sql'] for q in ctx.captured_queries))
+        self.set_status(order, 'pickedup')  # A repeated pickup does not count the sale again
+        self.assertEqual(DailyRevenue.objects.get(orders__gt=0).orders, 1)
+
+    def test_rejecting_an_order_goes_through_the_rollup(self):
+        order = self.place('api_place_order', [{'id': self.menu[0].id, 'quantity': 2}])
+        self.set_status(order, 'pickedup')
+        self.assertEqual(self.rollup_rows()[1][0][4], 2)
+
+        self.client.post(reverse('handle_order_action'), json.dumps({'order_id': order.id, 'action': 'reject'}),
+                         content_type='application/json')
+        self.assertEqual(Order.objects.get(pk=order.pk).order_status, 'cancelled')
+        self.assertEqual(self.rollup_rows(), ([], []))
+        rebuild_rollup()
+        self.assertEqual(self.rollup_rows(), ([], []))
+
+    def test_analytics_api_reads_rollups(self):
+        a, b, _ = self.menu
+        self.place('api_create_manual_order', [{'id': a.id, 'quantity': 2}], 'upi')
+        self.place('api_create_manual_order', [{'id': b.id, 'quantity': 1}])
+
+        data = self.client.get(reverse('api_analytics'), {'date_filter': 'today'}).json()
+        self.assertEqual(data['key_metrics']['total_orders'], 2)
+        self.assertEqual(data['key_metrics']['total_revenue'], 31.0)
+        self.assertEqual(data['most_ordered_items'], {'labels': ['Item 0', 'Item 1'], 'data': [2, 1]})
+        self.assertEqual(data['payment_method_distribution']['labels'], ['online', 'cash'])
+        self.assertEqual(data['day_wise_menu']['datasets'][0]['data'], [2])
+
+        online = self.client.get(reverse('api_analytics'), {'date_filter': 'today', 'payment_filter': 'Online'}).json()
+        self.assertEqual(online['key_metrics']['total_orders'], 1)
+        self.assertEqual(len(online['table_data']), 1)
+
+
+class AnalyticsQueriesEquivalenceTests(TestCase):
+    """The SQL aggregations must match the Python loops they replaced."""
+
+    def setUp(self):
+        rng = random.Random(42)
+        names = ['Thali', 'Chapati', 'Dal Rice', 'Tea', 'Poha', 'Misal']
+        start = datetime(2026, 3, 1, 8, 0)
+        for i in range(120):
+            items = [
+                {'id': rng.randint(1, 50), 'name': rng.choice(names), 'price': rng.choice([10, 25.5, 60]),
+                 'quantity': rng.randint(1, 4)}
+                for _ in range(rng.randint(1, 4))
+            ]
+            Order.objects.create(
+                order_id=str(10000000 + i), customer_name='A', customer_mobile='9876543210',
+                # Some legacy rows store the items array as a JSON string
+                items=json.dumps(items) if i % 7 == 0 else items,
+                subtotal=Decimal('10.00'), total_price=Decimal('10.00'),
+                payment_method=rng.choice(['Cash', 'cash', 'Online']),
+                order_placed_by=rng.choice(['customer', 'counter']),
+                order_status=rng.choice(['open', 'ready', 'pickedup']),
+                created_at=start + timedelta(days=rng.randint(0, 9), hours=rng.randint(0, 12), minutes=rng.randint(0, 59)),
+            )
+        self.range = (start, start + timedelta(days=10))
+        backfill_order_lines(chunk_size=50)
+
+    @staticmethod
+    def items_of(order):
+        return json.loads(order.items) if isinstance(order.items, str) else order.items
+
+    def test_quantity_totals_match_python(self):
+        completed = Order.objects.filter(COMPLETED_SALE_Q, created_at__gte=self.range[0], created_at__lt=self.range[1])
+        expected = Counter()
+        for order in completed:
+            for item in self.items_of(order):
+                expected[item.get('name', 'Unknown')] += item.get('quantity', 0)
+
+        with connection.cursor() as cursor:
+            totals = item_totals(cursor, orders_where(*self.range, completed_sales=True))
+        self.assertEqual(dict(totals), dict(expected))
+        self.assertEqual([total for _, total in totals], sorted(expected.values(), reverse=True))
+
+    def test_line_counts_match_python(self):
+        expected = Counter(
+            item.get('name', 'Unknown')
+            for order in Order.objects.filter(order_status='pickedup', created_at__range=self.range)
+            for item in self.items_of(order)
+        )
+        with connection.cursor() as cursor:
+            totals = item_totals(cursor, orders_where(*self.range, order_status='pickedup'), measure='lines')
+        self.assertEqual(dict(totals), dict(expected))
+
+    def test_daily_and_hourly_totals_match_python(self):
+        orders = Order.objects.filter(created_at__gte=self.range[0], created_at__lt=self.range[1])
+        daily, hourly = Counter(), Counter()
+        for order in orders:
+            hourly[order.created_at.hour] += 1
+            for item in self.items_of(order):
+                daily[(order.created_at.date(), item['name'])] += item['quantity']
+
+        with connection.cursor() as cursor:
+            self.assertEqual({(day, name): qty for day, name, qty in daily_item_totals(cursor, orders_where(*self.range))},
+                             dict(daily))
+            self.assertEqual(dict(hourly_order_counts(cursor, orders_where(*self.range))), dict(hourly))
+
+    def test_sql_rebuild_matches_incremental_rollup(self):
+        for order in Order.objects.filter(COMPLETED_SALE_Q):
+            apply_order(order)
+        incremental = (
+            sorted(DailyRevenue.objects.values_list('day', 'hour', 'payment_method', 'order_placed_by', 'orders', 'revenue')),
+            sorted(DailyItemSales.objects.values_list('day', 'item_name', 'payment_method', 'order_placed_by', 'quantity', 'revenue')),
+        )
+        rebuild_rollup()
+        rebuilt = (
+            sorted(DailyRevenue.objects.values_list('day', 'hour', 'payment_method', 'order_placed_by', 'orders', 'revenue')),
+            sorted(DailyItemSales.objects.values_list('day', 'item_name', 'payment_method', 'order_placed_by', 'quantity', 'revenue')),
+        )
+        self.assertEqual(rebuilt, incremental)
+
+
+class ConnectionPoolTests(TestCase):
+    def make_pool(self, **kwargs):
+        params = connection.get_connection_params()
+        pool = ConnectionPool(lambda: psycopg2.connect(**params), **kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_reuses_connections(self):
+        pool = self.make_pool(max_size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            second.cursor().execute('SELECT 1')
+        self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['idle']), (2, 1, 1))
+
+    def test_waits_for_a_free_connection_then_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        with pool.connection():
+            with self.assertRaises(PoolTimeout):
+                with pool.connection():
+                    pass
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_replaces_expired_and_broken_connections(self):
+        pool = self.make_pool(max_lifetime=0)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)
+
+        pool = self.make_pool(health_check_after=0)
+        with pool.connection() as broken:
+            pass
+        broken.close()
+        with pool.connection() as replacement:
+            replacement.cursor().execute('SELECT 1')
+        self.assertIsNot(broken, replacement)
+
+    def test_rolls_back_on_error(self):
+        pool = self.make_pool()
+        with self.assertRaises(psycopg2.Error):
+            with pool.connection() as conn:
+                conn.cursor().execute('SELECT no_such_column FROM orders')
+        with pool.connection() as same:
+            same.cursor().execute('SELECT 1')
+        self.assertIs(conn, same)
+
+
+class AnalyticsAccessTests(TestCase):
+    def test_analytics_endpoints_require_an_admin_session(self):
+        urls = [reverse('analytics-data'), reverse('analytics-pool-stats'), reverse('analytics-chart', args=['top-menu'])]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertRedirects(self.client.get(url), reverse('login'), fetch_redirect_response=False)
+
+
+class ChartCacheTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+
+    def test_lru_is_capped_by_bytes_and_drops_superseded_versions(self):
+        charts = ChartCache(max_bytes=10)
+        charts.set(('top-menu', 'today', 'a', 'b', 'v1'), b'12345')
+        charts.set(('top-menu', 'today', 'a', 'b', 'v2'), b'6789')
+        self.assertIsNone(charts.get(('top-menu', 'today', 'a', 'b', 'v1')))
+        charts.set(('order-status', 'today', 'a', 'b', 'v1'), b'abcde')
+        charts.set(('menu-by-hour', 'today', 'a', 'b', 'v1'), b'xy')
+        self.assertIsNone(charts.get(('top-menu', 'today', 'a', 'b', 'v2')))
+        self.assertEqual(charts.get(('menu-by-hour', 'today', 'a', 'b', 'v1')), b'xy')
+        self.assertLessEqual(charts.stats()['bytes'], 10)
+
+    def test_disk_tier_survives_a_new_process_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ChartCache(directory=directory).set(('top-menu', 'week', 'a', 'b', 'v1'), b'png')
+            charts = ChartCache(directory=directory)
+            self.assertEqual(charts.get(('top-menu', 'week', 'a', 'b', 'v1')), b'png')
+            self.assertEqual(charts.stats()['disk_hits'], 1)
+
+    order_fields = dict(customer_name='A', customer_mobile='9876543210', items=[{'name': 'Tea', 'quantity': 1}],
+                        subtotal=Decimal('10.00'), total_price=Decimal('10.00'), payment_method='Cash',
+                        created_at=datetime(2026, 3, 1, 9, 0))
+    params = {'range': 'custom', 'start': '2026-03-01', 'end': '2026-03-01', 'format': 'png'}
+
+    @staticmethod
+    def run_on_test_db(query, *args, **kwargs):
+        # The analytics pool opens its own connections, which cannot see test transactions
+        with connection.cursor() as cursor:
+            return query(cursor, *args, **kwargs)
+
+    @staticmethod
+    def fetchall_on_test_db(sql, args):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, args)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def test_chart_view_renders_once_per_data_version(self):
+        fields = self.order_fields
+        Order.objects.create(order_id='10000001', **fields)
+        url = reverse('analytics-chart', args=['top-menu'])
+        params = self.params
+
+        with mock.patch.object(analytics_views, '_run', side_effect=self.run_on_test_db), \
+                mock.patch.object(analytics_views, '_chart_cache', ChartCache()), \
+                mock.patch.object(analytics_views, '_draw_chart', wraps=analytics_views._draw_chart) as draw:
+            first = self.client.get(url, params)
+            self.assertEqual(first['Content-Type'], 'image/png')
+            self.assertTrue(first.content.startswith(b'\x89PNG'))
+            again = self.client.get(url, params)
+            self.assertEqual(again.content, first.content)
+            self.assertEqual(draw.call_count, 1)
+
+            not_modified = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(not_modified.status_code, 304)
+
+            Order.objects.create(order_id='10000002', **fields)
+            changed = self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed['ETag'], first['ETag'])
+            self.assertEqual(draw.call_count, 2)
+
+            html = self.client.get(url, {**params, 'format': ''})
+            self.assertIn(b'data:image/png;base64,', html.content)
+            self.assertEqual(draw.call_count, 2)
+
+    def test_chart_view_matches_if_none_match_as_an_etag_list(self):
+        Order.objects.create(order_id='10000001', **self.order_fields)
+        url = reverse('analytics-chart', args=['top-menu'])
+        params = {**self.params, 'format': 'json'}
+        with mock.patch.object(analytics_views, '_run', side_effect=self.run_on_test_db):
+            etag = self.client.get(url, params)['ETag']
+            for header, status in [
+                (f'"other", W/{etag}', 304),
+                ('*', 304),
+                (f'"{etag}"', 200),  # Contains the quoted tag but is not it
+                (f'{etag[:-5]}"', 200),
+            ]:
+                with self.subTest(header=header):
+                    self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=header).status_code, status)
+
+    def test_json_mode_returns_series_without_drawing(self):
+        Order.objects.create(order_id='10000001', **self.order_fields)
+        Order.objects.create(order_id='10000002', **{**self.order_fields, 'created_at': datetime(2026, 3, 2, 13, 0)})
+        backfill_order_lines()
+        params = {**self.params, 'end': '2026-03-02'}
+
+        with mock.patch.object(analytics_views, '_run', side_effect=self.run_on_test_db), \
+                mock.patch.object(analytics_views, '_fetchall', side_effect=self.fetchall_on_test_db), \
+                mock.patch.object(analytics_views, '_chart_cache', ChartCache()):
+            with mock.patch.object(analytics_views, '_draw_chart') as draw:
+                charts = {
+                    chart: self.client.get(reverse('analytics-chart', args=[chart]), {**params, 'format': 'json'})
+                    for chart in analytics_views.CHART_TITLES
+                }
+                draw.assert_not_called()
+
+            for chart, response in charts.items():
+                self.assertEqual(response.status_code, 200)
+                data = response.json()
+                self.assertEqual((data['chart'], data['start'], data['end']), (chart, '2026-03-01', '2026-03-02'))
+                for series in data['series']:
+                    self.assertEqual(len(series['values']), len(data['labels']))
+                # The same series still renders as a PNG
+                png = self.client.get(reverse('analytics-chart', args=[chart]), params)
+                self.assertTrue(png.content.startswith(b'\x89PNG'))
+                self.assertNotEqual(png['ETag'], response['ETag'])
+
+        self.assertEqual(charts['top-menu'].json()['labels'], ['Tea'])
+        self.assertEqual(charts['top-menu'].json()['series'], [{'name': 'Qty', 'values': [2]}])
+        by_hour = charts['menu-by-hour'].json()['series'][0]['values']
+        self.assertEqual((by_hour[9], by_hour[13], sum(by_hour)), (1, 1, 2))
+        self.assertEqual(charts['day-wise-orders-revenue'].json()['series'],
+                         [{'name': 'Orders', 'values': [1, 1]}, {'name': 'Revenue', 'values': [10.0, 10.0]}])
+        self.assertEqual(charts['day-wise-menu'].json()['labels'], ['2026-03-01', '2026-03-02'])
+
+
+class StartupImportTimeTests(TestCase):
+    # Cumulative import time for booting a worker and loading the URLconf
+    IMPORT_BUDGET_SECONDS = 1.5
+    LAZY_MODULES = ('matplotlib', 'numpy', 'firebase_admin')
+
+    def test_worker_boot_skips_charting_stack_and_stays_in_budget(self):
+        script = 'import vanita_lunch.wsgi, django.urls; django.urls.get_resolver().url_patterns'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        # Lines look like "import time: <self us> | <cumulative us> | <indent><module>"
+        rows = [line.split('|') for line in result.stderr.splitlines() if line.startswith('import time:')]
+        rows = [(int(cumulative), name[1:]) for _, cumulative, name in rows[1:]]
+        packages = {name.strip().split('.')[0] for _, name in rows}
+        for module in self.LAZY_MODULES:
+            self.assertNotIn(module, packages, f'{module} is imported at worker boot')
+        top_level_seconds = sum(cumulative for cumulative, name in rows if not name.startswith(' ')) / 1e6
+        self.assertLess(top_level_seconds, self.IMPORT_BUDGET_SECONDS)
+
+
+class FirebaseClientTests(AdminSessionMixin, TestCase):
+    def test_initializes_once_on_first_use_and_records_latency(self):
+        client = FirebaseClient(credentials_env='VLH_TEST_UNSET_FIREBASE', default_credentials=True)
+        app = object()
+        with mock.patch.dict(firebase_admin._apps, clear=True), \
+                mock.patch('firebase_admin.credentials.ApplicationDefault'), \
+                mock.patch('firebase_admin.initialize_app', return_value=app) as initialize:
+            self.assertIsNone(client.stats()['init_seconds'])
+            threads = [threading.Thread(target=client.app) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(client.app(), app)
+        initialize.assert_called_once()
+        stats = client.stats()
+        self.assertEqual((stats['initialized'], stats['credentials']), (True, 'application_default'))
+        self.assertGreaterEqual(stats['init_seconds'], 0)
+
+    def test_a_failed_initialization_is_retried_after_a_backoff(self):
+        now = [100.0]
+        client = FirebaseClient(credentials_env='VLH_TEST_UNSET_FIREBASE', default_credentials=True,
+                                clock=lambda: now[0])
+        app = object()
+        with mock.patch.dict(firebase_admin._apps, clear=True), \
+                mock.patch('firebase_admin.credentials.ApplicationDefault'), \
+                mock.patch('firebase_admin.initialize_app', side_effect=[Exception('metadata timeout'), app]):
+            with self.assertRaisesMessage(Exception, 'metadata timeout'):
+                client.app()
+            now[0] += 1
+            with self.assertRaises(Exception):
+                client.app()  # Still backing off
+            self.assertEqual(client.stats()['init_attempts'], 1)
+            now[0] += 10
+            self.assertIs(client.app(), app)
+        self.assertEqual(client.stats()['init_attempts'], 2)
+
+    def test_missing_credentials_fail_on_send_not_at_startup(self):
+        client = FirebaseClient(credentials_env='VLH_TEST_UNSET_FIREBASE')
+        self.assertFalse(client.configured)
+        with mock.patch.dict(firebase_admin._apps, clear=True), self.assertRaises(Exception):
+            client.send(messaging.Message(topic='new_orders'))
+        self.assertIn('VLH_TEST_UNSET_FIREBASE', client.stats()['init_error'])
+
+    def test_views_and_outbox_use_the_replaceable_client(self):
+        fake = FakeFirebaseClient()
+        previous = set_client(fake)
+        self.addCleanup(set_client, previous)
+
+        response = self.client.post(reverse('subscribe_to_topic'), json.dumps({'token': 'abc'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['success'], True)
+        self.assertEqual(fake.subscriptions, [('abc', 'new_orders')])
+
+        NotificationOutbox.objects.create(topic='new_orders', title='New order', data={'order_id': '1'})
+        self.assertEqual(drain_outbox(), 1)
+        self.assertEqual([message.topic for message in fake.sent], ['new_orders'])
+        self.login_admin()
+        self.assertEqual(self.client.get(reverse('notification_stats_api')).json()['firebase']['credentials'], 'fake')
+
+
+def plan_nodes(plan):
+    """Flattens an EXPLAIN (FORMAT JSON) plan tree."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+class OrderIndexUsageTests(TestCase):
+    """
+    EXPLAINs the hot order filters on a seeded table and checks the planner
+    reads them through an index rather than a sequential scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        start = datetime(2026, 1, 1, 8, 0)
+        orders = []
+        for i in range(6000):
+            created_at = start + timedelta(minutes=15 * i)
+            recent = i >= 5980
+            orders.append(Order(
+                order_id=str(10000000 + i), customer_name='A', customer_mobile=f'98{rng.randint(0, 99999999):08d}',
+                items=[{'name': 'Tea', 'quantity': 1, 'price': 10}], subtotal=Decimal('10.00'),
+                total_price=Decimal('10.00'), payment_method=rng.choice(['Cash', 'Online']),
+                order_placed_by='counter' if i % 5 == 0 else 'customer',
+                order_status=rng.choice(['open', 'ready']) if recent else 'pickedup',
+                created_at=created_at, updated_at=created_at,
+            ))
+        Order.objects.bulk_create(orders, batch_size=1000)
+        cls.last_day = (start + timedelta(minutes=15 * 5999)).replace(hour=0, minute=0)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE orders')
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            return list(plan_nodes(cursor.fetchone()[0][0]['Plan']))
+
+    def assertUsesIndex(self, queryset_or_sql, *index_names, params=()):
+        if isinstance(queryset_or_sql, str):
+            nodes = self.explain(queryset_or_sql, params)
+        else:
+            sql, params = queryset_or_sql.query.sql_with_params()
+            nodes = self.explain(sql, params)
+        scans = [node for node in nodes if node.get('Relation Name') == 'orders']
+        self.assertFalse([node for node in scans if node['Node Type'] == 'Seq Scan'], f'Sequential scan: {nodes}')
+        # Bitmap Index Scan nodes name the index but not the table
+        used = {node['Index Name'] for node in nodes if 'Index Name' in node}
+        self.assertTrue(used & set(index_names), f'Expected one of {index_names}, planner used {used}')
+
+    def test_active_orders_use_partial_index(self):
+        self.assertUsesIndex(Order.objects.filter(order_status__in=ACTIVE_ORDER_STATUSES).order_by('created_at'),
+                             'orders_active_idx')
+        self.assertUsesIndex(Order.objects.filter(order_status='open'), 'orders_active_idx')
+
+    def test_order_board_filters_by_source_and_date(self):
+        day = (self.last_day - timedelta(days=5), self.last_day - timedelta(days=4))
+        counter = Order.objects.filter(created_at__range=day, order_placed_by='counter').order_by('-created_at')
+        self.assertUsesIndex(counter, 'orders_source_created_idx')
+        preparing = Order.objects.filter(created_at__range=(self.last_day, self.last_day + timedelta(days=1)),
+                                         order_placed_by='customer', order_status='open')
+        self.assertUsesIndex(preparing, 'orders_active_idx', 'orders_source_created_idx')
+
+    def test_customer_order_history_uses_mobile_index(self):
+        # Same statement as get_customer_orders in vanitalunchhome/app.py
+        mobile = Order.objects.values_list('customer_mobile', flat=True).first()
+        self.assertUsesIndex(
+            'SELECT id, order_id, customer_name, customer_mobile, items, subtotal, total_price, status, '
+            'payment_method, created_at, order_status FROM orders WHERE customer_mobile = %s '
+            'ORDER BY created_at DESC LIMIT 50',
+            'orders_mobile_created_idx', params=[mobile],
+        )
+
+    def test_date_ranges_use_created_at_index(self):
+        week = (self.last_day - timedelta(days=7), self.last_day)
+        self.assertUsesIndex(Order.objects.filter(created_at__range=week).order_by('-created_at', '-id')[:100],
+                             'orders_created_id_idx')
+        self.assertUsesIndex(Order.objects.filter(created_at__range=week, order_status='pickedup'),
+                             'orders_created_id_idx', 'orders_source_created_idx')
+
+
+class OrderLineTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        self.menu = make_menu(3)
+
+    def lines(self, order):
+        return list(order.lines.order_by('position').values_list(
+            'position', 'menu_item_id', 'name', 'unit_price', 'quantity'))
+
+    def test_new_orders_write_lines_in_the_same_transaction(self):
+        a, b, _ = self.menu
+        payload = {'customer_name': 'Asha', 'customer_mobile': '9876543210', 'total_price': 0,
+                   'payment_method': 'cash', 'items': [{'id': a.id, 'quantity': 2}, {'id': b.id, 'quantity': 1}]}
+        response = self.client.post(reverse('api_place_order'), json.dumps(payload), content_type='application/json')
+        order = Order.objects.get(order_id=response.json()['order_id'])
+        self.assertEqual(self.lines(order), [
+            (1, a.id, a.item_name, a.price, 2),
+            (2, b.id, b.item_name, b.price, 1),
+        ])
+
+        self.login_admin()
+        payload['items'] = [{'id': b.id, 'quantity': 3}]
+        response = self.client.post(reverse('api_create_manual_order'), json.dumps(payload),
+                                    content_type='application/json')
+        order = Order.objects.get(order_id=response.json()['order_id'])
+        self.assertEqual(self.lines(order), [(1, b.id, b.item_name, b.price, 3)])
+
+    def test_backfill_normalizes_legacy_items_and_is_idempotent(self):
+        a = self.menu[0]
+        fields = dict(customer_name='A', customer_mobile='9876543210', subtotal=Decimal('10.00'),
+                      total_price=Decimal('10.00'), payment_method='Cash')
+        legacy = Order.objects.create(order_id='10000001', items=json.dumps([
+            {'id': a.id, 'name': 'Old Name', 'price': '12.50', 'quantity': '2'},
+            {'id': 999999, 'name': '', 'quantity': 1},
+            'not a line',
+            {'name': 'Odd', 'price': 'free', 'quantity': 'lots'},
+        ]), **fields)
+        for i in range(2, 6):
+            Order.objects.create(order_id=f'1000000{i}', items=[{'name': 'Tea', 'price': 10, 'quantity': 1}], **fields)
+        Order.objects.create(order_id='10000009', items={'not': 'a list'}, **fields)
+
+        self.assertEqual(backfill_order_lines(chunk_size=2), (6, 7))
+        self.assertEqual(self.lines(legacy), [
+            (1, a.id, 'Old Name', Decimal('12.50'), 2),
+            (2, None, 'Unknown', Decimal('0.00'), 1),
+            (4, None, 'Odd', None, None),
+        ])
+        self.assertEqual(backfill_order_lines(), (6, 0))
+        self.assertEqual(OrderLine.objects.count(), 7)
+
+        a.delete()
+        self.assertEqual(self.lines(legacy)[0][1], None)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class OrderBoardTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.login_admin()
+        self.fields = dict(customer_mobile='9876543210', subtotal=Decimal('10.00'), total_price=Decimal('10.00'),
+                           payment_method='Cash', items=[{'name': 'Tea', 'price': 10, 'quantity': 1}])
+        self.next_id = 10000001
+
+    def make_order(self, status, placed_by='customer'):
+        order = Order.objects.create(order_id=str(self.next_id), customer_name=f'Customer {self.next_id}',
+                                     order_status=status, order_placed_by=placed_by, **self.fields)
+        self.next_id += 1
+        return order
+
+    def board(self):
+        response = self.client.get(reverse('order_management'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def lane_ids(self, response, name):
+        return [order.id for order in response.context[name]]
+
+    def test_board_query_count_does_not_grow_with_orders(self):
+        for status in ('open', 'ready', 'pickedup', 'cancelled'):
+            self.make_order(status)
+        self.make_order('open', placed_by='counter')
+        with CaptureQueriesContext(connection) as few:
+            self.board()
+        for _ in range(5):
+            for status in ('open', 'ready', 'pickedup', 'cancelled'):
+                self.make_order(status)
+            self.make_order('pickedup', placed_by='counter')
+        with CaptureQueriesContext(connection) as many:
+            self.board()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(sum('"orders"' in q['sql'] for q in many.captured_queries), 1)
+
+    def test_lanes_split_by_source_and_status(self):
+        preparing = self.make_order('open')
+        ready = self.make_order('ready')
+        self.make_order('rejected')
+        counter = [self.make_order('open', placed_by='counter'), self.make_order('cancelled', placed_by='counter')]
+
+        response = self.board()
+        self.assertEqual(self.lane_ids(response, 'preparing_orders'), [preparing.id])
+        self.assertEqual(self.lane_ids(response, 'ready_orders'), [ready.id])
+        self.assertEqual(self.lane_ids(response, 'pickedup_orders'), [])
+        self.assertEqual(self.lane_ids(response, 'counter_orders_all'), [o.id for o in reversed(counter)])
+        self.assertContains(response, 'Tea')
+
+    def test_lane_fragments_are_cached_until_an_order_moves(self):
+        order = self.make_order('open')
+        keys = self.board().context['lane_keys']
+        for lane in ('preparing', 'ready', 'pickedup', 'counter'):
+            self.assertIsNotNone(cache.get(make_template_fragment_key('order_board', [lane, keys[lane]])))
+        self.assertEqual(self.board().context['lane_keys'], keys)
+
+        self.client.post(reverse('update_order_status'), json.dumps({'id': order.id, 'status': 'ready'}),
+                         content_type='application/json')
+        response = self.board()
+        moved = response.context['lane_keys']
+        self.assertNotEqual(moved['preparing'], keys['preparing'])
+        self.assertNotEqual(moved['ready'], keys['ready'])
+        self.assertEqual(moved['counter'], keys['counter'])
+        self.assertEqual(self.lane_ids(response, 'ready_orders'), [order.id])
+        self.assertContains(response, f'data-order-id="{order.id}" data-ready-at=')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class OrderStatsTests(AdminSessionMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.login_admin()
+        self.menu = make_menu(2)
+        self.fields = dict(customer_name='A', customer_mobile='9876543210', items=[], subtotal=Decimal('10.00'),
+                           payment_method='Cash')
+        for i, (status, total) in enumerate([('open', 10), ('ready', 20), ('pickedup', 30), ('pickedup', 40)]):
+            Order.objects.create(order_id=f'1000000{i}', order_status=status, total_price=Decimal(total), **self.fields)
+
+    def test_counters_come_from_one_aggregate_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats = get_order_stats()
+        self.assertEqual(len(queries), 3)  # version, aggregate, menu count
+        self.assertEqual(stats, {
+            'total_orders': 4, 'preparing_orders': 1, 'ready_orders': 1, 'pending_orders': 2,
+            'completed_orders': 2, 'total_revenue': Decimal('70.00'), 'menu_items': 2,
+        })
+        with self.assertNumQueries(1):
+            self.assertEqual(get_order_stats(), stats)
+
+    def test_order_and_menu_writes_invalidate_the_counters(self):
+        get_order_stats()
+        order = Order.objects.get(order_status='open')
+        self.client.post(reverse('update_order_status'), json.dumps({'id': order.id, 'status': 'ready'}),
+                         content_type='application/json')
+        self.assertEqual((get_order_stats()['preparing_orders'], get_order_stats()['ready_orders']), (0, 2))
+
+        # Orders placed by the Flask app never go through Django
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO orders (order_id, customer_name, customer_mobile, items, subtotal, discount, total_price,"
+                " status, payment_method, order_status, order_placed_by, created_at, updated_at)"
+                " VALUES ('10000009', 'B', '9876543210', '[]', 5, 0, 5, 'Pending', 'Cash', 'open', 'customer',"
+                " NOW(), NOW())"
+            )
+        self.assertEqual(get_order_stats()['total_orders'], 5)
+
+        self.client.post(reverse('delete_menu_item', args=[self.menu[0].id]))
+        self.assertEqual(get_order_stats()['menu_items'], 1)
+
+    def test_dashboard_query_count_does_not_grow_with_orders(self):
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_orders'], 4)
+        self.assertEqual(response.context['preparing_orders_count'], 1)
+        for i in range(20):
+            Order.objects.create(order_id=f'1100{i:04d}', order_status='pickedup', total_price=Decimal(5),
+                                 **self.fields)
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as grown:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_orders'], 24)
+        self.assertEqual(len(grown), len(warm))
+
+        response = self.client.get(reverse('analytics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_revenue'], Decimal('170.00'))
+
+
+class PasswordHasherTests(TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=4, workers=1, max_pending=2)
+        previous = set_hasher(self.hasher)
+        self.addCleanup(set_hasher, previous)
+
+    def login(self, password):
+        return self.client.post(reverse('login'), json.dumps({'mobile': '9876543210', 'password': password}),
+                                content_type='application/json')
+
+    def test_login_rehashes_when_the_cost_changes(self):
+        old_hash = bcrypt.hashpw(b'secret', bcrypt.gensalt(5)).decode('utf-8')
+        admin = VlhAdmin.objects.create(mobile='9876543210', password_hash=old_hash)
+
+        self.assertEqual(self.login('wrong').status_code, 401)
+        admin.refresh_from_db()
+        self.assertEqual(admin.password_hash, old_hash)
+
+        self.assertEqual(self.login('secret').status_code, 200)
+        admin.refresh_from_db()
+        self.assertEqual(hash_rounds(admin.password_hash), 4)
+        self.client.logout()
+        self.assertEqual(self.login('secret').status_code, 200)
+        self.assertEqual(self.hasher.stats()['rehashed'], 1)
+
+    def test_malformed_hash_never_matches(self):
+        self.assertFalse(VlhAdmin(mobile='9876543210', password_hash='plain-text').check_password('plain-text'))
+        self.assertFalse(VlhAdmin(mobile='9876543210', password_hash='').check_password(''))
+
+    def test_saturated_pool_rejects_logins_without_waiting(self):
+        admin = VlhAdmin(mobile='9876543210')
+        admin.set_password('secret')
+        admin.save()
+        release = threading.Event()
+        blockers = [threading.Thread(target=self.hasher._run, args=(release.wait,)) for _ in range(2)]
+        for thread in blockers:
+            thread.start()
+        try:
+            while self.hasher.stats()['pending'] < 2:
+                time.sleep(0.01)
+            with self.assertRaises(PasswordHasherBusy):
+                self.hasher.hash('secret')
+            response = self.login('secret')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(self.hasher.stats()['rejected'], 2)
+        finally:
+            release.set()
+            for thread in blockers:
+                thread.join()
+        self.assertEqual(self.login('secret').status_code, 200)
+
+    def test_create_admin_uses_the_configured_cost(self):
+        call_command('create_admin', '9876543210', 'secret', stdout=StringIO())
+        admin = VlhAdmin.objects.get(mobile='9876543210')
+        self.assertEqual(hash_rounds(admin.password_hash), 4)
+        self.assertTrue(admin.check_password('secret'))
 
-# Create your tests here.
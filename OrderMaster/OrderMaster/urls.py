@@ -39,7 +39,9 @@ urlpatterns = [
     path('take-order/', views.take_order_view, name='take_order'),
     path('invoice/<int:order_id>/', views.invoice_view, name='invoice_view'),
     path('api/analytics/', views.analytics_api_view, name='api_analytics'),
+    path('api/analytics/', include(analytics_urlpatterns)),
     path('api/all-orders/', views.getAllOrders, name='api_all_orders'),
+    path('api/orders/export/', views.export_orders_view, name='export_orders'),
     path('api/create-manual-order/', views.create_manual_order, name='api_create_manual_order'),
     
 
@@ -59,4 +61,6 @@ urlpatterns = [
     path('api/place-order/', views.api_place_order, name='api_place_order'),
     path('api/analytics-data/', views.analytics_data_api, name='analytics_data_api'),
     path('api/subscribe-topic/', views.subscribe_to_topic, name='subscribe_to_topic'),
+    path('api/notification-stats/', views.notification_stats_api, name='notification_stats_api'),
+    path('api/order-events/', views.order_events_stream, name='order_events_stream'),
 ]
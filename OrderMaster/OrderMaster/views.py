@@ -3,57 +3,44 @@ import pytz
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 # Import ensure_csrf_cookie
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_POST, require_GET, require_http_methods
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.db import connection, transaction
 # Import models from .models
 # --- FIX: Removed 'Customer' which does not exist in models.py ---
-from .models import MenuItem, Order, VlhAdmin, models
+from .models import MenuItem, Order, VlhAdmin, DailyRevenue, DailyItemSales
 from .forms import MenuItemForm
+from .order_service import (
+    validate_cart, create_order, serialize_active_order, ACTIVE_ORDER_STATUSES, DELTA_SYNC_OVERLAP,
+    OrderValidationError, ORDER_LIST_FIELDS, ORDER_PAGE_SIZE, MAX_ORDER_PAGE_SIZE,
+    encode_order_cursor, decode_order_cursor, serialize_order_row,
+    build_order_board, ORDER_BOARD_FIELDS, ORDER_BOARD_CACHE_SECONDS,
+)
+from .notifications import enqueue_notification, outbox_stats
+from .order_stats import get_order_stats
+from .events import get_broker, order_event, publish_order_event, stream_events, long_poll_events
+from .menu_cache import get_menu_snapshot
+from .order_export import EXPORT_FORMATS, iter_export, aiter_export
+from .sales_rollup import COMPLETED_SALE_Q, counts_as_sale, record_sale_change
+from .analytics_queries import item_totals, orders_where
 from .decorators import admin_required
-from datetime import datetime, timedelta
-from django.db.models import Count, Sum, Q
-from collections import Counter
-import os
+from datetime import datetime, time, timedelta
+from django.db.models import Sum, Q
 import io
 import json
-import random
 import uuid
 from decimal import Decimal
 import logging
 
-# Firebase Admin Imports
-import firebase_admin
-from firebase_admin import credentials, messaging
+from shared.firebase_client import get_client
+from shared.passwords import PasswordHasherBusy
 
 logger = logging.getLogger(__name__)
 
-# ==============================================================================
-#  Firebase Admin SDK Initialization
-# ==============================================================================
-try:
-    if not firebase_admin._apps:
-        firebase_creds = os.environ.get('FIREBASE_CREDENTIALS')
-
-        if firebase_creds:
-            cred_dict = json.loads(firebase_creds)
-            cred = credentials.Certificate(cred_dict)
-            firebase_admin.initialize_app(cred)
-            print("✅ Firebase Admin SDK initialized with service account")
-            logger.info("Firebase Admin SDK initialized successfully")
-        else:
-            # Fallback for local development
-            cred = credentials.ApplicationDefault()
-            firebase_admin.initialize_app(cred, {
-                'projectId': "vanita-lunch-home",
-            })
-            print("⚠️ Firebase Admin SDK initialized with default credentials")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize Firebase Admin SDK: {e}")
-    print(f"ERROR: Failed to initialize Firebase Admin SDK: {e}")
-# ==============================================================================
-
 def get_ist_now_naive():
     """Returns current time in IST as timezone-naive datetime"""
     ist_tz = pytz.timezone('Asia/Kolkata')
@@ -70,7 +57,7 @@ def subscribe_to_topic(request):
         if not token:
             return JsonResponse({'error': 'Token required'}, status=400)
 
-        response = messaging.subscribe_to_topic([token], 'new_orders')
+        response = get_client().subscribe_to_topic([token], 'new_orders')
 
         if response.failure_count > 0:
             logger.error(f"Failed to subscribe token: {response.errors}")
@@ -175,6 +162,12 @@ def login_view(request):
                 return JsonResponse({'error': 'Invalid mobile number or password.'}, status=401)
             else:
                 messages.error(request, 'Invalid mobile number or password.')
+        except PasswordHasherBusy:
+            logger.warning(f"⚠️ Login for mobile {mobile} rejected: password hashing is saturated")
+            if 'application/json' in request.content_type:
+                return JsonResponse({'error': 'Too many login attempts right now. Please try again.'}, status=503)
+            else:
+                messages.error(request, 'Too many login attempts right now. Please try again.')
         except Exception as e:
              logger.error(f"Login error for mobile {mobile}: {e}", exc_info=True)
              if 'application/json' in request.content_type:
@@ -193,19 +186,17 @@ def logout_view(request):
 
 @admin_required
 def dashboard_view(request):
+    stats = get_order_stats()
     context = {
-        'total_orders': Order.objects.count(),
-        'preparing_orders_count': Order.objects.filter(order_status='open').count(),
-        'ready_orders_count': Order.objects.filter(order_status='ready').count(),
-        'menu_items_count': MenuItem.objects.count(),
+        'total_orders': stats['total_orders'],
+        'preparing_orders_count': stats['preparing_orders'],
+        'ready_orders_count': stats['ready_orders'],
+        'menu_items_count': stats['menu_items'],
         'recent_orders': Order.objects.order_by('-created_at')[:5],
         'active_page': 'dashboard',
     }
     return render(request, 'OrderMaster/dashboard.html', context)
 
-from django.db.models.functions import TruncHour, TruncDay, Lower
-from django.db.models import Count
-
 def analytics_api_view(request):
     """API endpoint for analytics data with proper error handling."""
     try:
@@ -234,61 +225,49 @@ def analytics_api_view(request):
             start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
             end_date = now
 
-        counter_orders_q = Q(order_placed_by='counter')
-        customer_orders_q = Q(order_placed_by='customer', order_status='pickedup')
-        combined_q = counter_orders_q | customer_orders_q
-        base_completed_orders = Order.objects.filter(
-            created_at__range=(start_date, end_date)
-            ).filter(combined_q)
-        
-        filtered_orders = base_completed_orders
+        # Totals come from the daily rollups (see sales_rollup); only the
+        # recent-orders table below reads the orders table.
+        day_range = (start_date.date(), end_date.date())
+        base_revenue = DailyRevenue.objects.filter(day__range=day_range)
+        revenue_rows = base_revenue
+        item_rows = DailyItemSales.objects.filter(day__range=day_range)
         if payment_filter != 'Total':
-            filtered_orders = base_completed_orders.filter(payment_method__iexact=payment_filter)
+            revenue_rows = revenue_rows.filter(payment_method=payment_filter.lower())
+            item_rows = item_rows.filter(payment_method=payment_filter.lower())
 
-        total_revenue = filtered_orders.aggregate(total=Sum('total_price'))['total'] or 0
-        total_orders_count = filtered_orders.count()
+        totals = revenue_rows.aggregate(revenue=Sum('revenue'), orders=Sum('orders'))
+        total_revenue = totals['revenue'] or 0
+        total_orders_count = totals['orders'] or 0
         average_order_value = total_revenue / total_orders_count if total_orders_count > 0 else 0
 
-        item_counter = Counter()
-        for order in filtered_orders:
-            items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
-            if isinstance(items_list, list):
-                for item in items_list:
-                    item_counter[item.get('name', 'Unknown')] += item.get('quantity', 0)
-        most_common_items = item_counter.most_common(5)
+        most_common_items = [
+            (row['item_name'], row['quantity'])
+            for row in item_rows.values('item_name').annotate(quantity=Sum('quantity')).filter(quantity__gt=0).order_by('-quantity', 'item_name')[:5]
+        ]
         top_5_names = [item[0] for item in most_common_items]
 
-        payment_distribution = filtered_orders.annotate(
-            payment_method_lower=Lower('payment_method')
-        ).values(
-            'payment_method_lower'
-        ).annotate(
-            total=Sum('total_price')
-        ).order_by('-total')
-        order_source_distribution = base_completed_orders.values('order_placed_by').annotate(count=Count('id')).order_by('-count')
-        orders_by_hour = filtered_orders.annotate(hour=TruncHour('created_at')).values('hour').annotate(count=Count('id')).order_by('hour')
-        
-        day_wise_revenue = filtered_orders.annotate(day=TruncDay('created_at')).values('day').annotate(
-            revenue=Sum('total_price'),
-            orders=Count('id')
-        ).order_by('day')
+        payment_distribution = revenue_rows.values('payment_method').annotate(
+            total=Sum('revenue')
+        ).filter(total__gt=0).order_by('-total')
+        order_source_distribution = base_revenue.values('order_placed_by').annotate(
+            count=Sum('orders')
+        ).filter(count__gt=0).order_by('-count')
+        orders_by_hour = revenue_rows.values('day', 'hour').annotate(
+            count=Sum('orders')
+        ).filter(count__gt=0).order_by('day', 'hour')
+
+        day_wise_revenue = list(revenue_rows.values('day').annotate(
+            revenue=Sum('revenue'),
+            orders=Sum('orders')
+        ).filter(orders__gt=0).order_by('day'))
+
+        day_labels = [d['day'].strftime('%d %b') for d in day_wise_revenue]
+        day_index = {d['day']: i for i, d in enumerate(day_wise_revenue)}
 
-        day_wise_menu_query = filtered_orders.annotate(day=TruncDay('created_at')).values('day').order_by('day').distinct()
-        day_labels = [d['day'].strftime('%d %b') for d in day_wise_menu_query]
-        
         datasets = {name: [0] * len(day_labels) for name in top_5_names}
-        for i, day_label in enumerate(day_labels):
-            day_date = datetime.strptime(day_label + f' {start_date.year}', '%d %b %Y').date()
-            orders_on_day = filtered_orders.filter(created_at__date=day_date)
-            daily_item_counter = Counter()
-            for order in orders_on_day:
-                items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
-                if isinstance(items_list, list):
-                    for item in items_list:
-                        if item.get('name') in top_5_names:
-                            daily_item_counter[item.get('name')] += item.get('quantity', 0)
-            for name in top_5_names:
-                datasets[name][i] = daily_item_counter[name]
+        for row in item_rows.filter(item_name__in=top_5_names).values('day', 'item_name').annotate(quantity=Sum('quantity')):
+            if row['day'] in day_index:
+                datasets[row['item_name']][day_index[row['day']]] = row['quantity']
 
         day_wise_menu_datasets = []
         colors = ['#1e40af', '#059669', '#d97706', '#9333ea', '#64748b']
@@ -299,6 +278,9 @@ def analytics_api_view(request):
                 'backgroundColor': colors[i % len(colors)]
             })
 
+        filtered_orders = Order.objects.filter(created_at__range=(start_date, end_date)).filter(COMPLETED_SALE_Q)
+        if payment_filter != 'Total':
+            filtered_orders = filtered_orders.filter(payment_method__iexact=payment_filter)
         table_orders = filtered_orders.order_by('-created_at')[:100]
         table_data = []
         for order in table_orders:
@@ -325,7 +307,7 @@ def analytics_api_view(request):
                 'data': [item[1] for item in most_common_items],
             },
             'payment_method_distribution': {
-                'labels': [item['payment_method_lower'] for item in payment_distribution],
+                'labels': [item['payment_method'] for item in payment_distribution],
                 'data': [float(item['total']) for item in payment_distribution],
             },
             'order_source_distribution': {
@@ -333,7 +315,7 @@ def analytics_api_view(request):
                 'data': [item['count'] for item in order_source_distribution],
             },
             'orders_by_hour': {
-                'labels': [h['hour'].strftime('%I %p').lstrip('0') if h['hour'] else 'N/A' for h in orders_by_hour],
+                'labels': [time(h['hour']).strftime('%I %p').lstrip('0') for h in orders_by_hour],
                 'data': [h['count'] for h in orders_by_hour],
             },
             'day_wise_revenue': {
@@ -385,38 +367,22 @@ def order_management_view(request):
         end_date = start_date.replace(hour=23, minute=59, second=59, microsecond=999999)
         date_filter = 'today'
 
-    base_orders = Order.objects.filter(created_at__range=(start_date, end_date))
-    
-    # --- NEW: Split queries by order_placed_by ---
-
-    # 1. Online Orders (for 3-column layout)
-    online_orders_base = base_orders.filter(order_placed_by='customer').exclude(order_status__in=['cancelled', 'rejected'])
-    preparing_orders = online_orders_base.filter(order_status='open')
-    ready_orders = online_orders_base.filter(order_status='ready')
-    pickedup_orders = online_orders_base.filter(order_status='pickedup')
-
-    # 2. Counter Orders (for single list layout)
-    counter_orders_all = base_orders.filter(order_placed_by='counter').order_by('-created_at')
-
-    # --- Process items_list for all fetched orders ---
-    for order in preparing_orders:
-        order.items_list = order.items if isinstance(order.items, list) else json.loads(order.items)
-    for order in ready_orders:
-        order.items_list = order.items if isinstance(order.items, list) else json.loads(order.items)
-    for order in pickedup_orders:
-        order.items_list = order.items if isinstance(order.items, list) else json.loads(order.items)
-    for order in counter_orders_all:
-        order.items_list = order.items if isinstance(order.items, list) else json.loads(order.items)
-
+    # One query for the whole board, split into lanes in Python
+    orders = Order.objects.filter(created_at__range=(start_date, end_date)).only(*ORDER_BOARD_FIELDS).order_by('-created_at')
+    lanes, lane_keys = build_order_board(orders)
 
     context = {
         # Online (Customer) Orders
-        'preparing_orders': preparing_orders,
-        'ready_orders': ready_orders,
-        'pickedup_orders': pickedup_orders,
+        'preparing_orders': lanes['preparing'],
+        'ready_orders': lanes['ready'],
+        'pickedup_orders': lanes['pickedup'],
         
         # Counter Orders
-        'counter_orders_all': counter_orders_all,
+        'counter_orders_all': lanes['counter'],
+
+        # Rendered lanes are cached until an order in them changes
+        'lane_keys': lane_keys,
+        'board_cache_seconds': ORDER_BOARD_CACHE_SECONDS,
 
         # Filters and Page Metadata
         'date_display_str': date_filter.replace('_', ' ').title(),
@@ -440,19 +406,25 @@ def update_order_status(request):
         if not all([order_pk, new_status]):
             return JsonResponse({'success': False, 'error': 'Missing data'}, status=400)
 
-        order = get_object_or_404(Order, pk=order_pk)
-        order.order_status = new_status
-
         response_data = {'success': True}
-        
-        if new_status == 'ready':
-            order.ready_time = get_ist_now_naive()
-            response_data['ready_time'] = order.ready_time.isoformat()
-        elif new_status == 'pickedup':
-            order.pickup_time = get_ist_now_naive()
-            response_data['pickup_time'] = order.pickup_time.isoformat()
-
-        order.save()
+
+        with transaction.atomic():
+            # Lock the row so concurrent status changes cannot both count the same sale
+            order = Order.objects.select_for_update().get(pk=order_pk)
+            was_counted = counts_as_sale(order)
+            order.order_status = new_status
+            order.updated_at = get_ist_now_naive()  # Drives get_pending_orders?since=
+
+            if new_status == 'ready':
+                order.ready_time = get_ist_now_naive()
+                response_data['ready_time'] = order.ready_time.isoformat()
+            elif new_status == 'pickedup':
+                order.pickup_time = get_ist_now_naive()
+                response_data['pickup_time'] = order.pickup_time.isoformat()
+
+            order.save()
+            record_sale_change(order, was_counted)
+            publish_order_event('order_updated', order)
         return JsonResponse(response_data)
     except Order.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Order not found'}, status=404)
@@ -574,7 +546,7 @@ def api_menu_item_detail(request, item_id):
 def api_menu_items(request):
     """
     API endpoint for menu items.
-    GET: Returns all menu items
+    GET: Returns all menu items (supports If-None-Match / 304)
     POST: Creates a new menu item
     """
     
@@ -582,33 +554,15 @@ def api_menu_items(request):
     if request.method == 'GET':
         try:
             logger.info("📡 API /api/menu-items/ GET called")
-            
-            # Get all menu items from database
-            menu_items = MenuItem.objects.all().order_by('category', 'item_name')
-            
-            logger.info(f"✅ Found {menu_items.count()} menu items in database")
-            
-            # Convert to list of dictionaries
-            items_list = []
-            for item in menu_items:
-                items_list.append({
-                    'id': item.id,
-                    'item_name': item.item_name,
-                    'description': item.description or '',
-                    'price': float(item.price),
-                    'category': item.category,
-                    'veg_nonveg': item.veg_nonveg,
-                    'meal_type': item.meal_type,
-                    'availability_time': item.availability_time or '',
-                    'image_url': item.image_url or ''
-                })
-            
-            # Return in the format Flutter expects: {'menu_items': [...]}
-            response_data = {'menu_items': items_list}
-            
-            logger.info(f"✅ Returning {len(items_list)} items in response")
-            return JsonResponse(response_data, safe=False)
-            
+
+            # Pre-encoded {'menu_items': [...]} for the current menu version
+            etag, body = get_menu_snapshot()
+
+            response = HttpResponse(body, content_type='application/json')
+            response['ETag'] = etag
+            response['Cache-Control'] = 'no-cache'  # Always revalidate; 304 is cheap
+            return get_conditional_response(request, etag=etag, response=response)
+
         except Exception as e:
             logger.error(f"❌ Error in api_menu_items GET: {e}", exc_info=True)
             return JsonResponse({
@@ -720,41 +674,11 @@ def api_place_order(request):
         if not data['customer_mobile'].isdigit() or len(data['customer_mobile']) != 10:
             return JsonResponse({'error': 'Invalid mobile number format. Must be 10 digits.'}, status=400)
         
-        # Validate items
-        if not isinstance(data['items'], list) or len(data['items']) == 0:
-            return JsonResponse({'error': 'Items must be a non-empty list.'}, status=400)
-
-        # Validate and calculate total
-        calculated_subtotal = Decimal('0.00')
-        validated_items_for_db = []
-        
-        for item_data in data['items']:
-            if not all(k in item_data for k in ['id', 'quantity']):
-                return JsonResponse({'error': 'Each item must have id and quantity.'}, status=400)
-            
-            try:
-                menu_item = MenuItem.objects.get(id=int(item_data['id']))
-                quantity = int(item_data['quantity'])
-                
-                if quantity <= 0:
-                    continue
-                
-                item_total = menu_item.price * quantity
-                calculated_subtotal += item_total
-                
-                validated_items_for_db.append({
-                    'id': menu_item.id,
-                    'name': menu_item.item_name,
-                    'price': float(menu_item.price),
-                    'quantity': quantity,
-                })
-            except MenuItem.DoesNotExist:
-                return JsonResponse({'error': f'Menu item with ID {item_data["id"]} not found.'}, status=400)
-            except (ValueError, TypeError):
-                return JsonResponse({'error': 'Invalid item data format.'}, status=400)
-
-        if not validated_items_for_db:
-            return JsonResponse({'error': 'No valid items found in the order.'}, status=400)
+        # Validate and price the cart against the menu
+        try:
+            validated_items_for_db, calculated_subtotal = validate_cart(data['items'])
+        except OrderValidationError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
         final_total_client = Decimal(str(data['total_price']))
 
@@ -767,67 +691,43 @@ def api_place_order(request):
         ist_tz = pytz.timezone('Asia/Kolkata')
         now_ist = datetime.now(ist_tz).replace(tzinfo=None)
             
-        new_order = Order.objects.create(
-            customer_name=data.get('customer_name'),
-            customer_mobile=data.get('customer_mobile'),
-            items=validated_items_for_db,
-            subtotal=calculated_subtotal,
-            discount=Decimal('0.00'),
-            total_price=calculated_subtotal, # Changed from final_total_client to calculated_subtotal
-            status='pending', # Changed from 'confirmed' to 'pending'
-            payment_method=final_payment_method,
-            payment_id=final_payment_method, # This might need clarification if payment_id is specific
-            order_status='pending', # Changed from 'open' to 'pending'
-            order_placed_by='customer', # Changed from 'counter' to 'customer'
-            created_at=now_ist,  # <-- ADD THIS LINE
-            updated_at=now_ist   # <-- ADD THIS LINE
-        )
-        
-        logger.info(f"✅ Initial Order (PK: {new_order.pk}) created for {new_order.customer_name}.")
-
-        # Generate and save custom order_id
-        try:
-            while True:
-                generated_id = str(random.randint(10000000, 99999999))
-                if not Order.objects.filter(order_id=generated_id).exists():
-                    new_order.order_id = generated_id
-                    new_order.save(update_fields=['order_id'])
-                    logger.info(f"✅ Assigned custom Order ID {new_order.order_id} to PK {new_order.pk}.")
-                    break
-        except Exception as e_genid:
-            logger.error(f"❌ Failed to generate order_id for PK {new_order.pk}: {e_genid}", exc_info=True)
-            return JsonResponse({'error': 'Failed to finalize order ID.'}, status=500)
-        
-        generated_order_id = new_order.order_id
-
-        # Send Firebase notification
-        try:
-            items_json = json.dumps(new_order.items)
-            order_db_id = str(new_order.pk)
-            message_data = {
-                'id': order_db_id,
-                'order_id': generated_order_id,
-                'customer_name': new_order.customer_name,
-                'customer_mobile': new_order.customer_mobile,
-                'total_price': str(new_order.total_price),
-                'items': items_json,
-                'order_source': 'customer',
-                'status': 'pending'  # ← Include status
-            }
-            
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title='🔔 New Customer Order - Action Required!',
-                    body=f'Order #{generated_order_id} from {new_order.customer_name} - ₹{new_order.total_price}'
-                ),
-                data=message_data,
-                topic='new_orders'
+        # The order and its FCM notification commit together; the
+        # notification_worker command delivers the message.
+        with transaction.atomic():
+            new_order = create_order(
+                customer_name=data.get('customer_name'),
+                customer_mobile=data.get('customer_mobile'),
+                items=validated_items_for_db,
+                subtotal=calculated_subtotal,
+                discount=Decimal('0.00'),
+                total_price=calculated_subtotal, # Changed from final_total_client to calculated_subtotal
+                status='pending', # Changed from 'confirmed' to 'pending'
+                payment_method=final_payment_method,
+                payment_id=final_payment_method, # This might need clarification if payment_id is specific
+                order_status='pending', # Changed from 'open' to 'pending'
+                order_placed_by='customer', # Changed from 'counter' to 'customer'
+                created_at=now_ist,  # <-- ADD THIS LINE
+                updated_at=now_ist   # <-- ADD THIS LINE
+            )
+            generated_order_id = new_order.order_id
+            publish_order_event('order_created', new_order)
+
+            enqueue_notification(
+                data={
+                    'id': new_order.pk,
+                    'order_id': generated_order_id,
+                    'customer_name': new_order.customer_name,
+                    'customer_mobile': new_order.customer_mobile,
+                    'total_price': new_order.total_price,
+                    'items': json.dumps(new_order.items),
+                    'order_source': 'customer',
+                    'status': 'pending'  # ← Include status
+                },
+                title='🔔 New Customer Order - Action Required!',
+                body=f'Order #{generated_order_id} from {new_order.customer_name} - ₹{new_order.total_price}',
             )
-            response = messaging.send(message)
-            logger.info(f'✅ Successfully sent FCM message for customer order {generated_order_id}: {response}')
 
-        except Exception as e_fcm:
-            logger.error(f"❌ Error sending FCM message for customer order ID {generated_order_id}: {e_fcm}", exc_info=True)
+        logger.info(f"✅ Order {generated_order_id} (PK: {new_order.pk}) created for {new_order.customer_name}.")
 
         return JsonResponse({
             'success': True,
@@ -848,13 +748,12 @@ def api_place_order(request):
 @admin_required
 def analytics_view(request):
     """Renders the analytics page."""
-    completed_orders = Order.objects.filter(order_status='pickedup')
-    total_revenue = completed_orders.aggregate(total=models.Sum('total_price'))['total'] or 0
+    stats = get_order_stats()
     context = {
-        'total_orders': Order.objects.count(),
-        'completed_orders': completed_orders.count(),
-        'total_revenue': total_revenue,
-        'pending_orders': Order.objects.filter(order_status__in=['open', 'ready']).count(),
+        'total_orders': stats['total_orders'],
+        'completed_orders': stats['completed_orders'],
+        'total_revenue': stats['total_revenue'],
+        'pending_orders': stats['pending_orders'],
         'active_page': 'analytics',
     }
     return render(request, 'OrderMaster/analytics.html', context)
@@ -883,6 +782,12 @@ def get_orders_api(request):
         logger.error(f"API get_orders error: {e}")
         return JsonResponse({'error': 'Server error occurred.'}, status=500)
 
+@admin_required
+@require_GET
+def notification_stats_api(request):
+    """Queue depth and delivery latency of the FCM notification outbox."""
+    return JsonResponse({**outbox_stats(), 'firebase': get_client().stats()})
+
 @csrf_exempt
 @admin_required
 @require_GET  # Make sure this view only responds to GET
@@ -890,50 +795,96 @@ def get_pending_orders(request):
     """
     Returns a list of all active orders, separated for the Flutter app.
     This version sends 'total_price' as a float (number).
+
+    Every response carries a 'cursor'. Passing it back as ?since=<cursor>
+    returns only active orders created or changed since then, plus the ids of
+    orders that left the active set in 'removed'.
     """
+    since_str = request.GET.get('since')
+    since = None
+    if since_str:
+        try:
+            since = datetime.fromisoformat(since_str)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid since cursor'}, status=400)
+
     try:
-        active_orders = Order.objects.filter(
-            order_status__in=['open', 'ready']
-        ).order_by('created_at')
+        # Taken before querying so changes made during this request are re-sent next time
+        cursor = get_ist_now_naive()
+
+        if since is None:
+            orders = Order.objects.filter(order_status__in=ACTIVE_ORDER_STATUSES)
+        else:
+            orders = Order.objects.filter(updated_at__gt=since - DELTA_SYNC_OVERLAP)
 
         online_orders_data = []
         counter_orders_data = []
+        removed_ids = []
 
-        for order in active_orders:
-            try:
-                items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
-            except json.JSONDecodeError:
-                items_list = [] # Handle malformed JSON
-
-            order_data = {
-                'id': order.id,
-                'order_id': order.order_id,
-                'customer_name': order.customer_name,
-                'customer_mobile': order.customer_mobile,
-                'items': items_list,
-                'total_price': float(order.total_price), # <-- FIX IS HERE: Send as float
-                'order_status': order.order_status,
-                'status': order.status,
-                'order_placed_by': order.order_placed_by,
-                'created_at': order.created_at.isoformat(),
-                'ready_time': order.ready_time.isoformat() if order.ready_time else None,
-                'pickup_time': order.pickup_time.isoformat() if order.pickup_time else None,
-            }
-            
-            if order.order_placed_by == 'counter':
-                counter_orders_data.append(order_data)
+        for order in orders.order_by('created_at'):
+            if order.order_status not in ACTIVE_ORDER_STATUSES:
+                removed_ids.append(order.id)
+            elif order.order_placed_by == 'counter':
+                counter_orders_data.append(serialize_active_order(order))
             else:
-                online_orders_data.append(order_data)
+                online_orders_data.append(serialize_active_order(order))
 
-        return JsonResponse({
+        response_data = {
             'online_orders': online_orders_data,
-            'counter_orders': counter_orders_data
-        })
+            'counter_orders': counter_orders_data,
+            'cursor': cursor.isoformat(),
+        }
+        if since is not None:
+            response_data['removed'] = removed_ids
+        return JsonResponse(response_data)
     
     except Exception as e:
         logger.error(f"Error fetching pending orders for Flutter: {e}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
         
+@admin_required
+@require_GET
+def order_events_stream(request):
+    """
+    Server-Sent Events feed of order changes for the dashboard, order board and
+    Flutter app. Events are 'order_created' and 'order_updated'; each carries
+    the order's status fields and, while it is active, the same 'order' object
+    get_pending_orders returns.
+
+    Reconnects (Last-Event-ID header) or ?since=<cursor> first replay orders
+    changed since that cursor. Served as a long-lived stream under ASGI and as a
+    long poll under WSGI.
+    """
+    since_str = request.GET.get('since') or request.headers.get('Last-Event-ID')
+    since = None
+    if since_str:
+        try:
+            since = datetime.fromisoformat(since_str)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid since cursor'}, status=400)
+
+    broker = get_broker()
+    # Subscribe before reading the backlog so nothing committed in between is lost
+    subscription = broker.subscribe()
+    try:
+        cursor = get_ist_now_naive()
+        backlog = []
+        if since is not None:
+            changed = Order.objects.filter(updated_at__gt=since - DELTA_SYNC_OVERLAP).order_by('updated_at')
+            backlog = [order_event('order_updated', order) for order in changed]
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+
+    if isinstance(request, ASGIRequest):
+        body = stream_events(broker, subscription, backlog, cursor.isoformat())
+    else:
+        body = long_poll_events(broker, subscription, backlog, cursor.isoformat())
+    response = StreamingHttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold events back
+    return response
+
 # --- START: Merged updates for getAllOrders ---
 @csrf_exempt
 @require_http_methods(['GET'])
@@ -941,6 +892,12 @@ def getAllOrders(request):
     """
     Fetch all orders for Flutter app with proper JSON response.
     Added proper date filter handling to accept 'this_month', 'today', 'this week' strings
+
+    Without ?limit= or ?cursor= every order in the range is returned, as
+    before. With either, results are paged newest first: pass the response's
+    'next_cursor' back as ?cursor= for the next page (null on the last one).
+    ?limit= sets the page size and ?fields=id,order_id,... returns only those
+    fields.
     """
     try:
         logger.info("[v0] getAllOrders API called")
@@ -950,6 +907,34 @@ def getAllOrders(request):
         end_date_str = request.GET.get('end_date')
         
         logger.info(f"[v0] Date filter received: {date_filter}")
+
+        # Older clients send neither parameter and expect the whole range
+        paged = 'limit' in request.GET or 'cursor' in request.GET
+        limit = None
+        if paged:
+            try:
+                limit = min(int(request.GET.get('limit', ORDER_PAGE_SIZE)), MAX_ORDER_PAGE_SIZE)
+                if limit <= 0:
+                    raise ValueError
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'limit must be a positive integer'}, status=400)
+
+        cursor = None
+        if request.GET.get('cursor'):
+            try:
+                cursor = decode_order_cursor(request.GET['cursor'])
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+
+        fields = list(ORDER_LIST_FIELDS)
+        if request.GET.get('fields'):
+            fields = [f.strip() for f in request.GET['fields'].split(',') if f.strip()]
+            unknown = [f for f in fields if f not in ORDER_LIST_FIELDS]
+            if unknown or not fields:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Unknown fields: {", ".join(unknown)}. Allowed: {", ".join(ORDER_LIST_FIELDS)}'
+                }, status=400)
         
         now = timezone.now()
         start_datetime = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -999,56 +984,43 @@ def getAllOrders(request):
             start_datetime = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
             end_datetime = now
         
-        # Query orders for the date range
+        # Query orders for the date range, newest first
         orders = Order.objects.filter(
             created_at__range=(start_datetime, end_datetime)
-        ).order_by('-created_at')
-        
-        logger.info(f"[v0] Found {orders.count()} orders between {start_datetime} and {end_datetime}")
-        
-        # Serialize orders for Flutter app
+        ).order_by('-created_at', '-id')
+
+        if cursor:
+            cursor_created_at, cursor_pk = cursor
+            orders = orders.filter(
+                Q(created_at__lt=cursor_created_at) | Q(created_at=cursor_created_at, id__lt=cursor_pk)
+            )
+
+        columns = {'id', 'created_at'}  # Needed for the next cursor
+        for field in fields:
+            columns.update(ORDER_LIST_FIELDS[field])
+
+        # One extra row tells us whether another page exists, without a COUNT
+        rows = list(orders.values(*columns)[:limit + 1] if paged else orders.values(*columns))
+        next_cursor = None
+        if paged and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_order_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
         orders_data = []
-        for order in orders:
+        for row in rows:
             try:
-                # Safely parse items
-                if isinstance(order.items, str):
-                    try:
-                        items_list = json.loads(order.items)
-                    except json.JSONDecodeError:
-                        logger.error(f"[v0] JSON decode error for order {order.id}")
-                        items_list = []
-                elif isinstance(order.items, list):
-                    items_list = order.items
-                else:
-                    logger.warning(f"[v0] Unexpected items type for order {order.id}")
-                    items_list = []
-                
-                # Format order data for Flutter
-                orders_data.append({
-                    'id': order.id,
-                    'order_id': order.order_id if order.order_id else str(order.id),
-                    'customer_name': order.customer_name,
-                    'customer_mobile': order.customer_mobile,
-                    'items': items_list,
-                    'total_price': float(order.total_price),  # Ensure float
-                    'status': order.status,
-                    'order_status': order.order_status,
-                    'order_placed_by': order.order_placed_by,
-                    'payment_method': order.payment_method,
-                    'created_at': order.created_at.isoformat(),
-                    'ready_time': order.ready_time.isoformat() if order.ready_time else None,
-                    'pickup_time': order.pickup_time.isoformat() if order.pickup_time else None,
-                })
+                orders_data.append(serialize_order_row(row, fields))
             except Exception as e:
-                logger.error(f"[v0] Error serializing order {order.id}: {e}", exc_info=True)
+                logger.error(f"[v0] Error serializing order {row['id']}: {e}", exc_info=True)
                 continue
-        
-        logger.info(f"[v0] Successfully serialized {len(orders_data)} orders")
-        
+
+        logger.info(f"[v0] Serialized {len(orders_data)} orders between {start_datetime} and {end_datetime}")
+
         return JsonResponse({
             'success': True,
             'orders': orders_data,
             'count': len(orders_data),
+            'next_cursor': next_cursor,
             'date_filter': date_filter
         }, safe=False)
         
@@ -1060,6 +1032,41 @@ def getAllOrders(request):
             'details': str(e)
         }, status=500)
 # --- END: Merged updates for getAllOrders ---
+
+@admin_required
+@require_GET
+def export_orders_view(request):
+    """
+    Streams every order created between ?start_date= and ?end_date=
+    (YYYY-MM-DD, inclusive) as ?format=ndjson (default) or csv.
+    """
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': f'format must be one of: {", ".join(EXPORT_FORMATS)}'}, status=400)
+
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'start_date and end_date are required as YYYY-MM-DD'}, status=400)
+    if end_date < start_date:
+        return JsonResponse({'success': False, 'error': 'end_date is before start_date'}, status=400)
+
+    orders = Order.objects.filter(
+        created_at__gte=start_date, created_at__lt=end_date + timedelta(days=1)
+    ).order_by('created_at', 'id')
+
+    if isinstance(request, ASGIRequest):
+        body = aiter_export(orders, export_format)
+    else:
+        body = iter_export(orders, export_format)
+    response = StreamingHttpResponse(body, content_type=EXPORT_FORMATS[export_format])
+    filename = f'orders_{start_date_str}_{end_date_str}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    logger.info(f"📤 Exporting orders {start_date_str}..{end_date_str} as {export_format}")
+    return response
         
 # In: rohitsadavarti/vanita.lunch.home/.../OrderMaster/OrderMaster/views.py
 
@@ -1075,41 +1082,31 @@ def handle_order_action(request):
         order_id = data.get('order_id')  # This is the database ID (pk)
         action = data.get('action')
 
-        order = get_object_or_404(Order, id=order_id)
-
-        if action == 'accept':
-            order.status = 'confirmed'
-            order.order_status = 'open'  # Move to preparing
-            message = f'Order #{order.order_id} accepted successfully.'
-        elif action == 'reject':
-            order.status = 'Rejected'
-            order.order_status = 'cancelled'
-            message = f'Order #{order.order_id} rejected.'
-        else:
+        if action not in ('accept', 'reject'):
             return JsonResponse({'success': False, 'error': 'Invalid action'}, status=400)
 
-        order.save()
-
-        # --- START OF NEW CODE ---
-        # Send an "update" notification to all other devices to close their popups
-        try:
-            message_data = {
-                'type': 'order_update',           # <-- NEW: Message Type
-                'order_pk': str(order.pk),        # <-- NEW: Use PK (which the app calls 'id')
-                'order_id': str(order.order_id),  # <-- NEW: Use Order ID
-                'new_status': order.order_status  # <-- NEW: Send new status
-            }
-            
-            update_message = messaging.Message(
-                data=message_data,
-                topic='new_orders' # Send to the same topic
-            )
-            messaging.send(update_message)
-            logger.info(f'✅ Successfully sent FCM update for order {order.pk}')
-        except Exception as e_fcm:
-            # Log the error, but don't fail the main request
-            logger.error(f"❌ Error sending FCM update for order {order.pk}: {e_fcm}", exc_info=True)
-        # --- END OF NEW CODE ---
+        # Tell all other devices to close their popups, once the change commits
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(id=order_id)
+            was_counted = counts_as_sale(order)
+            if action == 'accept':
+                order.status = 'confirmed'
+                order.order_status = 'open'  # Move to preparing
+                message = f'Order #{order.order_id} accepted successfully.'
+            else:
+                order.status = 'Rejected'
+                order.order_status = 'cancelled'
+                message = f'Order #{order.order_id} rejected.'
+            order.updated_at = get_ist_now_naive()
+            order.save()
+            record_sale_change(order, was_counted)
+            publish_order_event('order_updated', order)
+            enqueue_notification(data={
+                'type': 'order_update',
+                'order_pk': order.pk,         # The app calls this 'id'
+                'order_id': order.order_id,
+                'new_status': order.order_status,
+            })
 
         return JsonResponse({'success': True, 'message': message})
     
@@ -1165,101 +1162,49 @@ def create_manual_order(request):
             logger.warning(f"⚠️ Manual order invalid mobile: {customer_mobile}")
             return JsonResponse({'error': 'Invalid 10-digit mobile number format.'}, status=400)
 
-        if not isinstance(items_data, list):
-            logger.warning(f"⚠️ Manual order items data is not a list. Received: {type(items_data)}")
-            return JsonResponse({'error': '"items" must be a list.'}, status=400)
-
-        subtotal = Decimal('0.00')
-        validated_items = []
-        
-        for item_data in items_data:
-            logger.debug(f"🔍 Processing manual order item: {item_data}")
-            if not all(k in item_data for k in ['id', 'quantity']):
-                logger.warning(f"⚠️ Manual order invalid item data format: {item_data}")
-                return JsonResponse({'error': 'Invalid item data format. Each item needs "id" and "quantity".'}, status=400)
-            try:
-                menu_item = MenuItem.objects.get(id=int(item_data['id']))
-                quantity = int(item_data['quantity'])
-                if quantity <= 0:
-                    logger.warning(f"⚠️ Skipping manual order item ID {menu_item.id} with zero/negative quantity.")
-                    continue
-                item_total = menu_item.price * quantity
-                subtotal += item_total
-                validated_items.append({
-                    'id': menu_item.id,
-                    'name': menu_item.item_name,
-                    'price': float(menu_item.price),
-                    'quantity': quantity,
-                })
-            except MenuItem.DoesNotExist:
-                logger.warning(f"⚠️ Manual order item ID {item_data['id']} not found.")
-                return JsonResponse({'error': f'Menu item with ID {item_data["id"]} not found.'}, status=400)
-            except (ValueError, TypeError):
-                logger.warning(f"⚠️ Manual order invalid quantity for item ID {item_data.get('id', 'unknown')}.")
-                return JsonResponse({'error': f'Invalid quantity for item ID {item_data.get("id", "unknown")}.'}, status=400)
-
-        if not validated_items:
-            logger.warning("⚠️ Manual order failed: No valid items found after validation.")
-            return JsonResponse({'error': 'No valid items provided.'}, status=400)
+        try:
+            validated_items, subtotal = validate_cart(items_data)
+        except OrderValidationError as e:
+            logger.warning(f"⚠️ Manual order failed validation: {e}")
+            return JsonResponse({'error': str(e)}, status=400)
 
         ist_tz = pytz.timezone('Asia/Kolkata')
-        now_ist = datetime.now(ist_tz)
-        now_ist_str = now_ist.strftime('%Y-%m-%d %H:%M:%S.%f')
+        now_ist = datetime.now(ist_tz).replace(tzinfo=None)
         
-        new_order = Order.objects.create(
-            customer_name=customer_name,
-            customer_mobile=customer_mobile,
-            items=validated_items,
-            subtotal=subtotal,
-            discount=Decimal('0.00'),
-            total_price=subtotal,
-            status='confirmed',
-            payment_method=final_payment_method,
-            payment_id=final_payment_method,
-            order_status='open',
-            order_placed_by='counter',
-            created_at=now_ist_str,  # <-- USE THE STRING
-            updated_at=now_ist_str
-        )
-
-        try:
-            while True:
-                generated_id = str(random.randint(10000000, 99999999))
-                if not Order.objects.filter(order_id=generated_id).exists():
-                    new_order.order_id = generated_id
-                    new_order.save(update_fields=['order_id'])
-                    logger.info(f"✅ Assigned custom Order ID {new_order.order_id} to PK {new_order.pk}.")
-                    break
-        except Exception as e_genid:
-            logger.error(f"❌ Failed to generate and save custom order_id for PK {new_order.pk}: {e_genid}", exc_info=True)
-            return JsonResponse({'error': 'Failed to finalize order ID.'}, status=500)
-
-        generated_order_id = new_order.order_id
-
-        # --- MODIFICATION: Changed FCM message for counter orders ---
-        try:
-            items_json = json.dumps(new_order.items)
-            order_db_id = str(new_order.pk)
-            message_data = {
-                'id': order_db_id,
-                'order_id': generated_order_id,
-                'customer_name': customer_name,
-                'total_price': str(subtotal),
-                'items': items_json,
-                'order_source': 'counter' # This tells the client *NOT* to show the popup
-            }
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title='✅ Counter Order Placed', # Changed title
-                    body=f'Order #{generated_order_id} for {customer_name} created.' # Changed body
-                ),
-                data=message_data,
-                topic='new_orders'
+        with transaction.atomic():
+            new_order = create_order(
+                customer_name=customer_name,
+                customer_mobile=customer_mobile,
+                items=validated_items,
+                subtotal=subtotal,
+                discount=Decimal('0.00'),
+                total_price=subtotal,
+                status='confirmed',
+                payment_method=final_payment_method,
+                payment_id=final_payment_method,
+                order_status='open',
+                order_placed_by='counter',
+                created_at=now_ist,
+                updated_at=now_ist
             )
-            messaging.send(message)
-            logger.info(f'✅ Successfully sent FCM message for manual order {generated_order_id}')
-        except Exception as e_fcm:
-            logger.error(f"❌ Error sending counter order notification for {generated_order_id}: {e_fcm}", exc_info=True)
+            generated_order_id = new_order.order_id
+            record_sale_change(new_order, was_counted=False)  # Counter orders count as sold right away
+            publish_order_event('order_created', new_order)
+
+            enqueue_notification(
+                data={
+                    'id': new_order.pk,
+                    'order_id': generated_order_id,
+                    'customer_name': customer_name,
+                    'total_price': subtotal,
+                    'items': json.dumps(new_order.items),
+                    'order_source': 'counter' # This tells the client *NOT* to show the popup
+                },
+                title='✅ Counter Order Placed',
+                body=f'Order #{generated_order_id} for {customer_name} created.',
+            )
+
+        logger.info(f"✅ Manual order {generated_order_id} (PK: {new_order.pk}) created.")
 
         return JsonResponse({
             'success': True,
@@ -1432,19 +1377,12 @@ def analytics_data_api(request):
         total_orders = Order.objects.count() # Total orders placed, not just completed
         completed_orders_count = completed_orders.count()
 
-        # Extract all items from completed orders
-        all_items = []
-        for order in completed_orders:
-            try:
-                items_list = json.loads(order.items) if isinstance(order.items, str) else order.items
-                if isinstance(items_list, list):
-                    for item in items_list:
-                        all_items.append(item.get('name', 'Unknown'))
-            except json.JSONDecodeError:
-                logger.warning(f"Could not decode items for order {order.id}")
-                continue
-                
-        item_counts = Counter(all_items).most_common(5)
+        # Most frequently ordered items, counted per order line in SQL
+        with connection.cursor() as cursor:
+            item_counts = item_totals(
+                cursor, orders_where(start_date, end_date + timedelta(microseconds=1), order_status='pickedup'),
+                limit=5, measure='lines',
+            )
 
         data = {
             'total_revenue': float(total_revenue),
@@ -0,0 +1,49 @@
+// OrderMaster/static/js/order-events.js
+
+(function() {
+    'use strict';
+
+    // Live order updates over Server-Sent Events (api/order-events/).
+    // EventSource reconnects on its own and sends Last-Event-ID, so the server
+    // replays anything that changed while we were disconnected.
+    if (!window.EventSource) {
+        console.log('ℹ️ EventSource not supported, relying on FCM notifications');
+        return;
+    }
+
+    const source = new EventSource('/api/order-events/');
+
+    function handleOrderEvent(message) {
+        let event;
+        try {
+            event = JSON.parse(message.data);
+        } catch (err) {
+            console.error('Malformed order event:', message.data);
+            return;
+        }
+
+        // Pages that render orders can listen for this and patch themselves in place
+        window.dispatchEvent(new CustomEvent('order-event', { detail: event }));
+
+        // New customer orders still need the accept/reject popup
+        if (event.type === 'order_created' &&
+            event.order_placed_by === 'customer' &&
+            event.status === 'pending' &&
+            window.handleNewOrderNotification) {
+            window.handleNewOrderNotification({
+                id: String(event.id),
+                order_id: event.order_id,
+                customer_name: event.customer_name,
+                order_source: 'customer',
+                status: 'pending'
+            });
+        }
+    }
+
+    source.addEventListener('order_created', handleOrderEvent);
+    source.addEventListener('order_updated', handleOrderEvent);
+    source.onerror = function() {
+        console.log('⚠️ Order event stream interrupted, reconnecting...');
+    };
+
+})();
@@ -4,6 +4,7 @@
 Django settings for vanita_lunch project.
 """
 import os
+import sys
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -11,6 +12,10 @@ import dj_database_url
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Modules shared with the Flask customer app (shared/) live at the repository root
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.append(str(BASE_DIR.parent))
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = config('SECRET_KEY', default='django-insecure-b9j01@*vxpl=+zr2@3uq)*=0&o7q7&t1cncn9en*(atpb+9*8o')
 
@@ -71,6 +76,27 @@ DATABASES = {
     )
 }
 
+# Key for the permutation that turns order sequence numbers into public 8-digit
+# order IDs. Changing it after orders exist can produce IDs that were already issued.
+ORDER_ID_PERMUTATION_KEY = config('ORDER_ID_PERMUTATION_KEY', default='vanita-lunch-order-ids')
+
+# Live order events (api/order-events/). 'postgres' relays them through
+# LISTEN/NOTIFY so every worker sees them; 'memory' stays within one process.
+ORDER_EVENTS_BROKER = config('ORDER_EVENTS_BROKER', default='postgres')
+# LISTEN needs a session-mode connection. Set this when DATABASE_URL points at
+# Supabase's transaction pooler (port 6543), e.g. the session pooler on port 5432.
+ORDER_EVENTS_LISTEN_URL = config('ORDER_EVENTS_LISTEN_URL', default=None)
+
+# Push notifications wait in the notification_outbox table. Each web process
+# drains it in a background thread after an order commits, so they go out
+# even when no notification_worker is running. Set this to False once a
+# worker is deployed. Sent rows are deleted after NOTIFICATION_RETENTION_DAYS.
+NOTIFICATION_DRAIN_ON_COMMIT = config('NOTIFICATION_DRAIN_ON_COMMIT', default=True, cast=bool)
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=7, cast=int)
+# Without FIREBASE_CREDENTIALS, fall back to Google application default
+# credentials (local development only; this can probe the GCE metadata server).
+FIREBASE_DEFAULT_CREDENTIALS = config('FIREBASE_DEFAULT_CREDENTIALS', default=False, cast=bool)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
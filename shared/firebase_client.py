@@ -0,0 +1,165 @@
+# shared/firebase_client.py
+"""
+Lazily initialized Firebase Cloud Messaging client shared by the Django admin
+portal and the Flask customer app.
+
+Nothing is imported or initialized at import time: firebase_admin is loaded
+and initialize_app() runs on the first send, and the time that took is
+recorded in stats(). ApplicationDefault() credential discovery, which can
+probe the GCE metadata server, is only used when a caller opts in. A failed
+initialization is retried on a later send, after an exponential backoff, so a
+transient credential error does not disable FCM until the process restarts.
+Tests and local runs can swap in FakeFirebaseClient with set_client(), or by
+setting FIREBASE_CLIENT=fake.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROJECT_ID = 'vanita-lunch-home'
+INIT_RETRY_BASE_SECONDS = 5
+INIT_RETRY_MAX_SECONDS = 300
+
+
+class FirebaseUnavailable(Exception):
+    """Raised when a send is attempted but the Admin SDK could not be initialized."""
+
+
+def messaging_module():
+    """Returns firebase_admin.messaging (for Message/Notification types) without initializing the SDK."""
+    from firebase_admin import messaging
+    return messaging
+
+
+class FirebaseClient:
+    def __init__(self, credentials_env='FIREBASE_CREDENTIALS', default_credentials=False,
+                 project_id=DEFAULT_PROJECT_ID, clock=time.monotonic):
+        self.credentials_env = credentials_env
+        self.default_credentials = default_credentials
+        self.project_id = project_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._app = None
+        self._retry_at = None  # When a failed initialization may be attempted again
+        self._stats = {'initialized': False, 'credentials': None, 'init_seconds': None, 'init_error': None,
+                       'init_attempts': 0}
+
+    @property
+    def configured(self):
+        """True if initialization can be attempted; cheap, never touches the SDK."""
+        return bool(os.environ.get(self.credentials_env)) or self.default_credentials
+
+    def _initialize(self):
+        # Timed from the import, which is a large part of a cold start
+        started = time.monotonic()
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            if firebase_admin._apps:
+                self._app = firebase_admin.get_app()
+                self._stats['credentials'] = 'existing'
+            elif os.environ.get(self.credentials_env):
+                cred = credentials.Certificate(json.loads(os.environ[self.credentials_env]))
+                self._app = firebase_admin.initialize_app(cred)
+                self._stats['credentials'] = 'service_account'
+            elif self.default_credentials:
+                # Opt-in fallback for local development
+                self._app = firebase_admin.initialize_app(credentials.ApplicationDefault(), {
+                    'projectId': self.project_id,
+                })
+                self._stats['credentials'] = 'application_default'
+            else:
+                raise FirebaseUnavailable(f'{self.credentials_env} is not set')
+            self._stats['initialized'] = True
+            logger.info(f"✅ Firebase Admin SDK initialized ({self._stats['credentials']})")
+        except Exception as e:
+            self._stats['init_error'] = str(e)
+            failures = self._stats['init_attempts'] + 1
+            delay = min(INIT_RETRY_BASE_SECONDS * 2 ** (failures - 1), INIT_RETRY_MAX_SECONDS)
+            self._retry_at = self._clock() + delay
+            logger.error(f"❌ Failed to initialize Firebase Admin SDK (retrying in {delay}s): {e}")
+        finally:
+            self._stats['init_attempts'] += 1
+            self._stats['init_seconds'] = round(time.monotonic() - started, 4)
+
+    def app(self):
+        """Initializes the Admin SDK on first use (or once a failed attempt's backoff ends) and returns its app."""
+        if self._app is None and (self._retry_at is None or self._clock() >= self._retry_at):
+            with self._lock:
+                if self._app is None and (self._retry_at is None or self._clock() >= self._retry_at):
+                    self._initialize()
+        if self._app is None:
+            raise FirebaseUnavailable(self._stats['init_error'] or 'Firebase Admin SDK is not initialized')
+        return self._app
+
+    def send(self, message):
+        return messaging_module().send(message, app=self.app())
+
+    def send_each(self, messages):
+        return messaging_module().send_each(messages, app=self.app())
+
+    def subscribe_to_topic(self, tokens, topic):
+        return messaging_module().subscribe_to_topic(tokens, topic, app=self.app())
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, configured=self.configured)
+
+
+class FakeFirebaseClient:
+    """In-process stand-in that records messages instead of sending them."""
+    configured = True
+
+    def __init__(self):
+        self.sent = []
+        self.subscriptions = []
+
+    def send(self, message):
+        self.sent.append(message)
+        return f'projects/fake/messages/{len(self.sent)}'
+
+    def send_each(self, messages):
+        messaging = messaging_module()
+        responses = []
+        for message in messages:
+            responses.append(messaging.SendResponse({'name': self.send(message)}, None))
+        return messaging.BatchResponse(responses)
+
+    def subscribe_to_topic(self, tokens, topic):
+        self.subscriptions.extend((token, topic) for token in tokens)
+        return messaging_module().TopicManagementResponse({'results': [{} for _ in tokens]})
+
+    def stats(self):
+        return {'initialized': True, 'credentials': 'fake', 'init_seconds': 0.0, 'init_error': None,
+                'configured': True}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """Sets how the shared client finds its credentials (see FirebaseClient); does not initialize it."""
+    global _client
+    with _client_lock:
+        _client = FakeFirebaseClient() if os.environ.get('FIREBASE_CLIENT') == 'fake' else FirebaseClient(**kwargs)
+    return _client
+
+
+def get_client():
+    if _client is None:
+        configure()
+    return _client
+
+
+def set_client(client):
+    """Replaces the shared client (e.g. with a FakeFirebaseClient) and returns the previous one."""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    return previous
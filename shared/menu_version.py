@@ -0,0 +1,12 @@
+# shared/menu_version.py
+"""
+Change counter for the menu, kept in the cache_versions table.
+
+The Django admin portal bumps it whenever a MenuItem is saved or deleted
+(OrderMaster/menu_cache.py), and the Flask customer app reads it to decide
+whether its cached /api/menu-items response is still current.
+"""
+
+MENU_VERSION_KEY = 'menu'
+
+MENU_VERSION_SQL = "SELECT version FROM cache_versions WHERE key = %s"
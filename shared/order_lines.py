@@ -0,0 +1,59 @@
+# shared/order_lines.py
+"""
+SQL that copies an order's `items` JSON into the normalized order_lines table.
+
+Both apps run the same statement in the transaction that inserts the order
+(Django's create_order and Flask's place_order), and the backfill_order_lines
+command runs it over existing orders in id ranges, so every row is derived
+by one set of rules:
+
+- legacy rows holding the items array as a JSON string are unwrapped;
+- lines that are not JSON objects are skipped;
+- the name snapshot falls back to 'Unknown' and is cut to 200 characters;
+- quantity is NULL unless it is an integer;
+- a missing price is 0, a malformed one is NULL;
+- menu_item_id is set only if the menu item still exists.
+
+ON CONFLICT (order_id, position) makes it safe to run more than once.
+"""
+
+_ITEMS_ARRAY = r"""
+    CASE jsonb_typeof(o.items::jsonb)
+        WHEN 'array' THEN o.items::jsonb
+        WHEN 'string' THEN CASE WHEN (o.items::jsonb #>> '{}') ~ '^\s*\['
+                                THEN (o.items::jsonb #>> '{}')::jsonb ELSE '[]'::jsonb END
+        ELSE '[]'::jsonb
+    END
+"""
+# Digit limits keep the casts inside int / numeric(10, 2)
+_QUANTITY = r"CASE WHEN (it.value->>'quantity') ~ '^\s*-?\d{1,9}\s*$' THEN (it.value->>'quantity')::int END"
+_UNIT_PRICE = r"""
+    CASE WHEN it.value->>'price' IS NULL THEN 0
+         WHEN (it.value->>'price') ~ '^\s*-?\d{1,8}(\.\d+)?\s*$' THEN (it.value->>'price')::numeric(10, 2)
+    END
+"""
+_MENU_ITEM_ID = r"CASE WHEN (it.value->>'id') ~ '^\s*\d{1,9}\s*$' THEN (it.value->>'id')::int END"
+
+
+def insert_order_lines_sql(where):
+    """
+    INSERT ... SELECT writing the lines of every order matching `where`, a
+    SQL condition on the orders alias `o`.
+    """
+    return f"""
+        INSERT INTO order_lines (order_id, position, menu_item_id, name, unit_price, quantity)
+        SELECT o.id, it.position, m.id,
+               LEFT(COALESCE(NULLIF(it.value->>'name', ''), 'Unknown'), 200),
+               {_UNIT_PRICE}, {_QUANTITY}
+        FROM orders o
+        CROSS JOIN LATERAL jsonb_array_elements({_ITEMS_ARRAY}) WITH ORDINALITY AS it(value, position)
+        LEFT JOIN menu_items m ON m.id = {_MENU_ITEM_ID}
+        WHERE jsonb_typeof(it.value) = 'object' AND {where}
+        ON CONFLICT (order_id, position) DO NOTHING
+    """
+
+
+# Lines for the orders whose ids are passed as one array parameter
+INSERT_LINES_FOR_ORDERS_SQL = insert_order_lines_sql('o.id = ANY(%s)')
+# Lines for the orders with lower_id < id <= upper_id (backfill chunks)
+INSERT_LINES_FOR_ID_RANGE_SQL = insert_order_lines_sql('o.id > %s AND o.id <= %s')
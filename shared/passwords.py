@@ -0,0 +1,152 @@
+# shared/passwords.py
+"""
+bcrypt password hashing for admin logins (Django) and customer logins (Flask).
+
+- The work factor comes from BCRYPT_ROUNDS (default 12). Hashes made with a
+  different cost still verify, and verify_and_update() returns a fresh hash
+  so callers can store it: raising or lowering the cost takes effect for each
+  user on their next successful login.
+- Hashing runs on a small dedicated thread pool (PASSWORD_HASH_WORKERS).
+  bcrypt releases the GIL, so the pool runs in parallel, but at most that many
+  hashes are using CPU at once. At most PASSWORD_HASH_MAX_PENDING can be
+  running or queued; further calls raise PasswordHasherBusy straight away, so
+  a login storm fails fast instead of queueing without bound.
+- The caller still blocks until its hash is done; the pool caps CPU use and
+  concurrency, it does not make a login non-blocking. In the threaded Flask
+  app other request threads keep running meanwhile. Django sync views under
+  the ASGI server share one thread per worker process, so an admin login
+  still holds up that worker's other sync views for the length of one hash.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when PASSWORD_HASH_MAX_PENDING hashes are already running or queued."""
+
+
+def hash_rounds(password_hash):
+    """The cost a bcrypt hash was made with ('$2b$12$...' -> 12), or None if it is not a bcrypt hash."""
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._stats = {'hashed': 0, 'verified': 0, 'rehashed': 0, 'rejected': 0, 'pending': 0,
+                       'max_pending': 0, 'busy_seconds': 0.0}
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusy(f'{self.max_pending} password hashes already pending')
+        try:
+            if self._executor is None:
+                with self._lock:
+                    # Created on first use, so each process gets its own threads after a fork
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+            with self._lock:
+                self._stats['pending'] += 1
+                self._stats['max_pending'] = max(self._stats['max_pending'], self._stats['pending'])
+            return self._executor.submit(self._timed, fn, *args).result()
+        finally:
+            with self._lock:
+                self._stats['pending'] -= 1
+            self._slots.release()
+
+    def _timed(self, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._stats['busy_seconds'] += time.monotonic() - started
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def _verify(self, password, password_hash):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError:  # Not a bcrypt hash
+            return False
+
+    def hash(self, password):
+        password_hash = self._run(self._hash, password)
+        with self._lock:
+            self._stats['hashed'] += 1
+        return password_hash
+
+    def verify(self, password, password_hash):
+        if not password or not password_hash:
+            return False
+        valid = self._run(self._verify, password, password_hash)
+        with self._lock:
+            self._stats['verified'] += 1
+        return valid
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def verify_and_update(self, password, password_hash):
+        """
+        Returns (valid, new_hash). new_hash is set when the password is valid
+        but its hash was made with a different cost; the caller should store it.
+        """
+        if not self.verify(password, password_hash):
+            return False, None
+        if not self.needs_rehash(password_hash):
+            return True, None
+        new_hash = self.hash(password)
+        with self._lock:
+            self._stats['rehashed'] += 1
+        logger.info(f"✅ Rehashed a password from cost {hash_rounds(password_hash)} to {self.rounds}")
+        return True, new_hash
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, busy_seconds=round(self._stats['busy_seconds'], 3))
+        stats.update(rounds=self.rounds, workers=self.workers, pending_limit=self.max_pending)
+        return stats
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def set_hasher(hasher):
+    """Replaces the shared hasher (e.g. with a cheaper cost in tests) and returns the previous one."""
+    global _hasher
+    with _hasher_lock:
+        previous, _hasher = _hasher, hasher
+    return previous
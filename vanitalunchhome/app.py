@@ -1,26 +1,49 @@
+import atexit
+import gzip
+import hashlib
+import hmac
 import json
 import os
+import queue
 import random
 import smtplib
+import sys
 import threading  # Added for background Firebase notifications
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-import bcrypt
-# --- Firebase Imports ---
-import firebase_admin
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import pytz
 import requests  # Added for Green API HTTP requests
-from firebase_admin import credentials, messaging
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, g, has_app_context, jsonify, render_template, request
 from flask_cors import CORS
 from whitenoise import WhiteNoise
 
+# shared/ (also used by the Django admin portal) lives at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.firebase_client import configure as configure_firebase, messaging_module  # noqa: E402
+from shared.menu_version import MENU_VERSION_KEY, MENU_VERSION_SQL  # noqa: E402
+from shared.passwords import PasswordHasherBusy, get_hasher  # noqa: E402
+from otp_store import OTP_EXPIRED, OTP_LOCKED, OTP_OK, get_otp_store, process_local_problem  # noqa: E402
+from shared.order_lines import INSERT_LINES_FOR_ORDERS_SQL  # noqa: E402
 
-def get_db_connection():
-    """Create and return a database connection using DATABASE_URL environment variable"""
+
+# --- Database Connection Pool ---
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def get_database_url():
+    """Return DATABASE_URL in the postgresql:// form psycopg2 expects"""
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
         raise Exception("DATABASE_URL environment variable not set")
@@ -28,34 +51,108 @@ def get_db_connection():
     # Handle Render/Heroku postgres:// vs postgresql:// URL format
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql://", 1)
-    
-    conn = psycopg2.connect(database_url)
-    return conn
-
-# --- Securely Initialize Firebase Admin SDK ---
-try:
-    firebase_key_json = os.environ.get('FIREBASE_KEY')
-    if firebase_key_json:
-        firebase_credentials = json.loads(firebase_key_json)
-        cred = credentials.Certificate(firebase_credentials)
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        print("Firebase Admin SDK initialized successfully.")
-    else:
-        print("WARNING: FIREBASE_KEY variable not found. Notifications disabled.")
-except Exception as e:
-    print(f"Error initializing Firebase: {e}")
-    print("WARNING: Firebase notifications disabled.")
+    return database_url
+
+
+def connect_db():
+    """Open a new, unpooled database connection (caller closes it)"""
+    return psycopg2.connect(get_database_url())
+
+
+def get_db_pool():
+    """Create the shared ThreadedConnectionPool on first use"""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, get_database_url())
+    return _db_pool
+
+
+def _checkout_db_connection():
+    # ThreadedConnectionPool raises as soon as it is exhausted, so wait for a slot first
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise Exception(f"No database connection free after {DB_POOL_TIMEOUT}s (pool size {DB_POOL_MAX})")
+    try:
+        pool = get_db_pool()
+        conn = pool.getconn()
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        return conn
+    except Exception:
+        _db_pool_slots.release()
+        raise
+
+
+def _release_db_connection(conn):
+    pool = get_db_pool()
+    try:
+        broken = conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+        if not broken:
+            # Routes commit explicitly; anything left open is discarded
+            conn.rollback()
+        pool.putconn(conn, close=bool(broken))
+    except Exception as e:
+        print(f"Error returning database connection to pool: {e}")
+        pool.putconn(conn, close=True)
+    finally:
+        _db_pool_slots.release()
+
+
+def get_db_connection():
+    """
+    Return the current request's database connection. It is checked out of the
+    pool on first use and returned when the app context tears down, so routes
+    must not close it. Outside a request a plain connection is opened instead.
+    """
+    if not has_app_context():
+        return connect_db()
+    if 'db_conn' not in g:
+        g.db_conn = _checkout_db_connection()
+    return g.db_conn
+
+
+def put_db_connection():
+    """
+    Return the current request's connection to the pool early, before slow
+    work that needs no database (e.g. password hashing). A later
+    get_db_connection() checks out a connection again.
+    """
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        _release_db_connection(conn)
+
+# --- Firebase Admin SDK (initialized on the first notification, not at import) ---
+firebase = configure_firebase(credentials_env='FIREBASE_KEY')
+if not firebase.configured:
+    print("WARNING: FIREBASE_KEY variable not found. Notifications disabled.")
+
+# --- OTP store (kept in process memory unless OTP_STORE_URL is set) ---
+otp_store_problem = process_local_problem()
+if otp_store_problem:
+    raise RuntimeError(otp_store_problem)
 
 app = Flask(__name__)
 app.wsgi_app = WhiteNoise(app.wsgi_app, root=os.path.join(os.path.dirname(__file__), 'static'), prefix='static/')
 CORS(app, origins=['*'])
 
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        _release_db_connection(conn)
+
 # --- Email Configuration ---
 SMTP_EMAIL = os.environ.get('MAIL_USERNAME')
 SMTP_PASSWORD = os.environ.get('MAIL_PASSWORD')
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.environ.get('SMTP_SERVER', "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+# SMTP_STARTTLS=0 talks plain SMTP without login, for a local stand-in such as
+# `python -m aiosmtpd -n -l localhost:1025`
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') != '0'
+SMTP_IDLE_TIMEOUT = 60  # seconds a worker keeps an unused SMTP session open
 
 GREEN_API_ID_INSTANCE = os.environ.get('GREEN_API_ID_INSTANCE', '7105417909')
 GREEN_API_TOKEN = os.environ.get('GREEN_API_TOKEN', '5a524925ff024788818b04590bcfa39f5a1efa8e0e0b42c2b8')
@@ -64,10 +161,139 @@ GREEN_API_URL = os.environ.get('GREEN_API_URL', 'https://7105.api.greenapi.com')
 SMS_API_KEY = os.environ.get('SMS_API_KEY')  # For future SMS implementation
 SMS_SENDER_ID = os.environ.get('SMS_SENDER_ID')  # For future SMS implementation
 
+# --- Background side effects (push notifications, confirmation emails) ---
+SIDE_EFFECT_WORKERS = int(os.environ.get('SIDE_EFFECT_WORKERS', 2))
+SIDE_EFFECT_QUEUE_SIZE = int(os.environ.get('SIDE_EFFECT_QUEUE_SIZE', 200))
+SIDE_EFFECT_DRAIN_TIMEOUT = float(os.environ.get('SIDE_EFFECT_DRAIN_TIMEOUT', 10))  # seconds, on shutdown
+# The customer app has no admin login; /api/side-effect-stats needs this bearer token and is off without it
+STATS_TOKEN = os.environ.get('STATS_TOKEN')
+
+_worker_state = threading.local()  # per-worker SMTP session
+
+
+class SideEffectExecutor:
+    """
+    Fixed set of daemon worker threads fed by a bounded queue. When the queue
+    is full, submit() drops the job and counts it instead of blocking the
+    request. Jobs still queued at exit are drained for up to
+    SIDE_EFFECT_DRAIN_TIMEOUT seconds.
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                       'max_queue_depth': 0, 'max_wait_seconds': 0.0}
+
+    def _start(self):
+        # Threads start on the first job, so they are created in each worker process after a fork
+        with self._lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f'side-effects-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns False if the job was rejected"""
+        if self._closed:
+            return False
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait((fn, args, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            print(f"⚠️ Side-effect queue full ({self._queue.maxsize}); dropped {fn.__name__}")
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=SMTP_IDLE_TIMEOUT)
+            except queue.Empty:
+                close_smtp_session()
+                continue
+            if job is None:
+                close_smtp_session()
+                return
+            fn, args, queued_at = job
+            wait = time.monotonic() - queued_at
+            try:
+                fn(*args)
+                outcome = 'completed'
+            except Exception as e:
+                print(f"❌ Side effect {fn.__name__} failed: {e}")
+                outcome = 'failed'
+            with self._lock:
+                self._stats[outcome] += 1
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], round(wait, 3))
+
+    def shutdown(self, timeout=SIDE_EFFECT_DRAIN_TIMEOUT):
+        """Stop accepting jobs and wait up to `timeout` seconds for the queue to drain"""
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        if self._queue.qsize():
+            print(f"⚠️ {self._queue.qsize()} side effects still queued at shutdown")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(workers=self.workers, queue_depth=self._queue.qsize(), queue_size=self._queue.maxsize)
+        return stats
+
+
+side_effects = SideEffectExecutor(SIDE_EFFECT_WORKERS, SIDE_EFFECT_QUEUE_SIZE)
+atexit.register(side_effects.shutdown)
+
+
 # --- Helper: Send Email ---
+def _smtp_session():
+    """The calling thread's SMTP session, connected (and logged in) on first use"""
+    server = getattr(_worker_state, 'smtp', None)
+    if server is None:
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS:
+            server.starttls()
+            server.login(SMTP_EMAIL, SMTP_PASSWORD)
+        _worker_state.smtp = server
+    return server
+
+
+def close_smtp_session():
+    server = getattr(_worker_state, 'smtp', None)
+    _worker_state.smtp = None
+    if server is not None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
 def send_email(to_email, subject, body):
-    """Send an email to the specified recipient with the given subject and body."""
-    if not SMTP_EMAIL or not SMTP_PASSWORD:
+    """
+    Send an email to the specified recipient with the given subject and body.
+    Runs on the side-effect workers, each of which keeps one SMTP session open
+    between emails.
+    """
+    if not SMTP_EMAIL or (SMTP_STARTTLS and not SMTP_PASSWORD):
         print(f"DEBUG: Email credentials missing. Email to {to_email} not sent.")
         return False
         
@@ -79,13 +305,15 @@ def send_email(to_email, subject, body):
         
         msg.attach(MIMEText(body, 'html')) # Use HTML for better formatting
         
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_EMAIL, SMTP_PASSWORD)
-        server.sendmail(SMTP_EMAIL, to_email, msg.as_string())
-        server.quit()
+        try:
+            _smtp_session().sendmail(SMTP_EMAIL, to_email, msg.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server closed the idle session; reconnect once
+            close_smtp_session()
+            _smtp_session().sendmail(SMTP_EMAIL, to_email, msg.as_string())
         return True
     except Exception as e:
+        close_smtp_session()
         print(f"Failed to send email: {e}")
         return False
 
@@ -164,14 +392,21 @@ def send_otp_sms(mobile_number, otp):
 def index():
     return render_template('index.html')
 
+def otp_rate_limited(retry_after):
+    response = jsonify({'success': False, 'error': 'Too many attempts. Please wait before trying again.',
+                        'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     conn = None
     try:
-        data = request.get_json()
-        full_name = data.get('full_name')
-        mobile = data.get('mobile')
-        email = data.get('email', '').strip().lower()
+        data = request.get_json(silent=True) or {}
+        full_name = str(data.get('full_name') or '').strip()
+        mobile = str(data.get('mobile') or '').strip()
+        email = str(data.get('email') or '').strip().lower()
         password = data.get('password')
         otp_method = data.get('otp_method', 'whatsapp')  # Default to WhatsApp
         
@@ -180,6 +415,12 @@ def register_user():
         lat = data.get('latitude', None)
         lng = data.get('longitude', None)
 
+        if not full_name or not mobile or not password or not isinstance(password, str):
+            return jsonify({'success': False, 'error': 'Full name, mobile and password are required'}), 400
+
+        # Hashed before a pooled connection is checked out, so it is not held during bcrypt
+        hashed_pw = get_hasher().hash(password)
+
         conn = get_db_connection()
         cur = conn.cursor()
 
@@ -194,19 +435,22 @@ def register_user():
             if cur.fetchone():
                 return jsonify({'success': False, 'error': 'Email address already registered'}), 400
 
-        # 3. IF CLEAR, PROCEED TO INSERT
-        hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        otp = str(random.randint(100000, 999999))
-        
+        # 3. A send token is only taken once a code is about to be issued
+        allowed, retry_after = get_otp_store().allow('send', mobile)
+        if not allowed:
+            return otp_rate_limited(retry_after)
+
+        # 4. IF CLEAR, PROCEED TO INSERT (the OTP itself is kept in the OTP store)
         cur.execute("""
             INSERT INTO vlh_user 
-            (full_name, mobile_number, email, password_hash, address_full, latitude, longitude, otp_code, otp_created_at, email_verified)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), FALSE)
+            (full_name, mobile_number, email, password_hash, address_full, latitude, longitude, email_verified)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, FALSE)
             RETURNING id
-        """, (full_name, mobile, email, hashed_pw, address, lat, lng, otp))
+        """, (full_name, mobile, email, hashed_pw, address, lat, lng))
         
         user_id = cur.fetchone()[0]
         conn.commit()
+        otp = get_otp_store().issue(mobile)
         
         print(f"DEBUG: OTP for {mobile} is ===> {otp} <===")
         
@@ -225,40 +469,36 @@ def register_user():
             'otp_sent': otp_sent
         })
 
+    except PasswordHasherBusy:
+        return jsonify({'success': False, 'error': 'Too many requests right now. Please try again.'}), 503
     except Exception as e:
         if conn: conn.rollback()
         print(f"Register Error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/resend-otp', methods=['POST'])
 def resend_otp():
-    conn = None
     try:
         data = request.get_json()
         mobile = data.get('mobile', '').strip()
         otp_method = data.get('otp_method', 'whatsapp')
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        otp_store = get_otp_store()
+        allowed, retry_after = otp_store.allow('send', mobile)
+        if not allowed:
+            return otp_rate_limited(retry_after)
         
-        # Generate new OTP
-        new_otp = str(random.randint(100000, 999999))
-        
-        # Update OTP in database
-        cur.execute("""
-            UPDATE vlh_user 
-            SET otp_code = %s, otp_created_at = NOW() 
-            WHERE mobile_number = %s AND email_verified = FALSE
-            RETURNING id
-        """, (new_otp, mobile))
-        
-        result = cur.fetchone()
-        if not result:
-            return jsonify({'success': False, 'error': 'User not found or already verified'}), 400
+        # A pending code means the user registered and is unverified; otherwise ask the database
+        if not otp_store.has_pending(mobile):
+            cur = get_db_connection().cursor()
+            cur.execute("SELECT id FROM vlh_user WHERE mobile_number = %s AND email_verified = FALSE", (mobile,))
+            result = cur.fetchone()
+            cur.close()
+            if not result:
+                return jsonify({'success': False, 'error': 'User not found or already verified'}), 400
         
-        conn.commit()
+        # Generate new OTP (valid for 10 minutes)
+        new_otp = otp_store.issue(mobile)
         
         # Send OTP
         print(f"DEBUG: New OTP for {mobile} is ===> {new_otp} <===")
@@ -278,64 +518,55 @@ def resend_otp():
     except Exception as e:
         print(f"Resend OTP Error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
             
 @app.route('/api/verify-otp', methods=['POST'])
 def verify_otp():
-    conn = None
     try:
         data = request.get_json()
         mobile = data.get('mobile', '').strip()
         otp_input = str(data.get('otp', '')).strip()
         
+        otp_store = get_otp_store()
+        allowed, retry_after = otp_store.allow('verify', mobile)
+        if not allowed:
+            return otp_rate_limited(retry_after)
+        
+        # Wrong, expired and locked codes are settled by the OTP store without touching the database
+        outcome = otp_store.verify(mobile, otp_input)
+        if outcome == OTP_EXPIRED:
+            return jsonify({'success': False, 'error': 'OTP expired. Please request a new one.'}), 400
+        if outcome == OTP_LOCKED:
+            return jsonify({'success': False, 'error': 'Too many wrong attempts. Please request a new OTP.'}), 400
+        if outcome != OTP_OK:
+            return jsonify({'success': False, 'error': 'Invalid OTP'}), 400
+        
         conn = get_db_connection()
         cur = conn.cursor()
-        
         cur.execute("""
-            SELECT otp_code, id, full_name, mobile_number, email, address_full, otp_created_at
-            FROM vlh_user WHERE mobile_number = %s
+            UPDATE vlh_user SET email_verified = TRUE, otp_code = NULL
+            WHERE mobile_number = %s
+            RETURNING id, full_name, mobile_number, email, address_full
         """, (mobile,))
         result = cur.fetchone()
+        conn.commit()
+        cur.close()
         
-        if result:
-            db_otp = str(result[0]).strip()
-            user_id = result[1]
-            full_name = result[2]
-            mobile_number = result[3]
-            email = result[4]
-            address = result[5]
-            otp_created_at = result[6]
-            
-            # Check if OTP is expired (10 minutes)
-            if otp_created_at:
-                otp_age = datetime.now(otp_created_at.tzinfo) - otp_created_at if otp_created_at.tzinfo else datetime.now() - otp_created_at
-                if otp_age.total_seconds() > 600:  # 10 minutes
-                    return jsonify({'success': False, 'error': 'OTP expired. Please request a new one.'}), 400
-            
-            if db_otp == otp_input:
-                cur.execute("UPDATE vlh_user SET email_verified = TRUE, otp_code = NULL WHERE mobile_number = %s", (mobile,))
-                conn.commit()
-                
-                # Return user data on successful verification for auto-login
-                user_data = {
-                    'id': user_id,
-                    'name': full_name,
-                    'email': email,
-                    'mobile': mobile_number,
-                    'address': address
-                }
-                return jsonify({'success': True, 'message': 'Mobile verified successfully!', 'user': user_data})
-            else:
-                return jsonify({'success': False, 'error': 'Invalid OTP'}), 400
-        else:
+        if not result:
             return jsonify({'success': False, 'error': 'Mobile number not found'}), 400
+        
+        # Return user data on successful verification for auto-login
+        user_data = {
+            'id': result[0],
+            'name': result[1],
+            'email': result[3],
+            'mobile': result[2],
+            'address': result[4]
+        }
+        return jsonify({'success': True, 'message': 'Mobile verified successfully!', 'user': user_data})
             
     except Exception as e:
         print(f"Verify Error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/login', methods=['POST'])
 def login_user():
@@ -355,8 +586,19 @@ def login_user():
         """, (username, username))
         
         user = cur.fetchone()
+        cur.close()
+        put_db_connection()  # not held while bcrypt runs
+        
+        valid, new_hash = get_hasher().verify_and_update(password, user[4]) if user else (False, None)
+        if new_hash:
+            # BCRYPT_ROUNDS changed since this password was set
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute("UPDATE vlh_user SET password_hash = %s WHERE id = %s", (new_hash, user[0]))
+            conn.commit()
+            cur.close()
         
-        if user and bcrypt.checkpw(password.encode('utf-8'), user[4].encode('utf-8')):
+        if valid:
             return jsonify({
                 'success': True,
                 'user': {
@@ -371,24 +613,87 @@ def login_user():
             })
         else:
             return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
+    except PasswordHasherBusy:
+        return jsonify({'success': False, 'error': 'Too many login attempts right now. Please try again.'}), 503
     except Exception as e:
         print(f"Login Error: {e}")
         return jsonify({'success': False, 'error': 'Login error'}), 500
-    finally:
-        if conn: conn.close()
+
+# --- Menu cache ---
+# /api/menu-items is served from memory. The menu version (bumped by the admin
+# portal on every menu edit) is checked at most every MENU_CACHE_TTL seconds,
+# and the menu is re-read after MENU_CACHE_MAX_AGE seconds regardless, in case
+# it was edited outside the admin portal.
+MENU_CACHE_TTL = float(os.environ.get('MENU_CACHE_TTL', 30))
+MENU_CACHE_MAX_AGE = float(os.environ.get('MENU_CACHE_MAX_AGE', 600))
+
+MENU_ITEMS_SQL = "SELECT id, item_name, description, CAST(price AS FLOAT) as price, category, veg_nonveg, meal_type, availability_time, image_url FROM menu_items ORDER BY category, item_name"
+
+_menu_snapshot = None
+_menu_snapshot_lock = threading.Lock()
+
+
+def build_menu_snapshot(cur, version, previous=None):
+    """Encode the menu once, as JSON bytes plus a gzip copy, with its validators"""
+    cur.execute(MENU_ITEMS_SQL)
+    column_names = [desc[0] for desc in cur.description]
+    menu_list = [dict(zip(column_names, item)) for item in cur.fetchall()]
+    body = json.dumps({'menu_items': menu_list}, separators=(',', ':'), default=str).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    if previous is not None and previous['etag'] == etag:
+        last_modified = previous['last_modified']
+    else:
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+    now = time.monotonic()
+    return {
+        'version': version, 'etag': etag, 'last_modified': last_modified,
+        'body': body, 'gzip_body': gzip.compress(body), 'built_at': now, 'checked_at': now,
+    }
+
+
+def get_menu_snapshot():
+    """Return the cached menu snapshot, refreshing it if the menu version moved"""
+    global _menu_snapshot
+    snapshot = _menu_snapshot
+    if snapshot is not None and time.monotonic() - snapshot['checked_at'] < MENU_CACHE_TTL:
+        return snapshot
+    with _menu_snapshot_lock:
+        snapshot = _menu_snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - snapshot['checked_at'] < MENU_CACHE_TTL:
+            return snapshot
+        cur = get_db_connection().cursor()
+        try:
+            cur.execute(MENU_VERSION_SQL, (MENU_VERSION_KEY,))
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if snapshot is not None and snapshot['version'] == version and now - snapshot['built_at'] < MENU_CACHE_MAX_AGE:
+                snapshot = dict(snapshot, checked_at=now)
+            else:
+                snapshot = build_menu_snapshot(cur, version, previous=snapshot)
+        finally:
+            cur.close()
+        _menu_snapshot = snapshot
+        return snapshot
+
 
 @app.route('/api/menu-items', methods=['GET'])
 def get_menu():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, item_name, description, CAST(price AS FLOAT) as price, category, veg_nonveg, meal_type, availability_time, image_url FROM menu_items ORDER BY category, item_name")
-        menu_items = cur.fetchall()
-        column_names = [desc[0] for desc in cur.description]
-        menu_list = [dict(zip(column_names, item)) for item in menu_items]
-        cur.close()
-        conn.close()
-        return jsonify({'menu_items': menu_list}) # Consistent with other endpoints
+        snapshot = get_menu_snapshot()
+        use_gzip = 'gzip' in request.accept_encodings
+        response = app.response_class(snapshot['gzip_body'] if use_gzip else snapshot['body'],
+                                      mimetype='application/json')
+        if use_gzip:
+            response.content_encoding = 'gzip'
+        # Each encoding is a different representation, so it gets its own ETag
+        response.set_etag(snapshot['etag'] + ('-gzip' if use_gzip else ''))
+        response.last_modified = snapshot['last_modified']
+        response.vary.add('Accept-Encoding')
+        # Browsers and CDNs may keep it but must revalidate; a 304 skips the body
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         print(f"Error in get_menu: {str(e)}")
         return jsonify({'error': 'Failed to load menu'}), 500
@@ -419,10 +724,8 @@ def place_order():
         conn = get_db_connection()
         cur = conn.cursor()
         
-        validated_items = []
-        subtotal = 0
-        items_html_list = ""
-        
+        # Merge repeated items so each menu item is one line, in cart order
+        quantities = {}
         for cart_item in cart_items:
             item_id = cart_item.get('id')
             quantity = int(cart_item.get('quantity', 0))
@@ -431,12 +734,24 @@ def place_order():
                 return jsonify({'error': 'Item ID is missing'}), 400
             if quantity <= 0:
                 return jsonify({'error': f'Invalid quantity for item ID {item_id}'}), 400
-            
-            cur.execute("SELECT id, item_name, price FROM menu_items WHERE id = %s", (item_id,))
-            menu_item = cur.fetchone()
-            
-            if not menu_item:
+            try:
+                menu_item_id = int(item_id)
+            except (TypeError, ValueError):
                 return jsonify({'error': f'Menu item with ID {item_id} not found'}), 400
+            quantities[menu_item_id] = quantities.get(menu_item_id, 0) + quantity
+        
+        # Prices come from the database, not the menu cache, so they are always current
+        cur.execute("SELECT id, item_name, price FROM menu_items WHERE id = ANY(%s)", (list(quantities),))
+        menu_items = {row[0]: row for row in cur.fetchall()}
+        
+        validated_items = []
+        subtotal = 0
+        items_html_list = ""
+        
+        for menu_item_id, quantity in quantities.items():
+            menu_item = menu_items.get(menu_item_id)
+            if not menu_item:
+                return jsonify({'error': f'Menu item with ID {menu_item_id} not found'}), 400
             
             actual_price = float(menu_item[2])
             item_total = actual_price * quantity
@@ -467,14 +782,44 @@ def place_order():
         ))
         
         new_order_db_id = cur.fetchone()[0]
+        # Normalized line items for the admin analytics, in the same transaction
+        cur.execute(INSERT_LINES_FOR_ORDERS_SQL, ([new_order_db_id],))
+
+        # Live order board (OrderMaster api/order-events/); delivered on commit
+        order_event = {
+            'type': 'order_created',
+            'id': new_order_db_id,
+            'order_id': order_id,
+            'customer_name': name,
+            'order_placed_by': 'customer',
+            'status': 'confirmed',
+            'order_status': 'open',
+            'updated_at': now_ist.replace(tzinfo=None).isoformat(),
+            'order': {
+                'id': new_order_db_id,
+                'order_id': order_id,
+                'customer_name': name,
+                'customer_mobile': mobile,
+                'items': validated_items,
+                'total_price': float(total_price),
+                'order_status': 'open',
+                'status': 'confirmed',
+                'order_placed_by': 'customer',
+                'created_at': now_ist.replace(tzinfo=None).isoformat(),
+                'ready_time': None,
+                'pickup_time': None,
+            },
+        }
+        order_event_payload = json.dumps(order_event)
+        if len(order_event_payload.encode('utf-8')) > 7900:  # NOTIFY payloads are capped at 8000 bytes
+            order_event_payload = json.dumps(dict(order_event, order=None))
+        cur.execute("SELECT pg_notify('order_events', %s)", (order_event_payload,))
         conn.commit()
 
         def send_firebase_notification_async(order_db_id, order_id, name, mobile, total_price, validated_items):
-            """Sends Firebase notification in a background thread to prevent blocking the UI."""
-            if not firebase_admin._apps:
-                return
-
+            """Sends the Firebase notification on a side-effect worker to prevent blocking the UI."""
             try:
+                messaging = messaging_module()
                 message_data = {
                     'id': str(order_db_id),
                     'order_id': order_id,
@@ -493,27 +838,18 @@ def place_order():
                     data=message_data,
                     topic='new_orders'
                 )
-                response = messaging.send(message)
+                response = firebase.send(message)
                 print(f'✅ Successfully sent notification for order {order_id}:', response)
             except Exception as e:
                 print(f"❌ Error sending Firebase notification for order {order_id}: {e}")
 
-        if firebase_admin._apps:
-            thread = threading.Thread(
-                target=send_firebase_notification_async,
-                args=(new_order_db_id, order_id, name, mobile, total_price, validated_items)
+        if firebase.configured:
+            side_effects.submit(
+                send_firebase_notification_async,
+                new_order_db_id, order_id, name, mobile, total_price, validated_items
             )
-            thread.daemon = True
-            thread.start()
 
         if email:
-            def send_email_async(to_email, subject, body):
-                """Send email in a background thread to prevent blocking the response."""
-                try:
-                    send_email(to_email, subject, body)
-                except Exception as e:
-                    print(f"Error sending email: {e}")
-
             email_subject = f"Order Confirmation - #{order_id}"
             email_body = f"""
             <html>
@@ -538,9 +874,7 @@ def place_order():
             </body>
             </html>
             """
-            thread = threading.Thread(target=send_email_async, args=(email, email_subject, email_body))
-            thread.daemon = True
-            thread.start()
+            side_effects.submit(send_email, email, email_subject, email_body)
 
         return jsonify({
             'success': True, 
@@ -561,8 +895,6 @@ def place_order():
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
 
 @app.route('/api/customer-orders', methods=['GET'])
 def get_customer_orders():
@@ -618,9 +950,16 @@ def get_customer_orders():
     except Exception as e:
         print(f"Error fetching customer orders: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+
+@app.route('/api/side-effect-stats', methods=['GET'])
+def side_effect_stats():
+    """Queue depth and outcome counters of the notification/email workers (requires STATS_TOKEN)"""
+    if not STATS_TOKEN:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').encode('utf-8')
+    if not hmac.compare_digest(supplied, STATS_TOKEN.encode('utf-8')):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    return jsonify(side_effects.stats())
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,77 @@
+# vanitalunchhome/benchmarks/db_pool_bench.py
+"""
+Per-request latency of a small Flask route that runs one query, with a fresh
+psycopg2.connect() per request (the old get_db_connection) versus the pooled
+connection checked out through flask.g.
+
+    DATABASE_URL=postgresql://localhost/vanita python benchmarks/db_pool_bench.py --requests 500
+
+Point DATABASE_URL at a local Postgres; the route only runs SELECT 1.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, connect_db, get_db_connection  # noqa: E402
+
+
+@app.route('/_bench/connect-per-request')
+def _bench_connect_per_request():
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    return 'ok'
+
+
+@app.route('/_bench/pooled')
+def _bench_pooled():
+    cur = get_db_connection().cursor()
+    cur.execute('SELECT 1')
+    cur.fetchone()
+    cur.close()
+    return 'ok'
+
+
+def run(client, path, count):
+    client.get(path)  # warm-up (opens the pool's first connection)
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return timings
+
+
+def summarize(label, timings):
+    ordered = sorted(timings)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{label:<24} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    before = run(client, '/_bench/connect-per-request', args.requests)
+    after = run(client, '/_bench/pooled', args.requests)
+    print(f"{args.requests} requests each")
+    summarize('connect per request', before)
+    summarize('pooled (flask.g)', after)
+    print(f"speed-up (mean)          {statistics.mean(before) / statistics.mean(after):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
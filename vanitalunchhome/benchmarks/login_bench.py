@@ -0,0 +1,114 @@
+# vanitalunchhome/benchmarks/login_bench.py
+"""
+Login throughput during a login storm, and what it does to a cheap request
+(the cached /api/menu-items) served at the same time. Compares bcrypt run
+inline on every request thread (the old behaviour: one hash per concurrent
+login) with the shared hasher's small pool.
+
+    DATABASE_URL=postgresql://localhost/vanita python benchmarks/login_bench.py --clients 16 --seconds 5
+
+Point DATABASE_URL at a local Postgres with the vlh_user table. The script
+adds a temporary customer and deletes it at the end.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, connect_db  # noqa: E402
+from shared.passwords import (  # noqa: E402
+    BCRYPT_ROUNDS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_WORKERS, PasswordHasher, set_hasher,
+)
+
+MOBILE = '9000000999'
+PASSWORD = 'bench-password'
+
+
+def create_user(hasher):
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO vlh_user (full_name, mobile_number, email, password_hash, email_verified)
+            VALUES ('Bench', %s, 'bench@example.com', %s, TRUE)
+        """, (MOBILE, hasher.hash(PASSWORD)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def delete_user():
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM vlh_user WHERE mobile_number = %s", (MOBILE,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def storm(hasher, clients, seconds):
+    set_hasher(hasher)
+    stop = threading.Event()
+    outcomes = {200: 0, 503: 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def log_in():
+        client = app.test_client()
+        while not stop.is_set():
+            status = client.post('/api/login', json={'username': MOBILE, 'password': PASSWORD}).status_code
+            if time.monotonic() > deadline:
+                break
+            with lock:
+                outcomes[status] = outcomes.get(status, 0) + 1
+            if status == 503:
+                time.sleep(0.5)  # the client backs off and retries
+
+    threads = [threading.Thread(target=log_in) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    probe = app.test_client()
+    probe.get('/api/menu-items')
+    timings = []
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        probe.get('/api/menu-items')
+        timings.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    ordered = sorted(timings)
+    return outcomes, statistics.median(ordered), ordered[int(len(ordered) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    modes = [
+        ('inline (one per thread)', PasswordHasher(BCRYPT_ROUNDS, workers=args.clients, max_pending=args.clients)),
+        (f'pool of {PASSWORD_HASH_WORKERS}', PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS,
+                                                          PASSWORD_HASH_MAX_PENDING)),
+    ]
+    create_user(modes[0][1])
+    try:
+        print(f"cost {BCRYPT_ROUNDS}, {args.clients} clients logging in for {args.seconds:g}s, {os.cpu_count()} CPUs")
+        print(f"{'hashing':<24} {'logins/s':>9} {'503s':>6} {'menu p50':>10} {'menu p95':>10}")
+        for label, hasher in modes:
+            outcomes, p50, p95 = storm(hasher, args.clients, args.seconds)
+            print(f"{label:<24} {outcomes[200] / args.seconds:9.1f} {outcomes[503]:6d} "
+                  f"{p50:7.2f} ms {p95:7.2f} ms")
+    finally:
+        delete_user()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# vanitalunchhome/benchmarks/place_order_bench.py
+"""
+Latency of POST /api/order as the cart grows, and of its pricing step alone:
+the batched WHERE id = ANY(%s) lookup it uses now versus the old loop of one
+SELECT per cart item. The database round trips in the last column are what
+grows with the cart on a remote database, where each one costs a network hop.
+
+    DATABASE_URL=postgresql://localhost/vanita python benchmarks/place_order_bench.py --requests 50
+
+Point DATABASE_URL at a local Postgres with the OrderMaster schema. The script
+adds temporary menu items and deletes them, and the orders it placed, at the end.
+Leave FIREBASE_KEY unset so no notifications are sent.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from flask import request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, connect_db, get_db_connection  # noqa: E402
+
+CART_SIZES = (1, 5, 10, 25, 50)
+
+
+@app.route('/_bench/batched-pricing', methods=['POST'])
+def _bench_batched_pricing():
+    cur = get_db_connection().cursor()
+    ids = [cart_item['id'] for cart_item in request.get_json()['cart_items']]
+    cur.execute("SELECT id, item_name, price FROM menu_items WHERE id = ANY(%s)", (ids,))
+    cur.fetchall()
+    cur.close()
+    return 'ok'
+
+
+@app.route('/_bench/per-item-pricing', methods=['POST'])
+def _bench_per_item_pricing():
+    cur = get_db_connection().cursor()
+    for cart_item in request.get_json()['cart_items']:
+        cur.execute("SELECT id, item_name, price FROM menu_items WHERE id = %s", (cart_item['id'],))
+        cur.fetchone()
+    cur.close()
+    return 'ok'
+
+
+def create_menu_items(count):
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO menu_items (item_name, price, category, veg_nonveg, meal_type, created_at)
+            SELECT 'Bench item ' || n, 10 + n, 'Bench', 'Veg', 'Lunch', NOW() FROM generate_series(1, %s) n
+            RETURNING id
+        """, (count,))
+        ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return ids
+    finally:
+        conn.close()
+
+
+def clean_up(menu_item_ids, order_ids):
+    conn = connect_db()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM order_lines WHERE order_id IN (SELECT id FROM orders WHERE order_id = ANY(%s))",
+                    (order_ids,))
+        cur.execute("DELETE FROM orders WHERE order_id = ANY(%s)", (order_ids,))
+        cur.execute("DELETE FROM menu_items WHERE id = ANY(%s)", (menu_item_ids,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run(client, path, payload, count, order_ids):
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = client.post(path, json=payload)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        if path == '/api/order':
+            order_ids.append(response.get_json()['order_id'])
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    menu_item_ids = create_menu_items(max(CART_SIZES))
+    order_ids = []
+    client = app.test_client()
+    try:
+        print(f"{args.requests} requests per cart size")
+        print(f"{'cart size':>9}   {'place_order':>12}   {'batched pricing':>15}   {'per-item pricing (old)':>22}"
+              f"   {'pricing round trips':>19}")
+        for size in CART_SIZES:
+            payload = {
+                'name': 'Bench', 'mobile': '9000000000', 'address': 'Bench',
+                'cart_items': [{'id': item_id, 'quantity': 1} for item_id in menu_item_ids[:size]],
+            }
+            run(client, '/api/order', payload, 1, order_ids)  # warm-up
+            place_order = run(client, '/api/order', payload, args.requests, order_ids)
+            batched = run(client, '/_bench/batched-pricing', payload, args.requests, order_ids)
+            per_item = run(client, '/_bench/per-item-pricing', payload, args.requests, order_ids)
+            print(f"{size:>9}   {place_order:9.3f} ms   {batched:12.3f} ms   {per_item:19.3f} ms"
+                  f"   {'1 vs ' + str(size):>19}")
+    finally:
+        clean_up(menu_item_ids, order_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# vanitalunchhome/otp_store.py
+"""
+Pending OTP codes and per-mobile rate limits for /api/register,
+/api/resend-otp and /api/verify-otp.
+
+Codes, attempt counters and token buckets live in a small key-value backend
+instead of the vlh_user table; the database is written only when a code is
+verified. The backend is Redis-compatible (get / set with ex / delete / incr /
+expire), so it is either
+
+- MemoryBackend, an in-process TTL store, when OTP_STORE_URL is unset. It is
+  only correct while the app runs as a single process, so app.py refuses to
+  start without OTP_STORE_URL on a multi-instance deploy; it also serves as
+  the local fake for Redis.
+- a redis.Redis client for OTP_STORE_URL=redis://..., shared by every worker
+  (the redis package is only imported in that case).
+
+Token buckets are read-modify-write: exact in-process, best effort across
+Redis clients. The attempt counter uses INCR, so it is exact either way.
+"""
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+OTP_STORE_URL = os.environ.get('OTP_STORE_URL') or None
+OTP_TTL_SECONDS = 600  # codes are valid for 10 minutes
+OTP_MAX_ATTEMPTS = 5  # wrong guesses before a code is discarded
+
+# action -> (bucket capacity, seconds to earn one token back)
+RATE_LIMITS = {
+    'send': (3, 120),  # register / resend: WhatsApp or SMS messages
+    'verify': (10, 30),
+}
+
+OTP_OK = 'ok'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+OTP_LOCKED = 'locked'
+
+
+class MemoryBackend:
+    """The subset of the Redis API used by OTPStore, kept in a dict with expiry times."""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+        self._writes = 0
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+            del self._data[key]
+            return None
+        return entry
+
+    def _purge(self):
+        now = self._clock()
+        for key in [k for k, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._purge()
+            self._data[key] = (str(value), self._clock() + ex if ex else None)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key)
+            value = int(entry[0]) + 1 if entry else 1
+            self._data[key] = (str(value), entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], self._clock() + seconds)
+            return True
+
+
+class OTPStore:
+    def __init__(self, backend, ttl=OTP_TTL_SECONDS, max_attempts=OTP_MAX_ATTEMPTS, rate_limits=RATE_LIMITS,
+                 clock=time.time):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.rate_limits = rate_limits
+        self._clock = clock
+        self._bucket_lock = threading.Lock()
+
+    def allow(self, action, mobile):
+        """
+        Takes a token from the mobile's bucket for `action`. Returns
+        (allowed, retry_after_seconds).
+        """
+        capacity, refill_seconds = self.rate_limits[action]
+        key = f'otp:bucket:{action}:{mobile}'
+        with self._bucket_lock:
+            now = self._clock()
+            state = self.backend.get(key)
+            tokens, updated_at = json.loads(state) if state else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated_at) / refill_seconds)
+            if tokens < 1:
+                return False, int((1 - tokens) * refill_seconds) + 1
+            tokens -= 1
+            self.backend.set(key, json.dumps([tokens, now]), ex=int((capacity - tokens) * refill_seconds) + 1)
+        return True, 0
+
+    def issue(self, mobile):
+        """Creates a new code for the mobile, replacing any pending one, and returns it."""
+        code = str(100000 + secrets.randbelow(900000))
+        self.backend.set(f'otp:code:{mobile}', code, ex=self.ttl)
+        self.backend.delete(f'otp:attempts:{mobile}')
+        return code
+
+    def has_pending(self, mobile):
+        return self.backend.get(f'otp:code:{mobile}') is not None
+
+    def verify(self, mobile, code):
+        """Returns OTP_OK (and consumes the code), OTP_INVALID, OTP_EXPIRED or OTP_LOCKED."""
+        code_key, attempts_key = f'otp:code:{mobile}', f'otp:attempts:{mobile}'
+        expected = self.backend.get(code_key)
+        if expected is None:
+            return OTP_EXPIRED
+        attempts = self.backend.incr(attempts_key)
+        if attempts == 1:
+            self.backend.expire(attempts_key, self.ttl)
+        if hmac.compare_digest(str(expected).encode('utf-8'), str(code).encode('utf-8')) and attempts <= self.max_attempts:
+            self.backend.delete(code_key, attempts_key)
+            return OTP_OK
+        if attempts >= self.max_attempts:
+            self.backend.delete(code_key, attempts_key)
+            return OTP_LOCKED
+        return OTP_INVALID
+
+
+def process_local_problem(url=OTP_STORE_URL, environ=os.environ):
+    """
+    Why the store cannot run in process memory here, or None. It cannot when
+    the app looks like it runs as several processes: a code issued by one
+    would come back OTP_EXPIRED from another.
+    """
+    if url:
+        return None
+    if environ.get('VERCEL'):
+        reason = 'on Vercel, where requests are spread over separate instances'
+    else:
+        try:
+            workers = int(environ.get('WEB_CONCURRENCY') or 1)
+        except ValueError:
+            workers = 1
+        if workers <= 1:
+            return None
+        reason = f'with WEB_CONCURRENCY={workers} worker processes'
+    return (f"OTP_STORE_URL is not set, so OTP codes and rate limits are kept per process, but the app is running "
+            f"{reason}. Codes issued by one process would not verify in another; set OTP_STORE_URL to a redis:// URL.")
+
+
+def make_backend(url=OTP_STORE_URL):
+    if not url:
+        return MemoryBackend()
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = OTPStore(make_backend())
+    return _store
+
+
+def set_otp_store(store):
+    """Replaces the shared store (e.g. one over a fresh MemoryBackend) and returns the previous one."""
+    global _store
+    with _store_lock:
+        previous, _store = _store, store
+    return previous
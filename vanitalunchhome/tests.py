@@ -0,0 +1,430 @@
+# vanitalunchhome/tests.py
+"""
+Tests for the customer Flask app. Run them from this directory:
+
+    python -m unittest tests
+
+Most tests need no database. Those that do run only when TEST_DATABASE_URL
+points at a scratch Postgres; they never read DATABASE_URL, so they cannot
+touch a real deployment by accident.
+"""
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import psycopg2
+import psycopg2.extensions
+
+import app as app_module
+from app import SideEffectExecutor, app, close_smtp_session, get_db_connection, put_db_connection, send_email
+from otp_store import (
+    OTP_EXPIRED, OTP_INVALID, OTP_LOCKED, OTP_OK, MemoryBackend, OTPStore, process_local_problem, set_otp_store,
+)
+from shared.passwords import PasswordHasher, set_hasher
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+def fake_connection(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+    conn = mock.Mock(closed=False)
+    conn.info.transaction_status = transaction_status
+    return conn
+
+
+class DbPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.pool.getconn.side_effect = lambda: fake_connection()
+        patches = [
+            mock.patch.object(app_module, 'get_db_pool', return_value=self.pool),
+            mock.patch.object(app_module, '_db_pool_slots', threading.BoundedSemaphore(1)),
+            mock.patch.object(app_module, 'DB_POOL_TIMEOUT', 0.05),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_a_request_uses_one_connection_and_returns_it(self):
+        with app.test_request_context():
+            conn = get_db_connection()
+            self.assertIs(get_db_connection(), conn)
+        self.assertEqual(self.pool.getconn.call_count, 1)
+        conn.rollback.assert_called_once_with()  # Anything left uncommitted is discarded
+        self.pool.putconn.assert_called_once_with(conn, close=False)
+
+    def test_checkout_times_out_while_every_connection_is_in_use(self):
+        with app.test_request_context():
+            get_db_connection()
+            with self.assertRaisesRegex(Exception, 'No database connection free'):
+                app_module._checkout_db_connection()
+        app_module._release_db_connection(app_module._checkout_db_connection())
+
+    def test_put_db_connection_frees_the_slot_early(self):
+        with app.test_request_context():
+            get_db_connection()
+            put_db_connection()
+            other = app_module._checkout_db_connection()  # Would time out if the slot were still held
+            app_module._release_db_connection(other)
+            self.assertIsNot(get_db_connection(), other)
+        self.assertEqual(self.pool.putconn.call_count, 3)
+
+    def test_broken_connections_are_closed_instead_of_reused(self):
+        conn = fake_connection(psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN)
+        self.pool.getconn.side_effect = [conn]
+        with app.test_request_context():
+            get_db_connection()
+        conn.rollback.assert_not_called()
+        self.pool.putconn.assert_called_once_with(conn, close=True)
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL is not set')
+class DbPoolDatabaseTests(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.dict(os.environ, {'DATABASE_URL': TEST_DATABASE_URL}),
+            mock.patch.object(app_module, '_db_pool', None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(lambda: app_module._db_pool and app_module._db_pool.closeall())
+
+    def test_a_failed_transaction_is_rolled_back_before_the_connection_is_reused(self):
+        with app.test_request_context():
+            first = get_db_connection()
+            with self.assertRaises(psycopg2.DataError):
+                first.cursor().execute("SELECT 1 / 0")
+        with app.test_request_context():
+            conn = get_db_connection()
+            self.assertIs(conn, first)
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            self.assertEqual(cur.fetchone(), (1,))
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stand-in ready')
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.reply('250 stand-in')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            elif command == b'DATA':
+                self.reply('354 end with .')
+                body = []
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    body.append(data_line)
+                with server.lock:
+                    rejected = server.reject_messages > 0
+                    if rejected:
+                        server.reject_messages -= 1
+                    else:
+                        server.messages.append(b''.join(body))
+                self.reply('554 rejected' if rejected else '250 queued')
+                if server.hang_up_after_message:
+                    return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply('250 ok')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Just enough of an SMTP server for smtplib, on a free local port. It can
+    reject the next few messages or hang up after each one, like a server
+    closing an idle session.
+    """
+    daemon_threads = True
+
+    def __init__(self, reject_messages=0, hang_up_after_message=False):
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.reject_messages = reject_messages
+        self.hang_up_after_message = hang_up_after_message
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SideEffectExecutorTests(unittest.TestCase):
+    def test_jobs_run_on_the_fixed_worker_threads(self):
+        executor = SideEffectExecutor(workers=2, queue_size=20)
+        threads = []
+        for _ in range(10):
+            self.assertTrue(executor.submit(lambda: threads.append(threading.current_thread().name)))
+        executor.shutdown(timeout=5)
+        self.assertEqual(len(threads), 10)
+        self.assertLessEqual(set(threads), {'side-effects-0', 'side-effects-1'})
+        self.assertEqual(executor.stats()['completed'], 10)
+
+    def test_a_full_queue_drops_jobs_instead_of_blocking(self):
+        executor = SideEffectExecutor(workers=1, queue_size=1)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_job():
+            started.set()
+            release.wait(5)
+
+        self.assertTrue(executor.submit(slow_job))
+        self.assertTrue(started.wait(5))
+        self.assertTrue(executor.submit(slow_job))  # Waits in the queue
+        self.assertFalse(executor.submit(slow_job))
+        release.set()
+        executor.shutdown(timeout=5)
+        stats = executor.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['rejected']), (2, 2, 1))
+        self.assertFalse(executor.submit(slow_job))  # Closed
+
+    def test_a_failing_job_is_counted_and_the_worker_carries_on(self):
+        executor = SideEffectExecutor(workers=1, queue_size=10)
+
+        def broken_job():
+            raise RuntimeError('boom')
+
+        executor.submit(broken_job)
+        executor.submit(lambda: None)
+        executor.shutdown(timeout=5)
+        stats = executor.stats()
+        self.assertEqual((stats['failed'], stats['completed']), (1, 1))
+
+    def test_stats_endpoint_needs_the_stats_token(self):
+        client = app.test_client()
+        with mock.patch.object(app_module, 'STATS_TOKEN', None):
+            self.assertEqual(client.get('/api/side-effect-stats').status_code, 404)
+        with mock.patch.object(app_module, 'STATS_TOKEN', 's3cret'):
+            self.assertEqual(client.get('/api/side-effect-stats').status_code, 401)
+            wrong = client.get('/api/side-effect-stats', headers={'Authorization': 'Bearer nope'})
+            self.assertEqual(wrong.status_code, 401)
+            allowed = client.get('/api/side-effect-stats', headers={'Authorization': 'Bearer s3cret'})
+            self.assertIn('queue_depth', allowed.get_json())
+
+
+class SendEmailTests(unittest.TestCase):
+    def start_smtp(self, **options):
+        server = SMTPStandIn(**options)
+        self.addCleanup(server.stop)
+        patches = [
+            mock.patch.object(app_module, 'SMTP_SERVER', '127.0.0.1'),
+            mock.patch.object(app_module, 'SMTP_PORT', server.server_address[1]),
+            mock.patch.object(app_module, 'SMTP_STARTTLS', False),
+            mock.patch.object(app_module, 'SMTP_EMAIL', 'kitchen@example.com'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(close_smtp_session)
+        return server
+
+    def test_a_worker_sends_every_email_over_one_session(self):
+        server = self.start_smtp()
+        executor = SideEffectExecutor(workers=1, queue_size=10)
+        for i in range(3):
+            executor.submit(send_email, 'asha@example.com', f'Order {i}', '<p>Ready</p>')
+        executor.shutdown(timeout=5)
+        self.assertEqual(len(server.messages), 3)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(executor.stats()['completed'], 3)
+
+    def test_a_rejected_email_returns_false_and_the_next_one_reconnects(self):
+        server = self.start_smtp(reject_messages=1)
+        self.assertFalse(send_email('asha@example.com', 'Order 1', '<p>Ready</p>'))
+        self.assertTrue(send_email('asha@example.com', 'Order 2', '<p>Ready</p>'))
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(server.connections, 2)
+
+    def test_a_session_closed_by_the_server_is_reopened_once(self):
+        server = self.start_smtp(hang_up_after_message=True)
+        self.assertTrue(send_email('asha@example.com', 'Order 1', '<p>Ready</p>'))
+        self.assertTrue(send_email('asha@example.com', 'Order 2', '<p>Ready</p>'))
+        self.assertEqual(len(server.messages), 2)
+        self.assertEqual(server.connections, 2)
+
+    def test_an_unreachable_server_fails_the_email_without_raising(self):
+        server = self.start_smtp()
+        server.stop()
+        self.assertFalse(send_email('asha@example.com', 'Order 1', '<p>Ready</p>'))
+
+
+def wrong_code(code):
+    return '000000' if code != '000000' else '111111'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class OTPStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = OTPStore(MemoryBackend(clock=self.clock), ttl=600, max_attempts=3,
+                              rate_limits={'send': (3, 120)}, clock=self.clock)
+
+    def test_a_code_expires_after_the_ttl(self):
+        code = self.store.issue('9876543210')
+        self.clock.advance(599)
+        self.assertTrue(self.store.has_pending('9876543210'))
+        self.clock.advance(1)
+        self.assertFalse(self.store.has_pending('9876543210'))
+        self.assertEqual(self.store.verify('9876543210', code), OTP_EXPIRED)
+
+    def test_a_code_is_consumed_by_a_successful_verify(self):
+        code = self.store.issue('9876543210')
+        self.assertEqual(self.store.verify('9876543210', wrong_code(code)), OTP_INVALID)
+        self.assertEqual(self.store.verify('9876543210', code), OTP_OK)
+        self.assertEqual(self.store.verify('9876543210', code), OTP_EXPIRED)
+
+    def test_too_many_wrong_guesses_discard_the_code(self):
+        code = self.store.issue('9876543210')
+        outcomes = [self.store.verify('9876543210', wrong_code(code)) for _ in range(3)]
+        self.assertEqual(outcomes, [OTP_INVALID, OTP_INVALID, OTP_LOCKED])
+        self.assertEqual(self.store.verify('9876543210', code), OTP_EXPIRED)
+
+        code = self.store.issue('9876543210')  # A new code starts with a clean attempt count
+        self.assertEqual(self.store.verify('9876543210', wrong_code(code)), OTP_INVALID)
+        self.assertEqual(self.store.verify('9876543210', code), OTP_OK)
+
+    def test_the_bucket_refills_one_token_per_interval(self):
+        self.assertEqual([self.store.allow('send', '9876543210') for _ in range(3)], [(True, 0)] * 3)
+        self.assertEqual(self.store.allow('send', '9876543210'), (False, 121))
+        self.assertEqual(self.store.allow('send', '9123456780'), (True, 0))  # Buckets are per mobile
+
+        self.clock.advance(60)
+        self.assertEqual(self.store.allow('send', '9876543210'), (False, 61))
+        self.clock.advance(60)
+        self.assertEqual(self.store.allow('send', '9876543210'), (True, 0))
+        self.assertFalse(self.store.allow('send', '9876543210')[0])
+
+        self.clock.advance(3600)  # Never more than the capacity
+        self.assertEqual([self.store.allow('send', '9876543210')[0] for _ in range(4)], [True, True, True, False])
+
+    def test_process_local_problem(self):
+        self.assertIsNone(process_local_problem(None, {}))
+        self.assertIsNone(process_local_problem(None, {'WEB_CONCURRENCY': '1'}))
+        self.assertIsNone(process_local_problem('redis://cache:6379/0', {'WEB_CONCURRENCY': '4'}))
+        self.assertIn('WEB_CONCURRENCY=4', process_local_problem(None, {'WEB_CONCURRENCY': '4'}))
+        self.assertIn('Vercel', process_local_problem(None, {'VERCEL': '1'}))
+
+    def test_app_refuses_to_start_with_a_process_local_store_on_several_instances(self):
+        env = {key: value for key, value in os.environ.items() if key != 'OTP_STORE_URL'}
+        result = subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env={**env, 'WEB_CONCURRENCY': '2'}, capture_output=True, text=True, timeout=60)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('OTP_STORE_URL is not set', result.stderr)
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+        self.result = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.statements.append(sql)
+        if sql.startswith('INSERT INTO vlh_user'):
+            self.result = (42,)
+        elif sql.startswith('UPDATE vlh_user'):
+            self.result = (42, 'Asha', params[0], 'asha@example.com', 'Pune')
+        else:
+            self.result = None  # No existing user
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class RegisterAndVerifyTests(unittest.TestCase):
+    def setUp(self):
+        self.statements = []
+        conn = mock.Mock()
+        conn.cursor.side_effect = lambda: FakeCursor(self.statements)
+        self.sent_codes = []
+        patches = [
+            mock.patch.object(app_module, 'get_db_connection', return_value=conn),
+            mock.patch.object(app_module, 'send_otp_whatsapp',
+                              side_effect=lambda mobile, otp: self.sent_codes.append(otp) or True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.otp_backend = MemoryBackend()
+        previous_store = set_otp_store(OTPStore(self.otp_backend))
+        self.addCleanup(set_otp_store, previous_store)
+        previous_hasher = set_hasher(PasswordHasher(rounds=4))
+        self.addCleanup(set_hasher, previous_hasher)
+        self.client = app.test_client()
+
+    def post(self, path, **payload):
+        return self.client.post(path, json={'mobile': '9876543210', **payload})
+
+    def test_register_then_verify(self):
+        response = self.post('/api/register', full_name='Asha', email='asha@example.com', password='secret')
+        self.assertEqual(response.get_json()['userId'], 42)
+        self.assertTrue(self.statements[-1].startswith('INSERT INTO vlh_user'))
+        code = self.sent_codes[-1]
+
+        statements_before = len(self.statements)
+        wrong = self.post('/api/verify-otp', otp=wrong_code(code))
+        self.assertEqual((wrong.status_code, wrong.get_json()['error']), (400, 'Invalid OTP'))
+        self.assertEqual(len(self.statements), statements_before)  # Settled without the database
+
+        verified = self.post('/api/verify-otp', otp=code)
+        self.assertEqual(verified.get_json()['user']['mobile'], '9876543210')
+        self.assertTrue(self.statements[-1].startswith('UPDATE vlh_user SET email_verified = TRUE'))
+
+        again = self.post('/api/verify-otp', otp=code)
+        self.assertIn('expired', again.get_json()['error'])
+
+    def test_incomplete_registrations_are_rejected_before_taking_a_send_token(self):
+        for payload in ({'mobile': None, 'full_name': 'Asha', 'password': 'secret'},
+                        {'full_name': 'Asha'}, {'full_name': 'Asha', 'password': 7}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.post('/api/register', **payload).status_code, 400)
+        self.assertEqual(self.client.post('/api/register', data='not json').status_code, 400)
+        self.assertEqual(self.otp_backend._data, {})
+        self.assertEqual(self.statements, [])
+
+    def test_a_duplicate_mobile_does_not_take_a_send_token(self):
+        with mock.patch.object(FakeCursor, 'fetchone', return_value=(7,)):
+            response = self.post('/api/register', full_name='Asha', password='secret')
+        self.assertEqual(response.get_json()['error'], 'Mobile number already registered')
+        self.assertEqual(self.otp_backend._data, {})
+
+    def test_resending_is_rate_limited_per_mobile(self):
+        self.post('/api/register', full_name='Asha', password='secret')
+        self.assertEqual([self.post('/api/resend-otp').status_code for _ in range(2)], [200, 200])
+
+        limited = self.post('/api/resend-otp')
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited.headers['Retry-After'], str(limited.get_json()['retry_after']))
+        self.assertEqual(len(self.sent_codes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()